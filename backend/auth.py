@@ -1,31 +1,64 @@
 import hashlib
+import hmac
 import secrets
+import threading
+import time
+from collections import OrderedDict
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
 import os
-from typing import Optional
+from typing import Optional, Tuple
 
 # JWT settings
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-change-in-production")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
 
+# Verified-token cache: tokens that already passed jwt.decode, keyed by their SHA-256 digest
+# and kept until their own exp, so repeat requests skip the HMAC and claim parsing
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", "4096"))  # 0 = disabled
+_verified_tokens: "OrderedDict[bytes, tuple]" = OrderedDict()  # digest -> (exp, subject, jti)
+_revoked_jtis = {}  # jti -> exp, pruned once the token would have expired anyway
+_token_lock = threading.Lock()
+_token_stats = {"hits": 0, "misses": 0, "evictions": 0, "revoked_rejections": 0}
+
+# Password hashing: new hashes use memory-hard scrypt ("scrypt$n$r$p$salt$hash");
+# legacy "salt$sha256" hashes still verify and are upgraded on the next successful login
+PASSWORD_SCRYPT_N = int(os.getenv("PASSWORD_SCRYPT_N", "16384"))
+PASSWORD_SCRYPT_R = int(os.getenv("PASSWORD_SCRYPT_R", "8"))
+PASSWORD_SCRYPT_P = int(os.getenv("PASSWORD_SCRYPT_P", "1"))
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    # scrypt needs about 128 * r * (n + p + 2) bytes; leave some headroom above that
+    maxmem = 128 * r * (n + p + 2) + 1024 * 1024
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=maxmem, dklen=32)
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash"""
     try:
+        if hashed_password.startswith("scrypt$"):
+            _, n, r, p, salt, stored_hash = hashed_password.split('$')
+            computed_hash = _scrypt(plain_password, bytes.fromhex(salt), int(n), int(r), int(p))
+            return hmac.compare_digest(computed_hash, bytes.fromhex(stored_hash))
         # Extract salt and hash from stored password
         salt, stored_hash = hashed_password.split('$', 1)
         # Hash the plain password with the same salt
         computed_hash = hashlib.sha256((plain_password + salt).encode()).hexdigest()
-        return computed_hash == stored_hash
+        return hmac.compare_digest(computed_hash, stored_hash)
     except Exception:
         return False
 
 def get_password_hash(password: str) -> str:
     """Hash a password with salt"""
-    salt = secrets.token_hex(16)
-    hashed = hashlib.sha256((password + salt).encode()).hexdigest()
-    return f"{salt}${hashed}"
+    salt = secrets.token_bytes(16)
+    hashed = _scrypt(password, salt, PASSWORD_SCRYPT_N, PASSWORD_SCRYPT_R, PASSWORD_SCRYPT_P)
+    return f"scrypt${PASSWORD_SCRYPT_N}${PASSWORD_SCRYPT_R}${PASSWORD_SCRYPT_P}${salt.hex()}${hashed.hex()}"
+
+def password_needs_rehash(hashed_password: str) -> bool:
+    """True for legacy hashes and scrypt hashes made with other parameters"""
+    return not hashed_password.startswith(
+        f"scrypt${PASSWORD_SCRYPT_N}${PASSWORD_SCRYPT_R}${PASSWORD_SCRYPT_P}$"
+    )
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -34,16 +67,80 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
         expire = datetime.utcnow() + expires_delta
     else:
         expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    to_encode.update({"exp": expire})
+    to_encode["exp"] = expire
+    to_encode.setdefault("jti", secrets.token_urlsafe(16))
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def verify_token(token: str) -> Optional[str]:
+def decode_token(token: str) -> Optional[dict]:
+    """Fully verify a token and return its claims"""
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        username = payload.get("sub")
-        if username is None:
-            return None
-        return str(username)
     except JWTError:
-        return None 
\ No newline at end of file
+        return None
+    if payload.get("sub") is None or payload.get("exp") is None:
+        return None
+    return payload
+
+def verify_token(token: str) -> Optional[str]:
+    session = verify_token_session(token)
+    return session[0] if session else None
+
+def verify_token_session(token: str) -> Optional[Tuple[str, Optional[str]]]:
+    """Verify a token and return (subject, jti); jti doubles as the session handle"""
+    digest = hashlib.sha256(token.encode()).digest()
+    now = time.time()
+    with _token_lock:
+        entry = _verified_tokens.get(digest)
+        if entry is not None and entry[0] > now:
+            _verified_tokens.move_to_end(digest)
+            if entry[2] in _revoked_jtis:
+                _token_stats["revoked_rejections"] += 1
+                return None
+            _token_stats["hits"] += 1
+            return entry[1], entry[2]
+        if entry is not None:
+            del _verified_tokens[digest]
+        _token_stats["misses"] += 1
+
+    payload = decode_token(token)
+    if payload is None:
+        return None
+    username = str(payload["sub"])
+    jti = payload.get("jti")
+    with _token_lock:
+        if jti in _revoked_jtis:
+            _token_stats["revoked_rejections"] += 1
+            return None
+        if TOKEN_CACHE_SIZE > 0:
+            _verified_tokens[digest] = (float(payload["exp"]), username, jti)
+            while len(_verified_tokens) > TOKEN_CACHE_SIZE:
+                _verified_tokens.popitem(last=False)
+                _token_stats["evictions"] += 1
+    return username, jti
+
+def revoke_token(token: str) -> bool:
+    """Deny-list a token's jti until it expires; returns False for invalid tokens"""
+    payload = decode_token(token)
+    if payload is None or payload.get("jti") is None:
+        return False
+    now = time.time()
+    with _token_lock:
+        for jti, exp in list(_revoked_jtis.items()):
+            if exp <= now:
+                del _revoked_jtis[jti]
+        _revoked_jtis[payload["jti"]] = float(payload["exp"])
+    return True
+
+def clear_token_cache() -> None:
+    with _token_lock:
+        _verified_tokens.clear()
+
+def token_cache_metrics() -> dict:
+    with _token_lock:
+        return {
+            "size": len(_verified_tokens),
+            "max_entries": TOKEN_CACHE_SIZE,
+            "revoked": len(_revoked_jtis),
+            **_token_stats
+        }
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+In-process load test of the API: virtual users register, log in, upload files to each other,
+list their received and sent files and download what they received, with a bounded number of
+requests in flight. Runs against a temporary SQLite database and upload directory, and reports
+throughput and p50/p95/p99 latency per endpoint plus the peak RSS.
+Run from backend/: python -m benchmarks.api_load [--users 16] [--concurrency 8] [--json out.json]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.results import build_report, latency_summary, write_report
+
+SEED = 1234  # File contents are the same from run to run
+PASSWORD = "benchmark-password"
+
+class LoadRecorder:
+    """Latencies and failures of one phase of the load test, by endpoint"""
+
+    def __init__(self, concurrency: int):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.samples = {}
+        self.errors = {}
+        self.bytes_received = {}
+
+    async def request(self, client: httpx.AsyncClient, endpoint: str, method: str, url: str, **kwargs):
+        async with self.semaphore:
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, url, **kwargs)
+            except Exception:
+                response = None
+            elapsed = time.perf_counter() - started
+        if response is None or response.status_code != 200:
+            self.errors[endpoint] = self.errors.get(endpoint, 0) + 1
+            return None
+        self.samples.setdefault(endpoint, []).append(elapsed)
+        self.bytes_received[endpoint] = self.bytes_received.get(endpoint, 0) + len(response.content)
+        return response
+
+async def run_phase(results: dict, name: str, concurrency: int, requests) -> list:
+    """Run a phase's requests (coroutine functions taking the recorder) and record its endpoints"""
+    recorder = LoadRecorder(concurrency)
+    started = time.perf_counter()
+    responses = await asyncio.gather(*(request(recorder) for request in requests))
+    elapsed = time.perf_counter() - started
+    for endpoint in set(recorder.samples) | set(recorder.errors):
+        samples = recorder.samples.get(endpoint, [])
+        results[endpoint] = {
+            "phase": name,
+            "requests_per_second": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+            "errors": recorder.errors.get(endpoint, 0),
+            "mb_received": round(recorder.bytes_received.get(endpoint, 0) / (1024 * 1024), 3),
+            **latency_summary(samples)
+        }
+    return responses
+
+async def drive(app, users: int, concurrency: int, files_per_user: int, size_kb: int) -> dict:
+    usernames = [f"bench{number}" for number in range(users)]
+    rng = random.Random(SEED)
+    payloads = [rng.randbytes(size_kb * 1024) for _ in range(files_per_user)]
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        def register(username):
+            return lambda recorder: recorder.request(client, "POST /api/register", "POST", "/api/register", data={
+                "username": username, "email": f"{username}@bench.local", "password": PASSWORD
+            })
+        await run_phase(results, "register", concurrency, [register(username) for username in usernames])
+
+        def login(username):
+            return lambda recorder: recorder.request(client, "POST /api/login", "POST", "/api/login", data={
+                "email": f"{username}@bench.local", "password": PASSWORD
+            })
+        responses = await run_phase(results, "login", concurrency, [login(username) for username in usernames])
+        headers = {
+            username: {"Authorization": f"Bearer {response.json()['access_token']}"}
+            for username, response in zip(usernames, responses) if response is not None
+        }
+
+        # Everyone sends to the next user
+        def upload(number, username, payload):
+            recipient = usernames[(usernames.index(username) + 1) % len(usernames)]
+            return lambda recorder: recorder.request(
+                client, "POST /api/upload", "POST", "/api/upload", headers=headers[username],
+                data={"recipient_username": recipient}, files={"file": (f"bench-{number}.txt", payload, "text/plain")}
+            )
+        await run_phase(results, "upload", concurrency, [
+            upload(number, username, payload)
+            for username in headers for number, payload in enumerate(payloads)
+        ])
+
+        def listing(username, box):
+            return lambda recorder: recorder.request(
+                client, f"GET /api/files/{box}", "GET", f"/api/files/{box}", headers=headers[username]
+            )
+        boxes = [(username, box) for username in headers for box in ("received", "sent")]
+        responses = await run_phase(results, "list", concurrency, [listing(username, box) for username, box in boxes])
+        received = [
+            (username, file["file_id"])
+            for (username, box), response in zip(boxes, responses) if box == "received" and response is not None
+            for file in response.json()["files"]
+        ]
+
+        def download(username, file_id):
+            return lambda recorder: recorder.request(
+                client, "POST /api/download", "POST", "/api/download", headers=headers[username], data={"file_id": file_id}
+            )
+        await run_phase(results, "download", concurrency, [download(username, file_id) for username, file_id in received])
+    return results
+
+async def run_load(users: int, concurrency: int, files_per_user: int, size_kb: int, verbose: bool) -> dict:
+    if "models" in sys.modules:
+        raise RuntimeError("The load test needs a fresh process: the database is already configured")
+    directory = tempfile.mkdtemp(prefix="quantumdocs-load-")
+    started_in = os.getcwd()
+    # The database and upload paths are relative to the working directory
+    os.chdir(directory)
+    os.environ["DATABASE_PATH"] = os.path.join(directory, "quantumdocs.db")
+    os.environ["STORAGE_BACKEND"] = "local"
+    os.environ["STORAGE_LOCAL_ROOT"] = os.path.join(directory, "uploads")
+    try:
+        # The API logs every request step; keep it out of the report unless asked for
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(sys.stdout if verbose else devnull):
+            # Imported here so the settings above are read
+            from main import app
+            async with app.router.lifespan_context(app):
+                results = await drive(app, users, concurrency, files_per_user, size_kb)
+    finally:
+        os.chdir(started_in)
+        shutil.rmtree(directory, ignore_errors=True)
+    return build_report("api_load", {
+        "users": users,
+        "concurrency": concurrency,
+        "files_per_user": files_per_user,
+        "file_size_kb": size_kb,
+        "seed": SEED
+    }, results)
+
+def print_report(report: dict) -> None:
+    parameters = report["parameters"]
+    print(f"🚦 API load: {parameters['users']} users, {parameters['concurrency']} in flight, "
+          f"{parameters['files_per_user']} x {parameters['file_size_kb']}KB files each")
+    print(f"   {'endpoint':<26}{'req/s':>9}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for endpoint, result in report["results"].items():
+        print(f"   {endpoint:<26}{result['requests_per_second']:>9.1f}{result['errors']:>8}"
+              f"{result.get('p50_ms', 0):>10.1f}{result.get('p95_ms', 0):>10.1f}{result.get('p99_ms', 0):>10.1f}")
+    print(f"   peak RSS {report['peak_rss_mb']}MB")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=16, help="Virtual users")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight at most")
+    parser.add_argument("--files", type=int, default=2, help="Files each user uploads")
+    parser.add_argument("--size", type=int, default=256, help="File size in KB")
+    parser.add_argument("--json", help="Write the report as JSON to this path (- for stdout)")
+    parser.add_argument("--verbose", action="store_true", help="Show the API's own logging")
+    args = parser.parse_args()
+    report = asyncio.run(run_load(args.users, args.concurrency, args.files, args.size, args.verbose))
+    print_report(report)
+    write_report(report, args.json)
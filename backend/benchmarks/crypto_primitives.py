@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Latency and throughput of the crypto primitives: whole-file encrypt/decrypt across payload
+sizes, user key generation, password key derivation and access token verification.
+Run from backend/: python -m benchmarks.crypto_primitives [--sizes 1,64,1024] [--json out.json]
+"""
+
+import argparse
+import random
+import time
+
+import auth
+from crypto_utils import decrypt_file_for_user, encrypt_file_for_user
+from keypair_pool import generate_kem_keypair, generate_sig_keypair
+from user_crypto import derive_key_from_password, generate_user_keys
+
+from benchmarks.results import build_report, latency_summary, write_report
+
+DEFAULT_SIZES_KB = [1, 64, 1024, 16384]
+DURATION = 1.0  # Seconds per case
+MIN_CALLS = 5
+SEED = 1234  # Payloads are the same from run to run
+PASSWORD = "benchmark-password"
+
+def measure(fn, duration: float = DURATION, min_calls: int = MIN_CALLS) -> dict:
+    """Call fn for duration seconds (at least min_calls times); ops/sec and latency percentiles"""
+    fn()  # Warm up
+    samples = []
+    started = time.perf_counter()
+    while len(samples) < min_calls or time.perf_counter() - started < duration:
+        call_started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - call_started)
+    return {"ops_per_second": round(len(samples) / sum(samples), 2), **latency_summary(samples)}
+
+def file_cases(sizes_kb: list, duration: float) -> dict:
+    kem_public, kem_secret = generate_kem_keypair()
+    sig_public, sig_secret = generate_sig_keypair()
+    rng = random.Random(SEED)
+    results = {}
+    for size_kb in sizes_kb:
+        data = rng.randbytes(size_kb * 1024)
+        encrypted = encrypt_file_for_user(data, kem_public, sig_secret)
+        if decrypt_file_for_user(*encrypted[:3], encrypted[3], sig_public, kem_secret) != data:
+            raise ValueError("Round trip lost data")
+        for name, fn in (
+            ("encrypt_file_for_user", lambda: encrypt_file_for_user(data, kem_public, sig_secret)),
+            ("decrypt_file_for_user", lambda: decrypt_file_for_user(*encrypted[:3], encrypted[3], sig_public, kem_secret))
+        ):
+            result = measure(fn, duration)
+            result["mb_per_second"] = round(result["ops_per_second"] * size_kb / 1024, 2)
+            results[f"{name}[{size_kb}KB]"] = result
+    return results
+
+def key_cases(duration: float) -> dict:
+    salt = bytes(16)
+    token = auth.create_access_token(data={"sub": "bench@example.com"})
+
+    def verify_uncached():
+        auth.clear_token_cache()
+        return auth.verify_token(token)
+
+    results = {
+        "generate_user_keys": measure(lambda: generate_user_keys(PASSWORD), duration),
+        "derive_key_from_password": measure(lambda: derive_key_from_password(PASSWORD, salt), duration),
+        "verify_token[uncached]": measure(verify_uncached, duration)
+    }
+    auth.clear_token_cache()
+    results["verify_token[cached]"] = measure(lambda: auth.verify_token(token), duration)
+    return results
+
+def run_benchmark(sizes_kb: list = DEFAULT_SIZES_KB, duration: float = DURATION) -> dict:
+    results = {**file_cases(sizes_kb, duration), **key_cases(duration)}
+    return build_report("crypto_primitives", {"sizes_kb": sizes_kb, "duration_seconds": duration, "seed": SEED}, results)
+
+def print_report(report: dict) -> None:
+    print(f"🔐 Crypto primitives ({report['parameters']['duration_seconds']}s per case)")
+    print(f"   {'operation':<36}{'ops/s':>10}{'MB/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, result in report["results"].items():
+        throughput = f"{result['mb_per_second']:.1f}" if "mb_per_second" in result else "-"
+        print(f"   {name:<36}{result['ops_per_second']:>10.1f}{throughput:>9}"
+              f"{result['p50_ms']:>10.3f}{result['p95_ms']:>10.3f}{result['p99_ms']:>10.3f}")
+    print(f"   peak RSS {report['peak_rss_mb']}MB")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES_KB)), help="Payload sizes in KB")
+    parser.add_argument("--duration", type=float, default=DURATION, help="Seconds per case")
+    parser.add_argument("--json", help="Write the report as JSON to this path (- for stdout)")
+    args = parser.parse_args()
+    report = run_benchmark([int(size) for size in args.sizes.split(",")], args.duration)
+    print_report(report)
+    write_report(report, args.json)
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Insert throughput (inserts/sec) of a scratch SQLite database versus the number of concurrent
+writers: SQLite's default rollback journal against WAL with synchronous=NORMAL, each with a
+commit per insert and with group commits.
+Run from backend/: python -m benchmarks.db_inserts [inserts]
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+from db_writer import GROUP_COMMIT_MAX_BATCH, DbWriter
+from models import Base, User, apply_sqlite_pragmas
+
+INSERTS = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+CONCURRENCY = [1, 8, 64]
+MODES = {
+    "journal=DELETE sync=FULL": ("DELETE", "FULL"),  # SQLite defaults
+    "journal=WAL sync=NORMAL": ("WAL", "NORMAL")
+}
+
+def open_database(path: str, journal_mode: str, synchronous: str):
+    def on_connect(dbapi_connection, connection_record):
+        apply_sqlite_pragmas(dbapi_connection)
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA journal_mode={journal_mode}")
+        cursor.execute(f"PRAGMA synchronous={synchronous}")
+        cursor.close()
+
+    schema_engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=schema_engine, tables=[User.__table__])
+    schema_engine.dispose()
+    engine = create_async_engine(f"sqlite+aiosqlite:///{path}", pool_size=max(CONCURRENCY), max_overflow=0)
+    event.listen(engine.sync_engine, "connect", on_connect)
+    return engine
+
+async def insert_rate(engine, concurrency: int, max_batch: int, run: str) -> float:
+    writer = DbWriter(max_batch=max_batch, window_ms=0, session_factory=async_sessionmaker(engine, expire_on_commit=False))
+
+    async def insert(number: int):
+        user = User(
+            username=f"{run}-{number}",
+            email=f"{run}-{number}@bench.local",
+            hashed_password="x" * 60
+        )
+
+        async def add(session):
+            session.add(user)
+            await session.flush()
+        await writer.submit(add)
+
+    async def writer_task(first: int):
+        for number in range(first, INSERTS, concurrency):
+            await insert(number)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(writer_task(first) for first in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    writer.stop()
+    return INSERTS / elapsed
+
+async def run_benchmark():
+    print(f"🗄️ SQLite inserts, {INSERTS} rows per run (group commit batch up to {GROUP_COMMIT_MAX_BATCH})")
+    print(f"   {'mode':<28}{'writers':>8}{'per-insert/s':>14}{'grouped/s':>12}")
+    with tempfile.TemporaryDirectory() as directory:
+        for mode, (journal_mode, synchronous) in MODES.items():
+            engine = open_database(os.path.join(directory, f"{journal_mode}.db"), journal_mode, synchronous)
+            for concurrency in CONCURRENCY:
+                single = await insert_rate(engine, concurrency, 1, f"single-{concurrency}")
+                grouped = await insert_rate(engine, concurrency, GROUP_COMMIT_MAX_BATCH, f"grouped-{concurrency}")
+                print(f"   {mode:<28}{concurrency:>8}{single:>14.0f}{grouped:>12.0f}")
+            await engine.dispose()
+
+if __name__ == "__main__":
+    asyncio.run(run_benchmark())
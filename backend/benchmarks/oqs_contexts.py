@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Ops/sec of the PQC primitives with fresh liboqs contexts per operation (before)
+versus the reusable per-thread contexts in oqs_contexts (after).
+Run from backend/: python -m benchmarks.oqs_contexts
+"""
+
+import time
+
+import oqs
+
+from crypto_utils import KEM_ALGO, SIG_ALGO
+from keypair_pool import generate_kem_keypair, generate_sig_keypair
+from oqs_contexts import decapsulator, encapsulator, signer, verifier
+
+DURATION = 2.0  # Seconds per measurement
+
+def ops_per_second(fn) -> float:
+    count = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < DURATION:
+        fn()
+        count += 1
+    return count / (time.perf_counter() - started)
+
+def run_benchmark():
+    kem_public, kem_secret = generate_kem_keypair()
+    sig_public, sig_secret = generate_sig_keypair()
+    ciphertext, _ = encapsulator(KEM_ALGO).encap_secret(kem_public)
+    message = b"x" * 32
+    signature = signer(SIG_ALGO, sig_secret).sign(message)
+
+    cases = {
+        "encap": (
+            lambda: oqs.KeyEncapsulation(KEM_ALGO).encap_secret(kem_public),
+            lambda: encapsulator(KEM_ALGO).encap_secret(kem_public)
+        ),
+        "decap": (
+            lambda: oqs.KeyEncapsulation(KEM_ALGO, secret_key=kem_secret).decap_secret(ciphertext),
+            lambda: decapsulator(KEM_ALGO, kem_secret, reuse=True).decap_secret(ciphertext)
+        ),
+        "sign": (
+            lambda: oqs.Signature(SIG_ALGO, secret_key=sig_secret).sign(message),
+            lambda: signer(SIG_ALGO, sig_secret, reuse=True).sign(message)
+        ),
+        "verify": (
+            lambda: oqs.Signature(SIG_ALGO).verify(message, signature, sig_public),
+            lambda: verifier(SIG_ALGO).verify(message, signature, sig_public)
+        )
+    }
+
+    print(f"⚡ {KEM_ALGO} / {SIG_ALGO} ops/sec ({DURATION:.0f}s per case)")
+    print(f"   {'operation':<10}{'before':>12}{'after':>12}{'speedup':>10}")
+    for name, (before, after) in cases.items():
+        before_rate = ops_per_second(before)
+        after_rate = ops_per_second(after)
+        print(f"   {name:<10}{before_rate:>12.0f}{after_rate:>12.0f}{after_rate / before_rate:>9.2f}x")
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,75 @@
+"""
+Latency percentiles, peak RSS and the JSON report shared by the benchmark suite.
+"""
+
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+from datetime import datetime
+from typing import Optional
+
+def latency_summary(samples: list) -> dict:
+    """Count, mean and p50/p95/p99/max of latencies given in seconds, reported in milliseconds"""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def percentile(fraction: float) -> float:
+        # Nearest rank
+        return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))] * 1000
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+        "p50_ms": round(percentile(0.50), 3),
+        "p95_ms": round(percentile(0.95), 3),
+        "p99_ms": round(percentile(0.99), 3),
+        "max_ms": round(ordered[-1] * 1000, 3)
+    }
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KB, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def environment() -> dict:
+    return {
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count()
+    }
+
+def build_report(benchmark: str, parameters: dict, results: dict) -> dict:
+    return {
+        "benchmark": benchmark,
+        "created_at": datetime.utcnow().isoformat() + "Z",
+        "environment": environment(),
+        "parameters": parameters,
+        "results": results,
+        "peak_rss_mb": peak_rss_mb()
+    }
+
+def write_report(report: dict, path: Optional[str]) -> None:
+    """Write a report as JSON to path ("-" for stdout); nothing if path is None"""
+    if path is None:
+        return
+    text = json.dumps(report, indent=2)
+    if path == "-":
+        print(text)
+        return
+    with open(path, "w") as f:
+        f.write(text + "\n")
+    print(f"📄 Wrote {path}")
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Encrypt and decrypt throughput (MB/s) of the chunked stream engine versus the number of
+crypto workers sealing and opening batches of chunks in parallel.
+Run from backend/: python -m benchmarks.stream_throughput [size in MB]
+"""
+
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from crypto_utils import (
+    KEY_HOLDER_RECIPIENT, STREAM_BATCH_CHUNKS, STREAM_CHUNK_SIZE, STREAM_TRAILER_SIZE,
+    StreamDecryptor, StreamEncryptor, StreamIndex, verify_stream_signature
+)
+from keypair_pool import generate_kem_keypair, generate_sig_keypair
+
+SIZE_MB = int(sys.argv[1]) if len(sys.argv) > 1 else 64
+ROUNDS = 3  # Best of
+
+def worker_counts() -> list:
+    counts, workers = [], 1
+    while workers < (os.cpu_count() or 1):
+        counts.append(workers)
+        workers *= 2
+    return counts + [os.cpu_count() or 1]
+
+def batches(items: list) -> list:
+    return [(number, items[number:number + STREAM_BATCH_CHUNKS]) for number in range(0, len(items), STREAM_BATCH_CHUNKS)]
+
+def encrypt(pool: ThreadPoolExecutor, chunks: list, kem_public: bytes, sig_secret: bytes):
+    encryptor = StreamEncryptor(kem_public, sig_secret, holder=KEY_HOLDER_RECIPIENT)
+    work = batches(chunks)
+    futures = [
+        pool.submit(encryptor.seal_chunks, number, batch, number + len(batch) == len(chunks))
+        for number, batch in work
+    ]
+    sealed = []
+    for (number, batch), future in zip(work, futures):
+        sealed_batch = future.result()
+        encryptor.append_sealed(batch, sealed_batch, number + len(batch) == len(chunks))
+        sealed.extend(sealed_batch)
+    return encryptor, sealed, encryptor.finalize()
+
+def decrypt(pool: ThreadPoolExecutor, encryptor: StreamEncryptor, sealed: list, signature: bytes,
+            kem_secret: bytes, sig_public: bytes) -> int:
+    trailer = encryptor.trailer()
+    index_size = len(trailer) - STREAM_TRAILER_SIZE
+    index = StreamIndex(encryptor.header, trailer[:index_size], trailer[index_size:])
+    if not verify_stream_signature(index, signature, sig_public):
+        raise ValueError("Signature check failed")
+    decryptor = StreamDecryptor(index, encryptor.ciphertext, kem_secret)
+    futures = [pool.submit(decryptor.decrypt_chunks, number, batch) for number, batch in batches(sealed)]
+    return sum(len(chunk) for future in futures for chunk in future.result())
+
+def best_rate(fn) -> float:
+    best = None
+    for _ in range(ROUNDS):
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return SIZE_MB / best
+
+def run_benchmark():
+    kem_public, kem_secret = generate_kem_keypair()
+    sig_public, sig_secret = generate_sig_keypair()
+    data = os.urandom(SIZE_MB * 1024 * 1024)
+    chunks = [data[offset:offset + STREAM_CHUNK_SIZE] for offset in range(0, len(data), STREAM_CHUNK_SIZE)]
+
+    print(f"⚡ Stream throughput, {SIZE_MB}MB in {STREAM_CHUNK_SIZE // 1024}KB chunks, "
+          f"{STREAM_BATCH_CHUNKS} chunks per task (best of {ROUNDS})")
+    print(f"   {'workers':<10}{'encrypt MB/s':>14}{'decrypt MB/s':>14}")
+    for workers in worker_counts():
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            encrypted = encrypt(pool, chunks, kem_public, sig_secret)
+            if decrypt(pool, *encrypted, kem_secret, sig_public) != len(data):
+                raise ValueError("Round trip lost data")
+            encrypt_rate = best_rate(lambda: encrypt(pool, chunks, kem_public, sig_secret))
+            decrypt_rate = best_rate(lambda: decrypt(pool, *encrypted, kem_secret, sig_public))
+        print(f"   {workers:<10}{encrypt_rate:>14.0f}{decrypt_rate:>14.0f}")
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Runs the benchmark suite (crypto primitives, then the API load test) and writes one JSON report.
+With --baseline, compares it against the report of an earlier release and exits with status 1
+if any throughput dropped or p95 latency grew by more than the tolerance.
+Run from backend/: python -m benchmarks.suite --json results.json [--baseline previous.json]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmarks import crypto_primitives
+from benchmarks.results import build_report, write_report
+
+DEFAULT_TOLERANCE = 0.2  # Relative change treated as noise
+THROUGHPUT_METRICS = ("ops_per_second", "requests_per_second")  # Higher is better
+LATENCY_METRICS = ("p95_ms",)  # Lower is better
+
+def run_part(module: str, arguments: list) -> dict:
+    """Run one benchmark in its own process, so each part has a fresh app and its own peak RSS"""
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "report.json")
+        subprocess.run([sys.executable, "-m", f"benchmarks.{module}", *arguments, "--json", path], check=True)
+        with open(path) as f:
+            return json.load(f)
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list:
+    """Descriptions of the metrics of report that regressed against baseline"""
+    regressions = []
+    for part, part_report in report["results"].items():
+        baseline_results = baseline["results"].get(part, {}).get("results", {})
+        for case, metrics in part_report["results"].items():
+            previous = baseline_results.get(case)
+            if not previous:
+                continue
+            for metric in THROUGHPUT_METRICS + LATENCY_METRICS:
+                if not previous.get(metric) or metric not in metrics:
+                    continue
+                change = metrics[metric] / previous[metric] - 1
+                worse = -change if metric in THROUGHPUT_METRICS else change
+                if worse > tolerance:
+                    regressions.append(f"{part} {case} {metric}: {previous[metric]} -> {metrics[metric]} ({change:+.0%})")
+    return regressions
+
+def run_suite(args) -> dict:
+    crypto = run_part("crypto_primitives", ["--sizes", args.sizes, "--duration", str(args.duration)])
+    load = run_part("api_load", [
+        "--users", str(args.users), "--concurrency", str(args.concurrency),
+        "--files", str(args.files), "--size", str(args.size)
+    ])
+    return build_report("suite", {"tolerance": args.tolerance}, {"crypto_primitives": crypto, "api_load": load})
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=",".join(map(str, crypto_primitives.DEFAULT_SIZES_KB)), help="Payload sizes in KB")
+    parser.add_argument("--duration", type=float, default=crypto_primitives.DURATION, help="Seconds per crypto case")
+    parser.add_argument("--users", type=int, default=16, help="Virtual users of the load test")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight at most")
+    parser.add_argument("--files", type=int, default=2, help="Files each user uploads")
+    parser.add_argument("--size", type=int, default=256, help="File size in KB")
+    parser.add_argument("--json", help="Write the report as JSON to this path (- for stdout)")
+    parser.add_argument("--baseline", help="Report of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=DEFAULT_TOLERANCE, help="Allowed relative regression")
+    args = parser.parse_args()
+
+    report = run_suite(args)
+    write_report(report, args.json)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print(f"❌ {len(regressions)} regressions against {args.baseline}:")
+            for regression in regressions:
+                print(f"   {regression}")
+            sys.exit(1)
+        print(f"✅ No regressions against {args.baseline}")
@@ -0,0 +1,96 @@
+import asyncio
+import hashlib
+import hmac
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+
+from auth import SECRET_KEY
+from database import delete_unreferenced_blobs, find_referenced_blob_ids
+from models import AsyncSessionLocal
+from storage import get_storage
+
+# === Blob Store Configuration ===
+# Encrypted payloads are kept in the storage driver by blob id. Every upload gets a fresh data key,
+# so two uploads of the same file never produce the same ciphertext; blobs are identified by a
+# keyed hash of their plaintext instead, scoped to the sender, and a re-send reuses the stored
+# blob. SharedMetadata rows hold references, and blobs nobody references are collected.
+BLOB_GC_INTERVAL_SECONDS = float(os.getenv("BLOB_GC_INTERVAL_SECONDS", "300"))  # 0 = no background collector
+BLOB_GC_GRACE_SECONDS = float(os.getenv("BLOB_GC_GRACE_SECONDS", "3600"))  # Age before a blob may be collected
+
+# Content keys are HMACs, so they reveal nothing about a file to whoever can read the database
+_CONTENT_KEY_SECRET = hashlib.sha256(b"quantumdocs-blob-content-key:" + SECRET_KEY.encode()).digest()
+
+_stats = {
+    "dedup_hits": 0,
+    "dedup_bytes_saved": 0,
+    "gc_runs": 0,
+    "gc_errors": 0,
+    "blobs_collected": 0,
+    "orphans_removed": 0,
+    "bytes_reclaimed": 0
+}
+_collector: Optional[asyncio.Task] = None
+
+def new_content_hash(sender_username: str) -> "hmac.HMAC":
+    """Hash to feed an upload's plaintext into; its hexdigest is the blob's content key"""
+    content_hash = hmac.new(_CONTENT_KEY_SECRET, digestmod=hashlib.sha256)
+    content_hash.update(sender_username.encode() + b"\0")
+    return content_hash
+
+def record_dedup_hit(bytes_saved: int) -> None:
+    _stats["dedup_hits"] += 1
+    _stats["dedup_bytes_saved"] += bytes_saved
+
+async def collect_garbage(grace_seconds: float = BLOB_GC_GRACE_SECONDS) -> dict:
+    """
+    Reclaim blobs whose reference count dropped to zero, plus orphaned payloads that no row
+    references (e.g. an upload that failed before its rows were written). The grace period
+    keeps uploads still being written out of reach.
+    """
+    storage = get_storage()
+    async with AsyncSessionLocal() as db:
+        collected = await delete_unreferenced_blobs(db, datetime.utcnow() - timedelta(seconds=grace_seconds))
+        candidates = await storage.list_blobs(time.time() - grace_seconds)
+        referenced = await find_referenced_blob_ids(db, candidates) if candidates else set()
+    orphans = [blob_id for blob_id in candidates if blob_id not in referenced and blob_id not in collected]
+
+    reclaimed = 0
+    for blob_id in collected + orphans:
+        reclaimed += await storage.delete(blob_id)
+    _stats["gc_runs"] += 1
+    _stats["blobs_collected"] += len(collected)
+    _stats["orphans_removed"] += len(orphans)
+    _stats["bytes_reclaimed"] += reclaimed
+    if collected or orphans:
+        print(f"🧹 Blob GC removed {len(collected)} unreferenced and {len(orphans)} orphaned blobs ({reclaimed} bytes)")
+    return {"collected": len(collected), "orphans": len(orphans), "bytes_reclaimed": reclaimed}
+
+async def _collector_loop(interval: float) -> None:
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await collect_garbage()
+        except Exception as e:
+            _stats["gc_errors"] += 1
+            print(f"❌ Blob GC failed: {e}")
+
+def start_blob_collector(interval: float = BLOB_GC_INTERVAL_SECONDS) -> None:
+    """Start the background collector on the running event loop (idempotent)"""
+    global _collector
+    if interval > 0 and _collector is None:
+        _collector = asyncio.get_running_loop().create_task(_collector_loop(interval))
+
+def stop_blob_collector() -> None:
+    global _collector
+    if _collector is not None:
+        _collector.cancel()
+        _collector = None
+
+def blob_store_metrics() -> dict:
+    return {
+        "gc_interval_seconds": BLOB_GC_INTERVAL_SECONDS,
+        "gc_grace_seconds": BLOB_GC_GRACE_SECONDS,
+        **_stats
+    }
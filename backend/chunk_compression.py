@@ -0,0 +1,132 @@
+import os
+import threading
+import time
+from typing import Optional
+
+try:
+    import zstandard
+except ImportError:  # Optional: without it uploads are stored uncompressed
+    zstandard = None
+
+# === Compression Configuration ===
+# Plaintext chunks are zstd-compressed before they are sealed (ciphertext does not compress).
+# Every chunk is its own frame, so ranged downloads still only decrypt the chunks they need.
+# Uploads of already-compressed types are stored as-is, and so is any upload whose first
+# chunk does not shrink by at least COMPRESSION_MIN_SAVINGS.
+COMPRESSION_LEVEL = int(os.getenv("COMPRESSION_LEVEL", "3"))  # zstd level (1-22); 0 = no compression
+COMPRESSION_MIN_SAVINGS = float(os.getenv("COMPRESSION_MIN_SAVINGS", "0.1"))  # Fraction of the sample to save
+# Formats that are compressed already (.docx is a zip archive)
+COMPRESSED_EXTENSIONS = {".jpg", ".jpeg", ".png", ".gif", ".zip", ".rar", ".docx"}
+
+_local = threading.local()
+_stats_lock = threading.Lock()
+_stats = {
+    "uploads_compressed": 0,
+    "skipped_by_type": 0,
+    "skipped_by_sample": 0,
+    "bytes_in": 0,
+    "bytes_out": 0,
+    "cpu_seconds": 0.0  # Compression, including samples that were rejected
+}
+
+def _count(**counts) -> None:
+    with _stats_lock:
+        for name, value in counts.items():
+            _stats[name] += value
+
+def _zstd_compressor(level: int):
+    """This thread's compressor for level (zstd contexts must not be shared between threads)"""
+    compressors = getattr(_local, "compressors", None)
+    if compressors is None:
+        compressors = _local.compressors = {}
+    if level not in compressors:
+        compressors[level] = zstandard.ZstdCompressor(level=level)
+    return compressors[level]
+
+class ChunkCompressor:
+    """Compresses the chunks of one upload, keeping its totals for the upload report"""
+
+    codec = "zstd"
+
+    def __init__(self, level: int = COMPRESSION_LEVEL):
+        self.level = level
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.cpu_seconds = 0.0
+        self._sample = None  # (chunk, frame) of the sample choose_compressor already compressed
+        self._lock = threading.Lock()
+
+    def compress(self, chunk: bytes) -> bytes:
+        with self._lock:
+            sample, self._sample = self._sample, None
+        if sample and sample[0] == chunk:
+            # The first chunk is the sample: reuse its frame instead of compressing it twice
+            with self._lock:
+                self.bytes_in += len(chunk)
+                self.bytes_out += len(sample[1])
+            return sample[1]
+        # Chunks are compressed on crypto worker threads, so thread CPU time is this upload's
+        started = time.thread_time()
+        compressed = _zstd_compressor(self.level).compress(chunk)
+        elapsed = time.thread_time() - started
+        with self._lock:
+            self.cpu_seconds += elapsed
+            self.bytes_in += len(chunk)
+            self.bytes_out += len(compressed)
+        return compressed
+
+    def report(self) -> dict:
+        """Totals for one upload; ratio is original bytes per stored byte"""
+        return {
+            "codec": self.codec,
+            "level": self.level,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "ratio": round(self.bytes_in / self.bytes_out, 3) if self.bytes_out else 1.0,
+            "cpu_seconds": round(self.cpu_seconds, 6)
+        }
+
+def choose_compressor(filename: str, sample: bytes) -> Optional[ChunkCompressor]:
+    """Compressor for an upload given its name and first chunk, or None to store it uncompressed"""
+    if COMPRESSION_LEVEL <= 0 or zstandard is None or not sample:
+        return None
+    if os.path.splitext(filename.lower())[1] in COMPRESSED_EXTENSIONS:
+        _count(skipped_by_type=1)
+        return None
+    compressor = ChunkCompressor()
+    compressed = compressor.compress(sample)
+    if len(compressed) > len(sample) * (1 - COMPRESSION_MIN_SAVINGS):
+        _count(skipped_by_sample=1, cpu_seconds=compressor.cpu_seconds)
+        return None
+    # The sample is counted when it is handed back as the first chunk
+    compressor.bytes_in = compressor.bytes_out = 0
+    compressor._sample = (sample, compressed)
+    return compressor
+
+def finish_compression(compressor: ChunkCompressor, filename: str) -> dict:
+    """Record a compressed upload in the metrics and return its report"""
+    report = compressor.report()
+    _count(uploads_compressed=1, bytes_in=compressor.bytes_in, bytes_out=compressor.bytes_out,
+           cpu_seconds=compressor.cpu_seconds)
+    print(f"🗜️ Compressed {filename}: {report['bytes_in']} -> {report['bytes_out']} bytes "
+          f"({report['ratio']}x, {report['cpu_seconds'] * 1000:.1f}ms CPU)")
+    return report
+
+def decompress_chunk(data: bytes, max_size: int) -> bytes:
+    """Decompress one chunk frame, refusing to expand past max_size"""
+    if zstandard is None:
+        raise RuntimeError("This file is zstd-compressed and requires zstandard (pip install zstandard)")
+    decompressor = getattr(_local, "decompressor", None)
+    if decompressor is None:
+        decompressor = _local.decompressor = zstandard.ZstdDecompressor()
+    return decompressor.decompress(data, max_output_size=max_size)
+
+def compression_metrics() -> dict:
+    with _stats_lock:
+        stats = dict(_stats)
+    return {
+        "available": zstandard is not None,
+        "level": COMPRESSION_LEVEL,
+        "ratio": round(stats["bytes_in"] / stats["bytes_out"], 3) if stats["bytes_out"] else 1.0,
+        **stats
+    }
@@ -0,0 +1,166 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+# === Crypto Executor Configuration ===
+# liboqs (via ctypes), AES-GCM, zstd and PBKDF2 all release the GIL, so crypto runs on threads
+CRYPTO_THREAD_WORKERS = int(os.getenv("CRYPTO_THREAD_WORKERS", str(os.cpu_count() or 4)))
+CRYPTO_QUEUE_SIZE = int(os.getenv("CRYPTO_QUEUE_SIZE", "256"))  # Waiting tasks allowed
+
+# Password hashing and key derivation get their own small pool, so a login storm queues
+# (and is rejected) there instead of starving file encryption, and vice versa
+KDF_WORKERS = int(os.getenv("KDF_WORKERS", str(min(4, os.cpu_count() or 4))))
+KDF_QUEUE_SIZE = int(os.getenv("KDF_QUEUE_SIZE", "64"))
+
+class CryptoExecutorBusy(Exception):
+    """Raised when a pool's wait queue is full"""
+
+def _timed_call(fn: Callable, args: tuple, kwargs: dict) -> tuple:
+    """Run fn in a worker and report when it started, so queue wait can be measured"""
+    started = time.time()
+    return started, fn(*args, **kwargs)
+
+class CryptoPool:
+    """
+    A worker pool with a bounded wait queue and counters.
+
+    At most max_workers tasks run at once and at most max_queue more may wait; beyond
+    that submissions are rejected with CryptoExecutorBusy instead of piling up.
+    """
+
+    def __init__(self, name: str, executor: Executor, max_workers: int, max_queue: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = executor
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._stats = {
+            "submitted": 0,
+            "completed": 0,
+            "failed": 0,
+            "rejected": 0,
+            "max_queue_depth": 0,
+            "queue_wait_seconds": 0.0,
+            "run_seconds": 0.0
+        }
+        self._stages = {}
+
+    @property
+    def queue_depth(self) -> int:
+        return max(0, self._in_flight - self.max_workers)
+
+    def _stage_stats(self, stage: str) -> dict:
+        if stage not in self._stages:
+            self._stages[stage] = {
+                "completed": 0,
+                "failed": 0,
+                "rejected": 0,
+                "queue_wait_seconds": 0.0,
+                "run_seconds": 0.0,
+                "max_run_seconds": 0.0
+            }
+        return self._stages[stage]
+
+    async def run(self, fn: Callable, *args: Any, stage: Optional[str] = None, **kwargs: Any) -> Any:
+        """Run fn(*args, **kwargs) in the pool and await its result; stage labels its timings"""
+        with self._lock:
+            if self._in_flight >= self.max_workers + self.max_queue:
+                self._stats["rejected"] += 1
+                if stage:
+                    self._stage_stats(stage)["rejected"] += 1
+                raise CryptoExecutorBusy(f"{self.name} pool is saturated")
+            self._in_flight += 1
+            self._stats["submitted"] += 1
+            self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], self.queue_depth)
+
+        submitted = time.time()
+        try:
+            future = self._executor.submit(_timed_call, fn, args, kwargs)
+        except BaseException:
+            self._release()
+            raise
+        # The slot is held until the worker is done, even if the caller stops waiting (a cancelled
+        # task cannot stop a call that already started)
+        future.add_done_callback(self._release)
+        try:
+            started, result = await asyncio.wrap_future(future)
+        except Exception:
+            with self._lock:
+                self._stats["failed"] += 1
+                if stage:
+                    self._stage_stats(stage)["failed"] += 1
+            raise
+
+        finished = time.time()
+        with self._lock:
+            self._stats["completed"] += 1
+            self._stats["queue_wait_seconds"] += max(0.0, started - submitted)
+            self._stats["run_seconds"] += max(0.0, finished - started)
+            if stage:
+                stage_stats = self._stage_stats(stage)
+                stage_stats["completed"] += 1
+                stage_stats["queue_wait_seconds"] += max(0.0, started - submitted)
+                stage_stats["run_seconds"] += max(0.0, finished - started)
+                stage_stats["max_run_seconds"] = max(stage_stats["max_run_seconds"], finished - started)
+        return result
+
+    def _release(self, future: Optional[Future] = None) -> None:
+        with self._lock:
+            self._in_flight -= 1
+
+    def metrics(self) -> dict:
+        with self._lock:
+            metrics = {
+                "workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "in_flight": self._in_flight,
+                "queue_depth": self.queue_depth,
+                **self._stats
+            }
+            if self._stages:
+                metrics["stages"] = {stage: dict(stats) for stage, stats in self._stages.items()}
+            return metrics
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+_crypto_executor: Optional[CryptoPool] = None
+
+def get_crypto_executor() -> CryptoPool:
+    """Get the process-wide crypto pool, creating it on first use"""
+    global _crypto_executor
+    if _crypto_executor is None:
+        _crypto_executor = CryptoPool(
+            "crypto",
+            ThreadPoolExecutor(max_workers=CRYPTO_THREAD_WORKERS, thread_name_prefix="crypto"),
+            CRYPTO_THREAD_WORKERS,
+            CRYPTO_QUEUE_SIZE
+        )
+    return _crypto_executor
+
+_kdf_executor: Optional[CryptoPool] = None
+
+def get_kdf_executor() -> CryptoPool:
+    """Get the process-wide password hashing / key derivation pool, creating it on first use"""
+    global _kdf_executor
+    if _kdf_executor is None:
+        _kdf_executor = CryptoPool(
+            "kdf",
+            ThreadPoolExecutor(max_workers=KDF_WORKERS, thread_name_prefix="kdf"),
+            KDF_WORKERS,
+            KDF_QUEUE_SIZE
+        )
+    return _kdf_executor
+
+def shutdown_crypto_executor() -> None:
+    global _crypto_executor, _kdf_executor
+    if _crypto_executor is not None:
+        _crypto_executor.shutdown()
+        _crypto_executor = None
+    if _kdf_executor is not None:
+        _kdf_executor.shutdown()
+        _kdf_executor = None
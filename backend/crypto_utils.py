@@ -1,13 +1,71 @@
-import oqs
+from cryptography.exceptions import InvalidTag
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
-import base64
+import hashlib
 import os
-from typing import Tuple, Optional
+import struct
+from functools import lru_cache
+from typing import List, Tuple, Optional
+
+from chunk_compression import ChunkCompressor, decompress_chunk
+from oqs_contexts import decapsulator, encapsulator, kem_details, signer, verifier
 
 # === PQC Algorithm Configuration ===
 KEM_ALGO = "Kyber512"
 SIG_ALGO = "Dilithium2"
 
+# Algorithm ids recorded in stream headers; ids are never reused
+KEM_ALGORITHM_IDS = {"Kyber512": 1}
+SIG_ALGORITHM_IDS = {"Dilithium2": 1}
+
+# === Streaming (chunked AEAD) Configuration ===
+#
+# On-disk container layout (version 3), stored raw:
+#   header  | magic | version (u8) | flags (u8) | KEM id (u8) | signature id (u8) | chunk size (u32) | nonce prefix
+#   chunks  | AES-GCM sealed chunks, each holding chunk size plaintext bytes (last may be short)
+#   index   | per chunk: sealed length (u32) | GCM tag
+#   trailer | plaintext size (u64) | chunk count (u32) | index offset (u64) | index magic
+#
+# The index is written after the chunks so uploads stay single-pass; readers find it
+# through the fixed-size trailer and can then seek straight to any chunk. The wrapped key
+# and signature differ per recipient, so they live in the file's SharedMetadata row.
+# Version 2 headers carry no algorithm ids and are read as Kyber512 / Dilithium2.
+STREAM_MAGIC = b"QSHF"
+STREAM_INDEX_MAGIC = b"QSIX"
+STREAM_VERSION = 3
+STREAM_CHUNK_SIZE = int(os.getenv("STREAM_CHUNK_SIZE", str(64 * 1024)))  # 64KB default
+# Chunks are independent (nonces come from their position), so runs of them are sealed and
+# opened as batches on several crypto workers at once
+STREAM_BATCH_CHUNKS = int(os.getenv("STREAM_BATCH_CHUNKS", "16"))  # Chunks per crypto task
+STREAM_PARALLEL_BATCHES = int(os.getenv("STREAM_PARALLEL_BATCHES", str(min(4, os.cpu_count() or 1))))  # Batches in flight per file
+STREAM_NONCE_PREFIX_SIZE = 7
+STREAM_TAG_SIZE = 16
+STREAM_HEADER_FORMATS = {
+    2: f">4sBBI{STREAM_NONCE_PREFIX_SIZE}s",
+    3: f">4sBBBBI{STREAM_NONCE_PREFIX_SIZE}s"
+}
+STREAM_HEADER_FORMAT = STREAM_HEADER_FORMATS[STREAM_VERSION]
+STREAM_HEADER_SIZE = struct.calcsize(STREAM_HEADER_FORMAT)  # Headers written now; never shorter than older ones
+STREAM_INDEX_ENTRY_FORMAT = f">I{STREAM_TAG_SIZE}s"
+STREAM_INDEX_ENTRY_SIZE = struct.calcsize(STREAM_INDEX_ENTRY_FORMAT)
+STREAM_TRAILER_FORMAT = ">QIQ4s"
+STREAM_TRAILER_SIZE = struct.calcsize(STREAM_TRAILER_FORMAT)
+
+# Header flag: chunks are keyed by a random data key that is wrapped per reader
+# (see wrap_data_key) instead of being the KEM shared secret itself
+STREAM_FLAG_WRAPPED_KEY = 0x01
+# Header flag: every chunk is a zstd frame, decompressed after it is opened
+STREAM_FLAG_ZSTD = 0x02
+
+# === Data Key Wrapping ===
+# wrapped key | holder (u8) | Kyber ciphertext | nonce | AES-GCM(data key), holder as associated data
+DATA_KEY_SIZE = 32
+WRAP_NONCE_SIZE = 12
+KEY_HOLDER_SERVER = 0  # Wrapped to the server keypair
+KEY_HOLDER_RECIPIENT = 1  # Wrapped to the recipient's own Kyber key
+
+# Server keypairs used to protect files at rest
+KEYS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "keys")
+
 def encrypt_file_for_user(data: bytes, recipient_kyber_public: bytes, 
                          sender_dilithium_private: bytes) -> Tuple[bytes, bytes, bytes, bytes]:
     """
@@ -17,8 +75,7 @@ def encrypt_file_for_user(data: bytes, recipient_kyber_public: bytes,
     Returns: (encrypted_data, ciphertext, signature, nonce)
     """
     # 1) Encapsulate a shared secret to recipient using their Kyber public key
-    kem = oqs.KeyEncapsulation(KEM_ALGO)
-    ciphertext, shared_secret = kem.encap_secret(recipient_kyber_public)
+    ciphertext, shared_secret = encapsulator(KEM_ALGO).encap_secret(recipient_kyber_public)
 
     # 2) Use shared secret as AES-GCM key to encrypt the file
     nonce = os.urandom(12)
@@ -26,8 +83,7 @@ def encrypt_file_for_user(data: bytes, recipient_kyber_public: bytes,
     encrypted_data = aesgcm.encrypt(nonce, data, None)
 
     # 3) Sign the encrypted data with sender's Dilithium private key
-    sig = oqs.Signature(SIG_ALGO, secret_key=sender_dilithium_private)
-    signature = sig.sign(encrypted_data)
+    signature = _signer(sender_dilithium_private).sign(encrypted_data)
 
     return encrypted_data, ciphertext, signature, nonce
 
@@ -42,12 +98,10 @@ def decrypt_file_for_user(encrypted_data: bytes, ciphertext: bytes,
     """
     try:
         # 1) Decapsulate shared secret using recipient's Kyber private key
-        kem = oqs.KeyEncapsulation(KEM_ALGO, secret_key=recipient_kyber_private)
-        shared_secret = kem.decap_secret(ciphertext)
+        shared_secret = _decapsulator(recipient_kyber_private).decap_secret(ciphertext)
 
         # 2) Verify signature on encrypted data using sender's Dilithium public key
-        sig = oqs.Signature(SIG_ALGO)
-        if not sig.verify(encrypted_data, signature, sender_dilithium_public):
+        if not verifier(SIG_ALGO).verify(encrypted_data, signature, sender_dilithium_public):
             return None
 
         # 3) Decrypt AES-GCM encrypted file with shared secret
@@ -59,21 +113,288 @@ def decrypt_file_for_user(encrypted_data: bytes, ciphertext: bytes,
         print(f"Decryption error: {e}")
         return None
 
-def encode_metadata(ciphertext: bytes, signature: bytes, nonce: bytes, 
-                   sender_public_key: bytes) -> dict:
-    """Encode binary data to base64 for JSON transmission"""
-    return {
-        "ciphertext": base64.b64encode(ciphertext).decode(),
-        "signature": base64.b64encode(signature).decode(),
-        "nonce": base64.b64encode(nonce).decode(),
-        "sender_public_key": base64.b64encode(sender_public_key).decode()
-    }
-
-def decode_metadata(metadata: dict) -> Tuple[bytes, bytes, bytes, bytes]:
-    """Decode base64 strings back to binary data"""
-    return (
-        base64.b64decode(metadata["ciphertext"]),
-        base64.b64decode(metadata["signature"]),
-        base64.b64decode(metadata["nonce"]),
-        base64.b64decode(metadata["sender_public_key"])
-    )
\ No newline at end of file
+@lru_cache(maxsize=1)
+def load_server_keys() -> dict:
+    """Load the server's Kyber/Dilithium keypairs from the keys directory"""
+    keys = {}
+    for name in ("kem_public", "kem_secret", "sig_public", "sig_secret"):
+        with open(os.path.join(KEYS_DIR, f"{name}.key"), "rb") as f:
+            keys[name] = f.read()
+    return keys
+
+def _is_server_secret(secret_key: bytes, name: str) -> bool:
+    try:
+        return secret_key == load_server_keys()[name]
+    except OSError:
+        return False
+
+def _decapsulator(kyber_private: bytes, algorithm: str = KEM_ALGO):
+    """Decapsulation context; the server key's is reused per thread, user keys get a fresh one"""
+    return decapsulator(algorithm, kyber_private, reuse=_is_server_secret(kyber_private, "kem_secret"))
+
+def _signer(dilithium_private: bytes):
+    """Signing context; the server key's is reused per thread, user keys get a fresh one"""
+    return signer(SIG_ALGO, dilithium_private, reuse=_is_server_secret(dilithium_private, "sig_secret"))
+
+def wrap_data_key(data_key: bytes, kyber_public: bytes, holder: int) -> bytes:
+    """Wrap a data key to a Kyber public key; holder records whose key that is"""
+    ciphertext, shared_secret = encapsulator(KEM_ALGO).encap_secret(kyber_public)
+    nonce = os.urandom(WRAP_NONCE_SIZE)
+    holder_byte = struct.pack(">B", holder)
+    return holder_byte + ciphertext + nonce + AESGCM(shared_secret).encrypt(nonce, data_key, holder_byte)
+
+def unwrap_data_key(wrapped_key: bytes, kyber_private: bytes, algorithm: str = KEM_ALGO) -> bytes:
+    """Recover a data key; raises if kyber_private is not the key it was wrapped to"""
+    ciphertext_size = kem_details(algorithm)["length_ciphertext"]
+    holder_byte = wrapped_key[:1]
+    ciphertext = wrapped_key[1:1 + ciphertext_size]
+    nonce = wrapped_key[1 + ciphertext_size:1 + ciphertext_size + WRAP_NONCE_SIZE]
+    shared_secret = _decapsulator(kyber_private, algorithm).decap_secret(ciphertext)
+    return AESGCM(shared_secret).decrypt(nonce, wrapped_key[1 + ciphertext_size + WRAP_NONCE_SIZE:], holder_byte)
+
+def wrapped_key_holder(wrapped_key: bytes) -> int:
+    return wrapped_key[0]
+
+def rewrap_data_key(wrapped_key: bytes, kyber_private: bytes, kyber_public: bytes, holder: int) -> bytes:
+    """Move a wrapped data key to another Kyber key without touching the payload"""
+    return wrap_data_key(unwrap_data_key(wrapped_key, kyber_private), kyber_public, holder)
+
+def _stream_nonce(prefix: bytes, counter: int, final: bool) -> bytes:
+    """Build a STREAM nonce: prefix || big-endian chunk counter || last-chunk flag"""
+    return prefix + struct.pack(">IB", counter, 1 if final else 0)
+
+def build_stream_header(chunk_size: int, nonce: bytes, flags: int = 0) -> bytes:
+    """Pack the fixed-size header of a stream file"""
+    return struct.pack(
+        STREAM_HEADER_FORMAT, STREAM_MAGIC, STREAM_VERSION, flags,
+        KEM_ALGORITHM_IDS[KEM_ALGO], SIG_ALGORITHM_IDS[SIG_ALGO], chunk_size, nonce
+    )
+
+def _algorithm_name(algorithm_ids: dict, algorithm_id: int) -> str:
+    for name, known_id in algorithm_ids.items():
+        if known_id == algorithm_id:
+            return name
+    raise ValueError(f"Unknown algorithm id {algorithm_id}")
+
+class StreamHeader:
+    """Parsed stream header; data may run past the header, which is cut to its version's size"""
+
+    def __init__(self, data: bytes):
+        header_format = STREAM_HEADER_FORMATS.get(data[4]) if len(data) > 4 else None
+        if data[:len(STREAM_MAGIC)] != STREAM_MAGIC or header_format is None:
+            raise ValueError("Unsupported stream format")
+        self.size = struct.calcsize(header_format)
+        if len(data) < self.size:
+            raise ValueError("Truncated stream file")
+        self.raw = bytes(data[:self.size])
+        fields = struct.unpack(header_format, self.raw)
+        self.version, self.flags = fields[1], fields[2]
+        self.chunk_size, self.nonce = fields[-2], fields[-1]
+        if self.version == 2:
+            self.kem_algorithm, self.sig_algorithm = "Kyber512", "Dilithium2"
+        else:
+            self.kem_algorithm = _algorithm_name(KEM_ALGORITHM_IDS, fields[3])
+            self.sig_algorithm = _algorithm_name(SIG_ALGORITHM_IDS, fields[4])
+
+def build_stream_trailer(index_entries: List[Tuple[int, bytes]], plaintext_size: int) -> bytes:
+    """Pack the chunk index and trailer from (sealed length, tag) pairs"""
+    index = b"".join(struct.pack(STREAM_INDEX_ENTRY_FORMAT, length, tag) for length, tag in index_entries)
+    index_offset = STREAM_HEADER_SIZE + sum(length for length, _ in index_entries)
+    return index + struct.pack(STREAM_TRAILER_FORMAT, plaintext_size, len(index_entries), index_offset, STREAM_INDEX_MAGIC)
+
+def sign_stream(header: bytes, trailer: bytes, sender_dilithium_private: bytes) -> bytes:
+    """Sign the header, chunk index and trailer with the sender's Dilithium key"""
+    return _signer(sender_dilithium_private).sign(hashlib.sha256(header + trailer).digest())
+
+class StreamCipher:
+    """Seals and opens individual chunks of a stream by position"""
+
+    def __init__(self, shared_secret: bytes, header: bytes):
+        self.header = header
+        self.nonce = header[-STREAM_NONCE_PREFIX_SIZE:]
+        self._aesgcm = AESGCM(shared_secret)
+
+    @classmethod
+    def from_kem(cls, header: bytes, ciphertext: bytes, recipient_kyber_private: bytes) -> "StreamCipher":
+        """Recover the stream key from its wrapped key (or, for older files, KEM ciphertext)"""
+        parsed = StreamHeader(header)
+        if parsed.flags & STREAM_FLAG_WRAPPED_KEY:
+            return cls(unwrap_data_key(ciphertext, recipient_kyber_private, parsed.kem_algorithm), parsed.raw)
+        return cls(_decapsulator(recipient_kyber_private, parsed.kem_algorithm).decap_secret(ciphertext), parsed.raw)
+
+    def seal(self, number: int, chunk: bytes, final: bool) -> bytes:
+        return self._aesgcm.encrypt(_stream_nonce(self.nonce, number, final), chunk, self.header)
+
+    def open(self, number: int, sealed: bytes, final: bool) -> bytes:
+        return self._aesgcm.decrypt(_stream_nonce(self.nonce, number, final), sealed, self.header)
+
+def create_stream_key(recipient_kyber_public: bytes, holder: int = KEY_HOLDER_SERVER) -> Tuple[bytes, bytes]:
+    """
+    Wrap a fresh stream data key to the recipient.
+
+    Returns: (wrapped_key, nonce) - the data key itself is not kept; holders of the
+    Kyber private key recover it with StreamCipher.from_kem. Use STREAM_FLAG_WRAPPED_KEY
+    in the stream header.
+    """
+    return wrap_data_key(os.urandom(DATA_KEY_SIZE), recipient_kyber_public, holder), os.urandom(STREAM_NONCE_PREFIX_SIZE)
+
+class StreamEncryptor:
+    """
+    Chunked AES-GCM encryption (STREAM construction) keyed by a random data key
+    that is Kyber-wrapped to the recipient.
+
+    Each chunk is sealed independently with a nonce derived from its position, and the
+    last chunk is flagged so truncation is detected. The header is bound to every chunk
+    as associated data. The chunk index records every GCM tag, so signing the header
+    and index with the sender's Dilithium key covers the whole file. With a compressor,
+    chunks are compressed before they are sealed.
+    """
+
+    def __init__(self, recipient_kyber_public: bytes, sender_dilithium_private: bytes,
+                 chunk_size: int = STREAM_CHUNK_SIZE, holder: int = KEY_HOLDER_SERVER,
+                 compressor: Optional[ChunkCompressor] = None):
+        # 1) Wrap a random data key to recipient using their Kyber public key
+        data_key = os.urandom(DATA_KEY_SIZE)
+        self.ciphertext = wrap_data_key(data_key, recipient_kyber_public, holder)
+        self._data_key = data_key
+
+        # 2) Data key keys the per-chunk AES-GCM
+        self.chunk_size = chunk_size
+        self.nonce = os.urandom(STREAM_NONCE_PREFIX_SIZE)
+        self.compressor = compressor
+        flags = STREAM_FLAG_WRAPPED_KEY | (STREAM_FLAG_ZSTD if compressor else 0)
+        self.header = build_stream_header(chunk_size, self.nonce, flags)
+        self.plaintext_size = 0
+        self._cipher = StreamCipher(data_key, self.header)
+        self._sender_dilithium_private = sender_dilithium_private
+        self._index = []
+        self._trailer = None
+
+    def encrypt_chunk(self, chunk: bytes, final: bool = False) -> bytes:
+        """Encrypt the next plaintext chunk (at most chunk_size bytes)"""
+        sealed = self.seal_chunks(len(self._index), [chunk], final)
+        self.append_sealed([chunk], sealed, final)
+        return sealed[0]
+
+    def seal_chunks(self, number: int, chunks: List[bytes], final: bool = False) -> List[bytes]:
+        """
+        Seal consecutive chunks starting at chunk number (the last one is final if final is set).
+        Touches no encryptor state, so several batches can be sealed at once on different
+        workers; hand the results to append_sealed in order.
+        """
+        for position, chunk in enumerate(chunks):
+            if len(chunk) > self.chunk_size:
+                raise ValueError("Chunk larger than stream chunk size")
+            if len(chunk) != self.chunk_size and not (final and position == len(chunks) - 1):
+                raise ValueError("Only the final chunk may be short")
+        return [
+            self._cipher.seal(
+                number + position,
+                self.compressor.compress(chunk) if self.compressor else chunk,
+                final and position == len(chunks) - 1
+            )
+            for position, chunk in enumerate(chunks)
+        ]
+
+    def append_sealed(self, chunks: List[bytes], sealed_chunks: List[bytes], final: bool = False) -> None:
+        """Record the next sealed batch in the chunk index"""
+        if self._trailer is not None:
+            raise ValueError("Stream already finalized")
+        for chunk, sealed in zip(chunks, sealed_chunks):
+            self._index.append((len(sealed), sealed[-STREAM_TAG_SIZE:]))
+            self.plaintext_size += len(chunk)
+        if final:
+            self._trailer = build_stream_trailer(self._index, self.plaintext_size)
+
+    def wrap_key(self, recipient_kyber_public: bytes, holder: int = KEY_HOLDER_SERVER) -> bytes:
+        """Wrap this stream's data key for one more recipient (envelope encryption)"""
+        return wrap_data_key(self._data_key, recipient_kyber_public, holder)
+
+    def trailer(self) -> bytes:
+        """Chunk index and trailer, to be written after the final chunk"""
+        if self._trailer is None:
+            raise ValueError("Final chunk has not been encrypted")
+        return self._trailer
+
+    def finalize(self) -> bytes:
+        """Sign the header, chunk index and trailer with the sender's Dilithium key"""
+        # 3) Sign the encrypted stream with sender's Dilithium private key
+        return sign_stream(self.header, self.trailer(), self._sender_dilithium_private)
+
+class StreamIndex:
+    """Parsed header, chunk index and trailer of a stream file"""
+
+    def __init__(self, header: bytes, index: bytes, trailer: bytes):
+        parsed = StreamHeader(header)
+        header = parsed.raw
+        self.version, self.flags, self.chunk_size, self.nonce = parsed.version, parsed.flags, parsed.chunk_size, parsed.nonce
+        self.kem_algorithm, self.sig_algorithm = parsed.kem_algorithm, parsed.sig_algorithm
+        self.plaintext_size, self.chunk_count, index_offset, index_magic = struct.unpack(STREAM_TRAILER_FORMAT, trailer)
+        if index_magic != STREAM_INDEX_MAGIC or len(index) != self.chunk_count * STREAM_INDEX_ENTRY_SIZE:
+            raise ValueError("Corrupt stream index")
+
+        self.header = header
+        self.signed_digest = hashlib.sha256(header + index + trailer).digest()
+        self.offsets = []
+        self.lengths = []
+        self.tags = []
+        offset = parsed.size
+        for length, tag in struct.iter_unpack(STREAM_INDEX_ENTRY_FORMAT, index):
+            self.offsets.append(offset)
+            self.lengths.append(length)
+            self.tags.append(tag)
+            offset += length
+        if offset != index_offset:
+            raise ValueError("Corrupt stream index")
+
+def locate_stream_index(trailer: bytes, file_size: int) -> Tuple[int, int]:
+    """Offset and length of the chunk index of a stream file, given its trailer and total size"""
+    if file_size < STREAM_HEADER_SIZE + STREAM_TRAILER_SIZE:
+        raise ValueError("Truncated stream file")
+    _, chunk_count, index_offset, _ = struct.unpack(STREAM_TRAILER_FORMAT, trailer)
+    if chunk_count == 0 or index_offset + chunk_count * STREAM_INDEX_ENTRY_SIZE + STREAM_TRAILER_SIZE != file_size:
+        raise ValueError("Corrupt stream index")
+    return index_offset, chunk_count * STREAM_INDEX_ENTRY_SIZE
+
+def verify_stream_signature(index: StreamIndex, signature: bytes, sender_dilithium_public: bytes) -> bool:
+    """Verify the sender's Dilithium signature over a stream file's header and index"""
+    return verifier(index.sig_algorithm).verify(index.signed_digest, signature, sender_dilithium_public)
+
+class ChunkIntegrityError(ValueError):
+    """A stored chunk does not match the signed stream index or fails authentication"""
+
+class StreamDecryptor:
+    """Random-access counterpart of StreamEncryptor"""
+
+    def __init__(self, index: StreamIndex, ciphertext: bytes, recipient_kyber_private: bytes):
+        # Decapsulate shared secret using recipient's Kyber private key
+        self.index = index
+        self._cipher = StreamCipher.from_kem(index.header, ciphertext, recipient_kyber_private)
+
+    def check_chunk(self, number: int, sealed: bytes) -> None:
+        """Check a sealed chunk's length and tag against the signed index, before decrypting it"""
+        if len(sealed) != self.index.lengths[number] or sealed[-STREAM_TAG_SIZE:] != self.index.tags[number]:
+            raise ChunkIntegrityError(f"Chunk {number} does not match stream index")
+
+    def decrypt_chunk(self, number: int, sealed: bytes) -> bytes:
+        """Authenticate and decrypt chunk number, checking it against the signed index"""
+        self.check_chunk(number, sealed)
+        final = number == self.index.chunk_count - 1
+        try:
+            plaintext = self._cipher.open(number, sealed, final)
+        except InvalidTag:
+            raise ChunkIntegrityError(f"Chunk {number} failed authentication")
+        if self.index.flags & STREAM_FLAG_ZSTD:
+            expected = self.index.plaintext_size - number * self.index.chunk_size if final else self.index.chunk_size
+            plaintext = decompress_chunk(plaintext, self.index.chunk_size)
+            if len(plaintext) != expected:
+                raise ChunkIntegrityError(f"Chunk {number} has the wrong size")
+        return plaintext
+
+    def decrypt_chunks(self, number: int, sealed_chunks: List[bytes]) -> List[bytes]:
+        """Decrypt consecutive chunks starting at chunk number; batches may run concurrently"""
+        return [self.decrypt_chunk(number + position, sealed) for position, sealed in enumerate(sealed_chunks)]
+
+def is_stream_header(data: bytes) -> bool:
+    """Check whether the first bytes of a blob are the chunked stream magic"""
+    return data[:len(STREAM_MAGIC)] == STREAM_MAGIC
@@ -1,29 +1,53 @@
-from sqlalchemy.orm import Session
-from models import SessionLocal, User as UserModel, SharedMetadata as SharedMetadataModel
-from typing import Optional, List
+from sqlalchemy import delete, select, tuple_, union, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import joinedload, selectinload, undefer_group
+from principal_cache import invalidate_principal
+from db_writer import get_db_writer
+from models import (
+    AsyncSessionLocal, User as UserModel, SharedMetadata as SharedMetadataModel,
+    UploadSession as UploadSessionModel, Blob as BlobModel
+)
+from typing import Optional, List, Set, Tuple
+from collections import Counter
+from datetime import datetime
+import base64
+import binascii
 import os
 
-def get_db():
+async def get_db():
     """Get database session"""
-    db = SessionLocal()
-    try:
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 # User model
 class User:
-    def __init__(self, username: str, email: str, password_hash: str, id: Optional[int] = None):
+    # Stored PQC key fields: public keys plus password-wrapped secret keys (all base64)
+    KEY_FIELDS = (
+        "kem_public_key", "kem_secret_key", "kem_salt", "kem_nonce",
+        "sig_public_key", "sig_secret_key", "sig_salt", "sig_nonce"
+    )
+
+    def __init__(self, username: str, email: str, password_hash: str, id: Optional[int] = None,
+                 keys: Optional[dict] = None):
         self.username = username
         self.email = email
         self.password_hash = password_hash
         self.id = id
+        keys = keys or {}
+        for field in self.KEY_FIELDS:
+            setattr(self, field, keys.get(field))
+
+    @property
+    def has_keys(self) -> bool:
+        return all(getattr(self, field) for field in self.KEY_FIELDS)
 
     def to_dict(self):
         return {
             "username": self.username,
             "email": self.email,
-            "password_hash": self.password_hash
+            "password_hash": self.password_hash,
+            "kem_public_key": self.kem_public_key,
+            "sig_public_key": self.sig_public_key
         }
 
     @classmethod
@@ -32,14 +56,17 @@ class User:
             username=data["username"],
             email=data["email"],
             password_hash=data["password_hash"],
-            id=data.get("id")
+            id=data.get("id"),
+            keys=data
         )
 
 # File model
 class FileRecord:
     def __init__(self, file_id: str, filename: str, sender_username: str, 
                  recipient_username: str, encrypted_data: bytes, ciphertext: bytes,
-                 signature: bytes, nonce: bytes, sender_public_key: bytes, id: Optional[int] = None):
+                 signature: bytes, nonce: bytes, sender_public_key: bytes, id: Optional[int] = None,
+                 created_at: Optional[datetime] = None, is_read: bool = False, file_size: Optional[int] = None,
+                 blob_id: Optional[str] = None, verified_digest: Optional[bytes] = None):
         self.file_id = file_id
         self.filename = filename
         self.sender_username = sender_username
@@ -50,6 +77,13 @@ class FileRecord:
         self.nonce = nonce
         self.sender_public_key = sender_public_key
         self.id = id
+        self.created_at = created_at
+        self.is_read = is_read
+        self.file_size = file_size
+        # Stored payload, shared by every recipient of a multi-recipient upload; rows from
+        # before blob ids existed store their payload under the file_id
+        self.blob_id = blob_id or file_id
+        self.verified_digest = verified_digest
 
     def to_dict(self):
         return {
@@ -61,7 +95,10 @@ class FileRecord:
             "ciphertext": self.ciphertext,
             "signature": self.signature,
             "nonce": self.nonce,
-            "sender_public_key": self.sender_public_key
+            "sender_public_key": self.sender_public_key,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "is_read": self.is_read,
+            "file_size": self.file_size
         }
 
     @classmethod
@@ -79,183 +116,513 @@ class FileRecord:
             id=data.get("id")
         )
 
+# Stored payload, referenced by one or more SharedMetadata rows
+class Blob:
+    def __init__(self, blob_id: str, sender_username: str, content_key: Optional[str] = None,
+                 size: Optional[int] = None, sender_key: Optional[bytes] = None, ref_count: int = 0,
+                 created_at: Optional[datetime] = None):
+        self.blob_id = blob_id
+        self.sender_username = sender_username
+        self.content_key = content_key
+        self.size = size
+        self.sender_key = sender_key
+        self.ref_count = ref_count
+        self.created_at = created_at
+
+    def to_dict(self):
+        return {
+            "blob_id": self.blob_id,
+            "sender_username": self.sender_username,
+            "size": self.size,
+            "ref_count": self.ref_count,
+            "created_at": self.created_at.isoformat() if self.created_at else None
+        }
+
+class BlobUnavailable(Exception):
+    """The referenced blob was released (its reference count reached zero) and may be collected"""
+
+# Listing entry: only what the inbox and sent views show, no crypto material
+class FileSummary:
+    def __init__(self, file_id: str, filename: str, counterpart_username: str, file_size: Optional[int],
+                 created_at: Optional[datetime], is_read: bool, id: Optional[int] = None):
+        self.file_id = file_id
+        self.filename = filename
+        self.counterpart_username = counterpart_username
+        self.file_size = file_size
+        self.created_at = created_at
+        self.is_read = is_read
+        self.id = id
+
+    def to_dict(self):
+        return {
+            "file_id": self.file_id,
+            "filename": self.filename,
+            "counterpart_username": self.counterpart_username,
+            "file_size": self.file_size,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "is_read": self.is_read
+        }
+
+# Upload session model
+class UploadSession:
+    def __init__(self, upload_id: str, filename: str, sender_username: str, recipient_username: str,
+                 file_size: int, part_size: int, chunk_size: int, encrypted_key: bytes, nonce: bytes,
+                 created_at: Optional[datetime] = None):
+        self.upload_id = upload_id
+        self.filename = filename
+        self.sender_username = sender_username
+        self.recipient_username = recipient_username
+        self.file_size = file_size
+        self.part_size = part_size
+        self.chunk_size = chunk_size
+        self.encrypted_key = encrypted_key
+        self.nonce = nonce
+        self.created_at = created_at
+
+    @property
+    def part_count(self) -> int:
+        # An empty file is still uploaded as one (empty) part
+        return max(1, -(-self.file_size // self.part_size))
+
+    def to_dict(self):
+        return {
+            "upload_id": self.upload_id,
+            "filename": self.filename,
+            "recipient_username": self.recipient_username,
+            "file_size": self.file_size,
+            "part_size": self.part_size,
+            "part_count": self.part_count
+        }
+
 # Database operations
-async def find_user_by_email(db: Session, email: str) -> Optional[User]:
+def _to_user(user: UserModel) -> User:
+    return User(
+        username=user.username,
+        email=user.email,
+        password_hash=user.hashed_password,
+        id=user.id,
+        keys={field: getattr(user, field) for field in User.KEY_FIELDS}
+    )
+
+async def find_user_by_email(db: AsyncSession, email: str) -> Optional[User]:
     """Find user by email"""
-    user = db.query(UserModel).filter(UserModel.email == email).first()
+    user = (await db.execute(select(UserModel).filter(UserModel.email == email))).scalars().first()
     if user:
-        return User(
-            username=user.username,
-            email=user.email,
-            password_hash=user.hashed_password,
-            id=user.id
-        )
+        return _to_user(user)
     return None
 
-async def find_user_by_username(db: Session, username: str) -> Optional[User]:
+async def find_user_by_username(db: AsyncSession, username: str) -> Optional[User]:
     """Find user by username"""
-    user = db.query(UserModel).filter(UserModel.username == username).first()
+    user = (await db.execute(select(UserModel).filter(UserModel.username == username))).scalars().first()
     if user:
-        return User(
-            username=user.username,
-            email=user.email,
-            password_hash=user.hashed_password,
-            id=user.id
-        )
+        return _to_user(user)
     return None
 
-async def create_user(db: Session, user: User) -> User:
-    """Create a new user"""
+async def find_users_by_username(db: AsyncSession, usernames: List[str]) -> List[User]:
+    """Find several users by username in one query"""
+    users = (await db.execute(select(UserModel).filter(UserModel.username.in_(usernames)))).scalars().all()
+    return [_to_user(user) for user in users]
+
+async def _insert_user(db: AsyncSession, user: User) -> User:
     db_user = UserModel(
         username=user.username,
         email=user.email,
-        hashed_password=user.password_hash
+        hashed_password=user.password_hash,
+        **{field: getattr(user, field) for field in User.KEY_FIELDS}
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
-    return User(
-        username=db_user.username,
-        email=db_user.email,
-        password_hash=db_user.hashed_password,
-        id=db_user.id
-    )
+    await db.flush()
+    return _to_user(db_user)
+
+async def create_user(user: User) -> User:
+    """Create a new user (group-committed by the database writer)"""
+    return await get_db_writer().submit(lambda db: _insert_user(db, user))
+
+async def set_user_keys(db: AsyncSession, email: str, keys: dict) -> None:
+    """Store a user's PQC keys (public keys and password-wrapped secret keys)"""
+    user = (await db.execute(select(UserModel).filter(UserModel.email == email))).scalars().first()
+    if user:
+        for field in User.KEY_FIELDS:
+            setattr(user, field, keys[field])
+        await db.commit()
+    invalidate_principal(email)
+
+async def update_user_password(db: AsyncSession, email: str, password_hash: str) -> None:
+    """Replace a user's password hash and drop their cached principal"""
+    user = (await db.execute(select(UserModel).filter(UserModel.email == email))).scalars().first()
+    if user:
+        user.hashed_password = password_hash
+        await db.commit()
+    invalidate_principal(email)
+
+async def delete_user(db: AsyncSession, email: str) -> None:
+    """Delete a user and drop their cached principal"""
+    await db.execute(delete(UserModel).filter(UserModel.email == email))
+    await db.commit()
+    invalidate_principal(email)
 
-async def get_all_users(db: Session, exclude_username: str = None) -> List[User]:
+async def get_all_users(db: AsyncSession, exclude_username: str = None) -> List[User]:
     """Get all users, optionally excluding one"""
-    query = db.query(UserModel)
+    query = select(UserModel)
     if exclude_username:
         query = query.filter(UserModel.username != exclude_username)
-    users = query.all()
-    return [
-        User(
-            username=user.username,
-            email=user.email,
-            password_hash=user.hashed_password,
-            id=user.id
-        ) for user in users
-    ]
+    users = (await db.execute(query)).scalars().all()
+    return [_to_user(user) for user in users]
 
-async def create_file_record(db: Session, file_record: FileRecord) -> FileRecord:
-    """Create a new file record"""
+def _binary(value) -> Optional[bytes]:
+    """Raw bytes of a crypto column; rows not yet rewritten by migrate_db still hold base64 text"""
+    if not isinstance(value, str):
+        return value
+    try:
+        return base64.b64decode(value, validate=True)
+    except binascii.Error:
+        return value.encode()
+
+async def create_file_records(file_records: List[FileRecord], new_blob: Optional[Blob] = None) -> List[FileRecord]:
+    """
+    Create several file records (e.g. one per recipient of a blob) in one transaction,
+    group-committed by the database writer.
+
+    Each record takes a reference on its blob. new_blob, if given, is stored in the same
+    transaction; other blobs must still be referenced, otherwise BlobUnavailable is raised.
+    """
+    return await get_db_writer().submit(lambda db: _insert_file_records(db, file_records, new_blob))
+
+async def _insert_file_records(db: AsyncSession, file_records: List[FileRecord],
+                               new_blob: Optional[Blob]) -> List[FileRecord]:
     # For now, we'll store file records in the SharedMetadata table
     # This is a simplified approach - you might want to create a separate Files table
-    sender = db.query(UserModel).filter(UserModel.username == file_record.sender_username).first()
-    recipient = db.query(UserModel).filter(UserModel.username == file_record.recipient_username).first()
+    usernames = {record.sender_username for record in file_records} | {record.recipient_username for record in file_records}
+    users = {
+        user.username: user
+        for user in (await db.execute(select(UserModel).filter(UserModel.username.in_(usernames)))).scalars().all()
+    }
     
-    if not sender or not recipient:
-        raise ValueError("Sender or recipient not found")
+    rows = []
+    for file_record in file_records:
+        sender = users.get(file_record.sender_username)
+        recipient = users.get(file_record.recipient_username)
+        if not sender or not recipient:
+            raise ValueError("Sender or recipient not found")
+        
+        rows.append(SharedMetadataModel(
+            file_id=file_record.file_id,
+            blob_id=file_record.blob_id,
+            encrypted_key=file_record.ciphertext,
+            nonce=file_record.nonce,
+            signature=file_record.signature,
+            sender_public_key=file_record.sender_public_key,
+            sender_id=sender.id,
+            recipient_id=recipient.id,
+            encrypted_metadata=file_record.filename,  # Store filename as metadata for now
+            file_size=file_record.file_size
+        ))
     
-    shared_metadata = SharedMetadataModel(
-        file_id=file_record.file_id,
-        encrypted_key=file_record.ciphertext.decode('utf-8') if isinstance(file_record.ciphertext, bytes) else str(file_record.ciphertext),
-        nonce=file_record.nonce.decode('utf-8') if isinstance(file_record.nonce, bytes) else str(file_record.nonce),
-        signature=file_record.signature.decode('utf-8') if isinstance(file_record.signature, bytes) else str(file_record.signature),
-        sender_public_key=file_record.sender_public_key.decode('utf-8') if isinstance(file_record.sender_public_key, bytes) else str(file_record.sender_public_key),
-        sender_id=sender.id,
-        recipient_id=recipient.id,
-        encrypted_metadata=file_record.filename  # Store filename as metadata for now
-    )
+    references = Counter(file_record.blob_id for file_record in file_records)
+    if new_blob:
+        db.add(BlobModel(
+            id=new_blob.blob_id,
+            sender_id=users[new_blob.sender_username].id,
+            content_key=new_blob.content_key,
+            size=new_blob.size,
+            sender_key=new_blob.sender_key,
+            ref_count=references.pop(new_blob.blob_id, 0)
+        ))
+    for blob_id, count in references.items():
+        # A released blob may already be queued for collection, so it is never revived
+        result = await db.execute(
+            update(BlobModel)
+            .filter(BlobModel.id == blob_id, BlobModel.ref_count > 0)
+            .values(ref_count=BlobModel.ref_count + count, updated_at=datetime.utcnow())
+        )
+        if result.rowcount != 1:
+            raise BlobUnavailable(blob_id)
     
-    db.add(shared_metadata)
-    db.commit()
-    db.refresh(shared_metadata)
+    db.add_all(rows)
+    await db.flush()
     
+    return [
+        FileRecord(
+            file_id=shared_metadata.file_id,
+            filename=shared_metadata.encrypted_metadata,
+            sender_username=file_record.sender_username,
+            recipient_username=file_record.recipient_username,
+            encrypted_data=file_record.encrypted_data,
+            ciphertext=file_record.ciphertext,
+            signature=file_record.signature,
+            nonce=file_record.nonce,
+            sender_public_key=file_record.sender_public_key,
+            id=shared_metadata.id,
+            created_at=shared_metadata.created_at,
+            file_size=shared_metadata.file_size,
+            blob_id=shared_metadata.blob_id
+        ) for file_record, shared_metadata in zip(file_records, rows)
+    ]
+
+async def create_file_record(file_record: FileRecord, new_blob: Optional[Blob] = None) -> FileRecord:
+    """Create a new file record"""
+    return (await create_file_records([file_record], new_blob))[0]
+
+def _to_file_record(shared_metadata: SharedMetadataModel) -> FileRecord:
+    """Build a FileRecord from a SharedMetadata row with sender and recipient loaded"""
     return FileRecord(
         file_id=shared_metadata.file_id,
         filename=shared_metadata.encrypted_metadata,
-        sender_username=file_record.sender_username,
-        recipient_username=file_record.recipient_username,
-        encrypted_data=file_record.encrypted_data,
-        ciphertext=file_record.ciphertext,
-        signature=file_record.signature,
-        nonce=file_record.nonce,
-        sender_public_key=file_record.sender_public_key,
-        id=shared_metadata.id
+        sender_username=shared_metadata.sender.username if shared_metadata.sender else "",
+        recipient_username=shared_metadata.recipient.username if shared_metadata.recipient else "",
+        encrypted_data=b"",  # This would need to be stored separately
+        ciphertext=_binary(shared_metadata.encrypted_key),
+        signature=_binary(shared_metadata.signature),
+        nonce=_binary(shared_metadata.nonce),
+        sender_public_key=_binary(shared_metadata.sender_public_key),
+        id=shared_metadata.id,
+        created_at=shared_metadata.created_at,
+        is_read=bool(shared_metadata.is_read),
+        file_size=shared_metadata.file_size,
+        blob_id=shared_metadata.blob_id,
+        verified_digest=shared_metadata.verified_digest
+    )
+
+def _file_query():
+    """SharedMetadata query that loads sender, recipient and crypto material in the same statement"""
+    return select(SharedMetadataModel).options(
+        joinedload(SharedMetadataModel.sender), joinedload(SharedMetadataModel.recipient), undefer_group("crypto")
     )
 
-async def find_file_by_id(db: Session, file_id: str) -> Optional[FileRecord]:
+async def find_file_by_id(db: AsyncSession, file_id: str) -> Optional[FileRecord]:
     """Find file record by file_id"""
-    shared_metadata = db.query(SharedMetadataModel).filter(SharedMetadataModel.file_id == file_id).first()
+    query = _file_query().filter(SharedMetadataModel.file_id == file_id)
+    shared_metadata = (await db.execute(query)).scalars().first()
     if shared_metadata:
-        sender = db.query(UserModel).filter(UserModel.id == shared_metadata.sender_id).first()
-        recipient = db.query(UserModel).filter(UserModel.id == shared_metadata.recipient_id).first()
-        
-        return FileRecord(
-            file_id=shared_metadata.file_id,
-            filename=shared_metadata.encrypted_metadata,
-            sender_username=sender.username if sender else "",
-            recipient_username=recipient.username if recipient else "",
-            encrypted_data=b"",  # This would need to be stored separately or in a different table
-            ciphertext=shared_metadata.encrypted_key.encode('utf-8') if isinstance(shared_metadata.encrypted_key, str) else shared_metadata.encrypted_key,
-            signature=shared_metadata.signature.encode('utf-8') if isinstance(shared_metadata.signature, str) else shared_metadata.signature,
-            nonce=shared_metadata.nonce.encode('utf-8') if isinstance(shared_metadata.nonce, str) else shared_metadata.nonce,
-            sender_public_key=shared_metadata.sender_public_key.encode('utf-8') if isinstance(shared_metadata.sender_public_key, str) else shared_metadata.sender_public_key,
-            id=shared_metadata.id
-        )
+        return _to_file_record(shared_metadata)
     return None
 
-async def get_received_files(db: Session, username: str) -> List[FileRecord]:
-    """Get files received by a user"""
-    user = db.query(UserModel).filter(UserModel.username == username).first()
-    if not user:
-        return []
-    
-    shared_metadata_list = db.query(SharedMetadataModel).filter(SharedMetadataModel.recipient_id == user.id).all()
-    files = []
-    
-    for shared_metadata in shared_metadata_list:
-        sender = db.query(UserModel).filter(UserModel.id == shared_metadata.sender_id).first()
-        recipient = db.query(UserModel).filter(UserModel.id == shared_metadata.recipient_id).first()
-        
-        files.append(FileRecord(
-            file_id=shared_metadata.file_id,
-            filename=shared_metadata.encrypted_metadata,
-            sender_username=sender.username if sender else "",
-            recipient_username=recipient.username if recipient else "",
-            encrypted_data=b"",  # This would need to be stored separately
-            ciphertext=shared_metadata.encrypted_key.encode('utf-8') if isinstance(shared_metadata.encrypted_key, str) else shared_metadata.encrypted_key,
-            signature=shared_metadata.signature.encode('utf-8') if isinstance(shared_metadata.signature, str) else shared_metadata.signature,
-            nonce=shared_metadata.nonce.encode('utf-8') if isinstance(shared_metadata.nonce, str) else shared_metadata.nonce,
-            sender_public_key=shared_metadata.sender_public_key.encode('utf-8') if isinstance(shared_metadata.sender_public_key, str) else shared_metadata.sender_public_key,
-            id=shared_metadata.id
-        ))
-    
-    return files
+async def find_file_by_blob(db: AsyncSession, blob_id: str) -> Optional[FileRecord]:
+    """Any file record backed by blob_id (they share its nonce and signature)"""
+    query = _file_query().filter(SharedMetadataModel.blob_id == blob_id).limit(1)
+    shared_metadata = (await db.execute(query)).scalars().first()
+    if shared_metadata:
+        return _to_file_record(shared_metadata)
+    return None
 
-async def get_sent_files(db: Session, username: str) -> List[FileRecord]:
-    """Get files sent by a user"""
-    user = db.query(UserModel).filter(UserModel.username == username).first()
-    if not user:
-        return []
-    
-    shared_metadata_list = db.query(SharedMetadataModel).filter(SharedMetadataModel.sender_id == user.id).all()
-    files = []
+async def record_file_verified(db: AsyncSession, file_id: str, verified_digest: bytes) -> None:
+    """Remember that the file's blob and signature passed verification"""
+    await db.execute(
+        update(SharedMetadataModel).filter(SharedMetadataModel.file_id == file_id).values(verified_digest=verified_digest)
+    )
+    await db.commit()
+
+async def delete_file_record(db: AsyncSession, file_id: str) -> None:
+    """Delete a file record and drop its reference on the blob"""
+    shared_metadata = (await db.execute(
+        select(SharedMetadataModel).filter(SharedMetadataModel.file_id == file_id)
+    )).scalars().first()
+    if not shared_metadata:
+        return
+    await db.execute(
+        update(BlobModel)
+        .filter(BlobModel.id == (shared_metadata.blob_id or shared_metadata.file_id))
+        .values(ref_count=BlobModel.ref_count - 1, updated_at=datetime.utcnow())
+    )
+    await db.delete(shared_metadata)
+    await db.commit()
+
+def _to_blob(blob: BlobModel, sender_username: str) -> Blob:
+    return Blob(
+        blob_id=blob.id,
+        sender_username=sender_username,
+        content_key=blob.content_key,
+        size=blob.size,
+        sender_key=_binary(blob.sender_key),
+        ref_count=blob.ref_count,
+        created_at=blob.created_at
+    )
+
+async def find_blob_sender_key(db: AsyncSession, blob_id: str) -> Optional[bytes]:
+    """The data key of a blob wrapped to its sender (None for blobs stored without one)"""
+    sender_key = (await db.execute(select(BlobModel.sender_key).filter(BlobModel.id == blob_id))).scalar()
+    return _binary(sender_key)
+
+async def find_blob_by_content(db: AsyncSession, sender_username: str, content_key: str) -> Optional[Blob]:
+    """The sender's newest still-referenced blob with this content key"""
+    query = select(BlobModel).filter(
+        BlobModel.sender_id == _user_id(sender_username),
+        BlobModel.content_key == content_key,
+        BlobModel.ref_count > 0
+    ).order_by(BlobModel.created_at.desc()).limit(1)
+    blob = (await db.execute(query)).scalars().first()
+    if blob:
+        return _to_blob(blob, sender_username)
+    return None
+
+async def delete_unreferenced_blobs(db: AsyncSession, released_before: datetime) -> List[str]:
+    """Delete blobs without references since before a cutoff and return their blob_ids"""
+    result = await db.execute(
+        delete(BlobModel)
+        .filter(BlobModel.ref_count <= 0, BlobModel.updated_at < released_before)
+        .returning(BlobModel.id)
+    )
+    blob_ids = [blob_id for (blob_id,) in result.all()]
+    await db.commit()
+    return blob_ids
+
+async def find_referenced_blob_ids(db: AsyncSession, blob_ids: List[str]) -> Set[str]:
+    """The subset of blob_ids that a blob or file record still points at"""
+    query = union(
+        select(BlobModel.id).filter(BlobModel.id.in_(blob_ids)),
+        select(SharedMetadataModel.blob_id).filter(SharedMetadataModel.blob_id.in_(blob_ids)),
+        # Rows from before blob ids existed store their payload under the file_id
+        select(SharedMetadataModel.file_id).filter(SharedMetadataModel.file_id.in_(blob_ids))
+    )
+    return {blob_id for (blob_id,) in (await db.execute(query)).all()}
+
+def encode_file_cursor(file_record: FileSummary) -> str:
+    """Opaque keyset cursor pointing just past file_record in a listing"""
+    raw = f"{file_record.created_at.isoformat()}|{file_record.id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_file_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Decode a cursor from encode_file_cursor; raises ValueError if malformed"""
+    try:
+        created_at, file_pk = base64.urlsafe_b64decode(cursor.encode()).decode().split("|", 1)
+        return datetime.fromisoformat(created_at), int(file_pk)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def _user_id(username: str):
+    return select(UserModel.id).filter(UserModel.username == username).scalar_subquery()
+
+async def _list_files(db: AsyncSession, owner_column, counterpart_column, username: str,
+                      limit: Optional[int], cursor: Optional[Tuple[datetime, int]],
+                      counterpart: Optional[str], filename_prefix: Optional[str],
+                      created_after: Optional[datetime], created_before: Optional[datetime],
+                      is_read: Optional[bool]) -> List[FileSummary]:
+    """Newest-first listing keyed on (created_at, id), served by the (owner, created_at, id) indexes"""
+    # One query selecting only the listed columns; user lookups are a join and subqueries
+    query = select(
+        SharedMetadataModel.id,
+        SharedMetadataModel.file_id,
+        SharedMetadataModel.encrypted_metadata,
+        SharedMetadataModel.file_size,
+        SharedMetadataModel.created_at,
+        SharedMetadataModel.is_read,
+        UserModel.username
+    ).outerjoin(UserModel, counterpart_column == UserModel.id).filter(owner_column == _user_id(username))
+    if counterpart:
+        query = query.filter(counterpart_column == _user_id(counterpart))
+    if filename_prefix:
+        escaped = filename_prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        query = query.filter(SharedMetadataModel.encrypted_metadata.like(f"{escaped}%", escape="\\"))
+    if created_after:
+        query = query.filter(SharedMetadataModel.created_at >= created_after)
+    if created_before:
+        query = query.filter(SharedMetadataModel.created_at < created_before)
+    if is_read is not None:
+        query = query.filter(SharedMetadataModel.is_read == is_read)
+    if cursor:
+        query = query.filter(tuple_(SharedMetadataModel.created_at, SharedMetadataModel.id) < tuple_(*cursor))
+    query = query.order_by(SharedMetadataModel.created_at.desc(), SharedMetadataModel.id.desc())
+    if limit:
+        query = query.limit(limit)
+    rows = (await db.execute(query)).all()
+    return [
+        FileSummary(
+            file_id=row.file_id,
+            filename=row.encrypted_metadata,
+            counterpart_username=row.username or "",
+            file_size=row.file_size,
+            created_at=row.created_at,
+            is_read=bool(row.is_read),
+            id=row.id
+        ) for row in rows
+    ]
+
+async def get_received_files(db: AsyncSession, username: str, limit: Optional[int] = None,
+                             cursor: Optional[Tuple[datetime, int]] = None, counterpart: Optional[str] = None,
+                             filename_prefix: Optional[str] = None, created_after: Optional[datetime] = None,
+                             created_before: Optional[datetime] = None, is_read: Optional[bool] = None) -> List[FileSummary]:
+    """Get files received by a user, newest first, optionally one page at a time"""
+    return await _list_files(
+        db, SharedMetadataModel.recipient_id, SharedMetadataModel.sender_id, username,
+        limit, cursor, counterpart, filename_prefix, created_after, created_before, is_read
+    )
+
+async def get_sent_files(db: AsyncSession, username: str, limit: Optional[int] = None,
+                         cursor: Optional[Tuple[datetime, int]] = None, counterpart: Optional[str] = None,
+                         filename_prefix: Optional[str] = None, created_after: Optional[datetime] = None,
+                         created_before: Optional[datetime] = None, is_read: Optional[bool] = None) -> List[FileSummary]:
+    """Get files sent by a user, newest first, optionally one page at a time"""
+    return await _list_files(
+        db, SharedMetadataModel.sender_id, SharedMetadataModel.recipient_id, username,
+        limit, cursor, counterpart, filename_prefix, created_after, created_before, is_read
+    )
+
+def _to_upload_session(upload_session: UploadSessionModel) -> UploadSession:
+    return UploadSession(
+        upload_id=upload_session.id,
+        filename=upload_session.filename,
+        sender_username=upload_session.sender.username if upload_session.sender else "",
+        recipient_username=upload_session.recipient.username if upload_session.recipient else "",
+        file_size=upload_session.file_size,
+        part_size=upload_session.part_size,
+        chunk_size=upload_session.chunk_size,
+        encrypted_key=_binary(upload_session.encrypted_key),
+        nonce=_binary(upload_session.nonce),
+        created_at=upload_session.created_at
+    )
+
+async def create_upload_session(db: AsyncSession, upload_session: UploadSession) -> UploadSession:
+    """Create a new resumable upload session"""
+    sender = (await db.execute(select(UserModel).filter(UserModel.username == upload_session.sender_username))).scalars().first()
+    recipient = (await db.execute(select(UserModel).filter(UserModel.username == upload_session.recipient_username))).scalars().first()
     
-    for shared_metadata in shared_metadata_list:
-        sender = db.query(UserModel).filter(UserModel.id == shared_metadata.sender_id).first()
-        recipient = db.query(UserModel).filter(UserModel.id == shared_metadata.recipient_id).first()
-        
-        files.append(FileRecord(
-            file_id=shared_metadata.file_id,
-            filename=shared_metadata.encrypted_metadata,
-            sender_username=sender.username if sender else "",
-            recipient_username=recipient.username if recipient else "",
-            encrypted_data=b"",  # This would need to be stored separately
-            ciphertext=shared_metadata.encrypted_key.encode('utf-8') if isinstance(shared_metadata.encrypted_key, str) else shared_metadata.encrypted_key,
-            signature=shared_metadata.signature.encode('utf-8') if isinstance(shared_metadata.signature, str) else shared_metadata.signature,
-            nonce=shared_metadata.nonce.encode('utf-8') if isinstance(shared_metadata.nonce, str) else shared_metadata.nonce,
-            sender_public_key=shared_metadata.sender_public_key.encode('utf-8') if isinstance(shared_metadata.sender_public_key, str) else shared_metadata.sender_public_key,
-            id=shared_metadata.id
-        ))
+    if not sender or not recipient:
+        raise ValueError("Sender or recipient not found")
     
-    return files
+    db_session = UploadSessionModel(
+        id=upload_session.upload_id,
+        sender_id=sender.id,
+        recipient_id=recipient.id,
+        filename=upload_session.filename,
+        file_size=upload_session.file_size,
+        part_size=upload_session.part_size,
+        chunk_size=upload_session.chunk_size,
+        encrypted_key=upload_session.encrypted_key,
+        nonce=upload_session.nonce
+    )
+    db.add(db_session)
+    await db.commit()
+    return await find_upload_session(db, db_session.id)
+
+async def find_upload_session(db: AsyncSession, upload_id: str) -> Optional[UploadSession]:
+    """Find upload session by upload_id"""
+    query = select(UploadSessionModel).options(
+        selectinload(UploadSessionModel.sender), selectinload(UploadSessionModel.recipient)
+    ).filter(UploadSessionModel.id == upload_id)
+    upload_session = (await db.execute(query)).scalars().first()
+    if upload_session:
+        return _to_upload_session(upload_session)
+    return None
+
+async def delete_upload_session(db: AsyncSession, upload_id: str) -> None:
+    """Delete an upload session"""
+    await db.execute(delete(UploadSessionModel).filter(UploadSessionModel.id == upload_id))
+    await db.commit()
+
+async def delete_expired_upload_sessions(db: AsyncSession, created_before: datetime) -> List[str]:
+    """Delete upload sessions created before a cutoff and return their upload_ids"""
+    expired = (await db.execute(select(UploadSessionModel.id).filter(UploadSessionModel.created_at < created_before))).all()
+    upload_ids = [upload_id for (upload_id,) in expired]
+    if upload_ids:
+        await db.execute(delete(UploadSessionModel).filter(UploadSessionModel.id.in_(upload_ids)))
+        await db.commit()
+    return upload_ids
 
-async def health_check(db: Session) -> bool:
+async def health_check(db: AsyncSession) -> bool:
     """Check database health"""
     try:
         # Try to query the database
-        db.query(UserModel).first()
+        await db.execute(select(UserModel).limit(1))
         return True
     except Exception as e:
         print(f"Database health check failed: {e}")
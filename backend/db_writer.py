@@ -0,0 +1,123 @@
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import AsyncSessionLocal
+
+# === Group Commit Configuration ===
+# SQLite has a single writer, and every commit costs a WAL append (plus an fsync at checkpoints).
+# Inserts are therefore queued to one writer per event loop, which runs everything that queued
+# while its previous commit was in flight as one transaction: each operation in its own
+# savepoint, so a failing one is rolled back alone, and a single COMMIT for the batch.
+GROUP_COMMIT_MAX_BATCH = int(os.getenv("GROUP_COMMIT_MAX_BATCH", "64"))  # 1 = commit every write alone
+GROUP_COMMIT_WINDOW_MS = float(os.getenv("GROUP_COMMIT_WINDOW_MS", "0"))  # Extra wait for a batch to fill
+
+WriteOperation = Callable[[AsyncSession], Awaitable[Any]]
+
+class DbWriter:
+    """Single writer that group-commits the write operations submitted to it"""
+
+    def __init__(self, max_batch: int = GROUP_COMMIT_MAX_BATCH, window_ms: float = GROUP_COMMIT_WINDOW_MS,
+                 session_factory=AsyncSessionLocal):
+        self.session_factory = session_factory
+        self.max_batch = max(1, max_batch)
+        self.window = window_ms / 1000
+        self.loop = asyncio.get_running_loop()
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task = self.loop.create_task(self._run())
+        self._stats = {
+            "operations": 0,
+            "failed": 0,
+            "commits": 0,
+            "commit_errors": 0,
+            "max_batch_seen": 0,
+            "commit_seconds": 0.0
+        }
+
+    async def submit(self, operation: WriteOperation) -> Any:
+        """Run operation(session) in the next group commit and return its result once committed"""
+        future = self.loop.create_future()
+        self._queue.put_nowait((operation, future))
+        return await future
+
+    async def _run(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            if self.window > 0 and self._queue.qsize() < self.max_batch - 1:
+                await asyncio.sleep(self.window)
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            await self._commit([(operation, future) for operation, future in batch if not future.done()])
+
+    async def _commit(self, batch: list) -> None:
+        if not batch:
+            return
+        outcomes = []
+        started = time.perf_counter()
+        try:
+            async with self.session_factory() as session:
+                # The sqlite3 driver opens transactions lazily, so the first savepoint would be the
+                # transaction and its RELEASE would commit; take the write lock up front instead
+                connection = await session.connection()
+                await connection.exec_driver_sql("BEGIN IMMEDIATE")
+                for operation, future in batch:
+                    try:
+                        async with session.begin_nested():
+                            outcomes.append((future, await operation(session), None))
+                    except Exception as e:
+                        outcomes.append((future, None, e))
+                await session.commit()
+        except Exception as e:
+            # Nothing in the batch was committed
+            self._stats["commit_errors"] += 1
+            outcomes = [(future, None, error or e) for future, _, error in outcomes]
+            outcomes += [(future, None, e) for _, future in batch[len(outcomes):]]
+
+        self._stats["operations"] += len(batch)
+        self._stats["commits"] += 1
+        self._stats["max_batch_seen"] = max(self._stats["max_batch_seen"], len(batch))
+        self._stats["commit_seconds"] += time.perf_counter() - started
+        for future, result, error in outcomes:
+            if future.done():
+                continue
+            if error is not None:
+                self._stats["failed"] += 1
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+    def stop(self) -> None:
+        self._task.cancel()
+
+    def metrics(self) -> dict:
+        commits = self._stats["commits"]
+        return {
+            "max_batch": self.max_batch,
+            "window_ms": self.window * 1000,
+            "queue_depth": self._queue.qsize(),
+            "average_batch": self._stats["operations"] / commits if commits else 0.0,
+            **self._stats
+        }
+
+_writer: Optional[DbWriter] = None
+
+def get_db_writer() -> DbWriter:
+    """Get the writer of the running event loop (uvicorn runs one loop per worker process)"""
+    global _writer
+    if _writer is None or _writer.loop is not asyncio.get_running_loop():
+        _writer = DbWriter()
+    return _writer
+
+def stop_db_writer() -> None:
+    global _writer
+    if _writer is not None:
+        _writer.stop()
+        _writer = None
+
+def db_writer_metrics() -> dict:
+    if _writer is None:
+        return {"max_batch": GROUP_COMMIT_MAX_BATCH, "window_ms": GROUP_COMMIT_WINDOW_MS, "operations": 0}
+    return _writer.metrics()
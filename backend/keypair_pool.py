@@ -0,0 +1,133 @@
+import oqs
+import os
+import threading
+from collections import deque
+from typing import Callable, Optional, Tuple
+
+from crypto_utils import KEM_ALGO, SIG_ALGO
+
+# === Keypair Pool Configuration ===
+# Fresh keypairs are generated ahead of time by a background thread per algorithm, so
+# registration only pops one. The pool refills up to the high watermark whenever it drops
+# below the low watermark; an empty pool falls back to generating inline.
+KEYPAIR_POOL_LOW = int(os.getenv("KEYPAIR_POOL_LOW", "8"))
+KEYPAIR_POOL_HIGH = int(os.getenv("KEYPAIR_POOL_HIGH", "32"))  # 0 = no pool, always generate inline
+
+def generate_kem_keypair() -> Tuple[bytes, bytes]:
+    """Generate a Kyber keypair: (public, secret)"""
+    kem = oqs.KeyEncapsulation(KEM_ALGO)
+    public_key = kem.generate_keypair()
+    return public_key, kem.export_secret_key()
+
+def generate_sig_keypair() -> Tuple[bytes, bytes]:
+    """Generate a Dilithium keypair: (public, secret)"""
+    sig = oqs.Signature(SIG_ALGO)
+    public_key = sig.generate_keypair()
+    return public_key, sig.export_secret_key()
+
+class KeypairPool:
+    """Keypairs of one algorithm, topped up by a background refill thread"""
+
+    def __init__(self, name: str, generate: Callable[[], Tuple[bytes, bytes]],
+                 low: int = KEYPAIR_POOL_LOW, high: int = KEYPAIR_POOL_HIGH):
+        self.name = name
+        self.low = low
+        self.high = high
+        self._generate = generate
+        self._keypairs = deque()
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {
+            "taken": 0,
+            "generated": 0,
+            "refills": 0,
+            "fallbacks": 0,  # Pool was empty and a keypair was generated inline
+            "refill_errors": 0
+        }
+
+    def start(self) -> None:
+        """Start the refill thread (idempotent) and have it fill the pool"""
+        with self._lock:
+            if self.high <= 0 or self._thread is not None or self._stopped:
+                return
+            self._thread = threading.Thread(target=self._refill_loop, name=f"{self.name}-refill", daemon=True)
+            self._thread.start()
+        self._wake.set()
+
+    def _refill_loop(self) -> None:
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            if self._stopped:
+                return
+            with self._lock:
+                self._stats["refills"] += 1
+            while not self._stopped and len(self._keypairs) < self.high:
+                try:
+                    keypair = self._generate()
+                except Exception as e:
+                    print(f"❌ {self.name} keypair refill failed: {e}")
+                    with self._lock:
+                        self._stats["refill_errors"] += 1
+                    break
+                with self._lock:
+                    self._keypairs.append(keypair)
+                    self._stats["generated"] += 1
+
+    def take(self) -> Tuple[bytes, bytes]:
+        """Pop a fresh keypair, generating one inline if the pool is empty"""
+        self.start()
+        with self._lock:
+            keypair = self._keypairs.popleft() if self._keypairs else None
+            self._stats["taken"] += 1
+            if keypair is None:
+                self._stats["fallbacks"] += 1
+            low = len(self._keypairs) < self.low
+        if low:
+            self._wake.set()
+        return keypair if keypair is not None else self._generate()
+
+    def stop(self) -> None:
+        self._stopped = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        with self._lock:
+            self._keypairs.clear()
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._keypairs),
+                "low": self.low,
+                "high": self.high,
+                **self._stats
+            }
+
+_keypair_pools: Optional[dict] = None
+
+def get_keypair_pools() -> dict:
+    """Get the process-wide keypair pools by algorithm, creating them on first use"""
+    global _keypair_pools
+    if _keypair_pools is None:
+        _keypair_pools = {
+            KEM_ALGO: KeypairPool(KEM_ALGO, generate_kem_keypair),
+            SIG_ALGO: KeypairPool(SIG_ALGO, generate_sig_keypair)
+        }
+    return _keypair_pools
+
+def start_keypair_pools() -> None:
+    for pool in get_keypair_pools().values():
+        pool.start()
+
+def shutdown_keypair_pools() -> None:
+    global _keypair_pools
+    if _keypair_pools is not None:
+        for pool in _keypair_pools.values():
+            pool.stop()
+        _keypair_pools = None
+
+def keypair_pool_metrics() -> dict:
+    return {name: pool.metrics() for name, pool in get_keypair_pools().items()}
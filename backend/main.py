@@ -1,28 +1,79 @@
 from dotenv import load_dotenv
 load_dotenv()
 
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Depends, status
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi import FastAPI, UploadFile, File, Form, Header, HTTPException, Depends, Query, Request, status
+from fastapi.responses import JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
+import asyncio
 import uuid
 import os
-from typing import List, Optional
-import tempfile
+import base64
+import hashlib
+import secrets
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, List, Optional, Tuple
+from urllib.parse import quote
 import re
 
 from database import (
-    find_user_by_username, find_user_by_email, create_user, get_all_users, 
-    create_file_record, find_file_by_id, get_received_files, 
-    get_sent_files, health_check, get_db, User, FileRecord
+    find_user_by_username, find_users_by_username, find_user_by_email, create_user, get_all_users, 
+    create_file_records, find_file_by_id, get_received_files, 
+    get_sent_files, health_check, get_db, User, FileRecord, Blob, BlobUnavailable,
+    find_blob_by_content, find_blob_sender_key, find_file_by_blob, delete_file_record, record_file_verified,
+    create_upload_session, find_upload_session, delete_upload_session,
+    delete_expired_upload_sessions, UploadSession, update_user_password, set_user_keys,
+    encode_file_cursor, decode_file_cursor
 )
-from auth import get_password_hash, verify_password, create_access_token, verify_token
+from principal_cache import get_principal_cache
+from session_keyring import UnlockedKeys, get_session_keyring
+from keypair_pool import keypair_pool_metrics, shutdown_keypair_pools, start_keypair_pools
+from oqs_contexts import oqs_context_metrics
+from blob_store import (
+    new_content_hash, record_dedup_hit, blob_store_metrics, start_blob_collector, stop_blob_collector
+)
+from storage import BlobWriter, Storage, STORAGE_READ_SIZE, get_storage, shutdown_storage
+from chunk_compression import choose_compressor, compression_metrics, finish_compression
+from verification_cache import is_verified, verification_cache_metrics, verification_digest
+from db_writer import db_writer_metrics, stop_db_writer
+from migrate_db import prepare_database
+from auth import (
+    get_password_hash, verify_password, password_needs_rehash, create_access_token, verify_token,
+    verify_token_session, revoke_token, token_cache_metrics
+)
+from user_crypto import create_user_keys, generate_user_keys, get_user_decryption_keys
+from crypto_executor import CryptoExecutorBusy, get_crypto_executor, get_kdf_executor, shutdown_crypto_executor
 from crypto_utils import (
     encrypt_file_for_user, 
     decrypt_file_for_user,
-    encode_metadata,
-    decode_metadata
+    load_server_keys,
+    is_stream_header,
+    locate_stream_index,
+    verify_stream_signature,
+    build_stream_header,
+    build_stream_trailer,
+    create_stream_key,
+    wrap_data_key,
+    unwrap_data_key,
+    rewrap_data_key,
+    wrapped_key_holder,
+    sign_stream,
+    StreamCipher,
+    StreamEncryptor,
+    StreamDecryptor,
+    StreamIndex,
+    ChunkIntegrityError,
+    STREAM_CHUNK_SIZE,
+    STREAM_BATCH_CHUNKS,
+    STREAM_PARALLEL_BATCHES,
+    STREAM_HEADER_SIZE,
+    STREAM_TRAILER_SIZE,
+    STREAM_TAG_SIZE,
+    STREAM_FLAG_WRAPPED_KEY,
+    KEY_HOLDER_SERVER,
+    KEY_HOLDER_RECIPIENT
 )
 
 app = FastAPI(title="Secure File Transfer System", version="1.0.0")
@@ -39,11 +90,23 @@ app.add_middleware(
 # Security
 security = HTTPBearer()
 
-# Temporary directory for file operations
-TEMP_DIR = "temp"
-os.makedirs(TEMP_DIR, exist_ok=True)
+# File listings
+FILE_PAGE_SIZE = int(os.getenv("FILE_PAGE_SIZE", "50"))
+FILE_PAGE_SIZE_MAX = int(os.getenv("FILE_PAGE_SIZE_MAX", "200"))
+
+# Detail of the 401 answered when this worker holds no unlocked keys for the session (idle or
+# absolute keyring expiry, a restart, or another worker); clients retry with the `password` field
+KEYS_LOCKED_DETAIL = "Session keys locked, password required"
+
+# Resumable upload sessions
+UPLOAD_PART_SIZE = int(os.getenv("UPLOAD_PART_SIZE", "4")) * 1024 * 1024  # 4MB default
+UPLOAD_SESSION_TTL = timedelta(hours=int(os.getenv("UPLOAD_SESSION_TTL_HOURS", "24")))
+
+# Seconds clients are told to wait when the login/registration KDF pool is full
+KDF_RETRY_AFTER = os.getenv("KDF_RETRY_AFTER", "2")
 
 # File validation
+MAX_RECIPIENTS = int(os.getenv("MAX_RECIPIENTS", "50"))  # Recipients of a single upload
 ALLOWED_EXTENSIONS = {".txt", ".pdf", ".doc", ".docx", ".jpg", ".jpeg", ".png", ".gif", ".zip", ".rar"}
 MAX_FILE_SIZE = int(os.getenv("MAX_FILE_SIZE", "100")) * 1024 * 1024  # 100MB default
 
@@ -52,13 +115,276 @@ def is_file_allowed(filename: str) -> bool:
         return False
     return any(filename.lower().endswith(ext) for ext in ALLOWED_EXTENSIONS)
 
+async def write_encrypted_upload(file: UploadFile, encryptor: StreamEncryptor, writer: BlobWriter, content_hash=None) -> int:
+    """Read an upload in batches of chunks, encrypt them and append them to a storage writer.
+
+    Up to STREAM_PARALLEL_BATCHES batches are sealed at once on the crypto executor while the
+    next ones are read, and are written in order. The size limit is enforced as bytes arrive,
+    so memory stays bounded regardless of the file size. The plaintext is also fed to
+    content_hash, if given. Returns the plaintext size.
+    """
+    total_size = 0
+    number = 0
+    pending = deque()
+
+    async def write_oldest() -> None:
+        chunks, final, sealing = pending.popleft()
+        sealed = await sealing
+        encryptor.append_sealed(chunks, sealed, final)
+        await writer.write(b"".join(sealed))
+
+    await writer.write(encryptor.header)
+    try:
+        # Read one chunk ahead so the last chunk can be flagged as final
+        chunk = await file.read(encryptor.chunk_size)
+        final = False
+        while not final:
+            chunks = []
+            while len(chunks) < STREAM_BATCH_CHUNKS and not final:
+                total_size += len(chunk)
+                if total_size > MAX_FILE_SIZE:
+                    raise HTTPException(status_code=400, detail="File too large")
+                if content_hash is not None:
+                    content_hash.update(chunk)
+                chunks.append(chunk)
+                next_chunk = await file.read(encryptor.chunk_size) if len(chunk) == encryptor.chunk_size else b""
+                final = not next_chunk
+                chunk = next_chunk
+            pending.append((chunks, final, asyncio.ensure_future(run_crypto(encryptor.seal_chunks, number, chunks, final))))
+            number += len(chunks)
+            if len(pending) >= STREAM_PARALLEL_BATCHES:
+                await write_oldest()
+        while pending:
+            await write_oldest()
+    finally:
+        for _, _, sealing in pending:
+            sealing.cancel()
+    await writer.write(encryptor.trailer())
+    return total_size
+
+async def list_received_parts(upload_session: UploadSession) -> List[int]:
+    """Part numbers of an upload session that have been fully received"""
+    return await get_storage().list_parts(upload_session.upload_id)
+
+async def write_encrypted_part(request: Request, upload_session: UploadSession, part_number: int,
+                               cipher: StreamCipher) -> None:
+    """Encrypt one part of a session upload as its body arrives.
+
+    A part spans part_size // chunk_size stream chunks, numbered by their position in
+    the whole file, so parts can arrive in any order. The part is staged through the
+    storage driver and only becomes visible once complete, which makes re-sending a part
+    idempotent.
+    """
+    chunk_size = upload_session.chunk_size
+    chunk_count = max(1, -(-upload_session.file_size // chunk_size))
+    expected_size = min(upload_session.part_size, upload_session.file_size - part_number * upload_session.part_size)
+    chunk_number = part_number * (upload_session.part_size // chunk_size)
+    last_chunk_number = chunk_number + max(1, -(-expected_size // chunk_size)) - 1
+    
+    writer = await get_storage().open_part_writer(upload_session.upload_id, part_number)
+    received = 0
+    buffer = bytearray()
+    try:
+        async for data in request.stream():
+            received += len(data)
+            if received > expected_size:
+                raise HTTPException(status_code=400, detail="Part larger than expected")
+            buffer += data
+            # Seal chunks as they fill; the part's last chunk waits for the end of the body
+            while len(buffer) >= chunk_size and chunk_number < last_chunk_number:
+                await writer.write(await run_crypto(cipher.seal, chunk_number, bytes(buffer[:chunk_size]), False))
+                del buffer[:chunk_size]
+                chunk_number += 1
+        if received != expected_size:
+            raise HTTPException(status_code=400, detail="Part smaller than expected")
+        await writer.write(await run_crypto(cipher.seal, chunk_number, bytes(buffer), chunk_number == chunk_count - 1))
+        await writer.commit()
+    except BaseException:
+        await writer.abort()
+        raise
+
+async def assemble_session_upload(upload_session: UploadSession, header: bytes, writer: BlobWriter) -> bytes:
+    """Concatenate the encrypted parts of a session into a stream blob and return its trailer"""
+    sealed_chunk_size = upload_session.chunk_size + STREAM_TAG_SIZE
+    index_entries = []
+    await writer.write(header)
+    for part_number in range(upload_session.part_count):
+        part = await get_storage().read_part(upload_session.upload_id, part_number)
+        for offset in range(0, len(part), sealed_chunk_size):
+            sealed = part[offset:offset + sealed_chunk_size]
+            index_entries.append((len(sealed), sealed[-STREAM_TAG_SIZE:]))
+        await writer.write(part)
+    trailer = build_stream_trailer(index_entries, upload_session.file_size)
+    await writer.write(trailer)
+    return trailer
+
+async def read_blob_index(storage: Storage, blob_id: str, blob_size: int) -> Optional[StreamIndex]:
+    """Fetch the header, chunk index and trailer of a stored stream; None for a legacy base64 blob"""
+    header = await storage.read(blob_id, 0, STREAM_HEADER_SIZE)
+    if not is_stream_header(header):
+        return None
+    trailer = await storage.read(blob_id, max(blob_size - STREAM_TRAILER_SIZE, 0), STREAM_TRAILER_SIZE)
+    index_offset, index_size = locate_stream_index(trailer, blob_size)
+    return StreamIndex(header, await storage.read(blob_id, index_offset, index_size), trailer)
+
+async def iter_decrypted_blob(storage: Storage, blob_id: str, decryptor: StreamDecryptor,
+                              start: int = 0, end: Optional[int] = None) -> AsyncIterator[bytes]:
+    """
+    Yield plaintext bytes start..end (inclusive) of a stored stream.
+
+    Only the chunks overlapping the window are fetched and decrypted; adjacent chunks are
+    fetched together, up to STORAGE_READ_SIZE bytes per read, and up to STREAM_PARALLEL_BATCHES
+    of those reads are fetched and decrypted at once ahead of the client.
+    """
+    index = decryptor.index
+    if end is None:
+        end = index.plaintext_size - 1
+    if index.plaintext_size == 0:
+        # An empty file is a single empty chunk; still authenticate it
+        await read_and_decrypt_chunks(storage, blob_id, decryptor, 0, 0)
+        return
+
+    pending = deque()
+    try:
+        number, last = start // index.chunk_size, end // index.chunk_size
+        while number <= last or pending:
+            if number <= last and len(pending) < STREAM_PARALLEL_BATCHES:
+                batch_end = number
+                while (batch_end < last and
+                       index.offsets[batch_end + 1] + index.lengths[batch_end + 1] - index.offsets[number] <= STORAGE_READ_SIZE):
+                    batch_end += 1
+                pending.append((number, asyncio.ensure_future(
+                    read_and_decrypt_chunks(storage, blob_id, decryptor, number, batch_end)
+                )))
+                number = batch_end + 1
+                continue
+            first, decrypting = pending.popleft()
+            for chunk_number, plaintext in enumerate(await decrypting, first):
+                chunk_start = chunk_number * index.chunk_size
+                yield plaintext[max(start - chunk_start, 0):end - chunk_start + 1]
+    finally:
+        for _, decrypting in pending:
+            decrypting.cancel()
+
+async def read_and_decrypt_chunks(storage: Storage, blob_id: str, decryptor: StreamDecryptor,
+                                  first: int, last: int) -> List[bytes]:
+    """Fetch chunks first..last of a stored stream in one read and decrypt them as one crypto task"""
+    index = decryptor.index
+    data = await storage.read(blob_id, index.offsets[first], index.offsets[last] + index.lengths[last] - index.offsets[first])
+    sealed_chunks = []
+    position = 0
+    for number in range(first, last + 1):
+        sealed = data[position:position + index.lengths[number]]
+        # Reject a tampered or truncated chunk before any crypto work; decryption then authenticates it
+        decryptor.check_chunk(number, sealed)
+        sealed_chunks.append(sealed)
+        position += index.lengths[number]
+    return await run_crypto(decryptor.decrypt_chunks, first, sealed_chunks)
+
+async def start_decrypted_stream(content: AsyncIterator[bytes], file_id: str) -> AsyncIterator[bytes]:
+    """
+    Decrypt the first piece of a download before its response starts, so a corrupt chunk there
+    gets an error status. Corruption found later cannot take back the status already sent: the
+    response is aborted instead, closing the connection short of its Content-Length, so the
+    client sees a failed download rather than a complete-looking truncated file.
+    """
+    first = await anext(content, None)
+
+    async def stream():
+        try:
+            if first is not None:
+                yield first
+            async for piece in content:
+                yield piece
+        except ChunkIntegrityError as e:
+            print(f"❌ Aborted download of {file_id}: {str(e)}")
+            raise
+        finally:
+            await content.aclose()
+
+    return stream()
+
+async def iter_base64_blob(storage: Storage, blob_id: str, blob_size: int, block_size: int = 64 * 1024) -> AsyncIterator[bytes]:
+    """Decode a legacy base64 blob in fixed-size blocks"""
+    for offset in range(0, blob_size, block_size):
+        yield base64.b64decode(await storage.read(blob_id, offset, block_size))
+
+def parse_byte_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single-range Range header into inclusive (start, end) offsets.
+
+    Returns None when the header should be ignored (malformed or multiple ranges),
+    in which case the whole file is served.
+    """
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, sep, last = spec.strip().partition("-")
+    if not sep:
+        return None
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+        else:
+            # Suffix range: the last N bytes
+            start = max(size - int(last), 0)
+            end = size - 1
+    except ValueError:
+        return None
+    if start >= size:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+    if start > end:
+        return None
+    return start, min(end, size - 1)
+
+def content_disposition(filename: str) -> str:
+    """Build an attachment Content-Disposition header for filename"""
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
 def is_valid_email(email: str) -> bool:
     """Validate email format"""
     pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
     return re.match(pattern, email) is not None
 
+async def run_crypto(fn, *args, **kwargs):
+    """Run a crypto call on the crypto executor instead of the event loop"""
+    try:
+        return await get_crypto_executor().run(fn, *args, **kwargs)
+    except CryptoExecutorBusy:
+        raise HTTPException(status_code=503, detail="Server busy, please retry", headers={"Retry-After": "1"})
+
+async def run_kdf(fn, *args, stage: str, **kwargs):
+    """Run password hashing / key derivation on the bounded KDF pool, rejecting fast when it is full"""
+    try:
+        return await get_kdf_executor().run(fn, *args, stage=stage, **kwargs)
+    except CryptoExecutorBusy:
+        raise HTTPException(status_code=503, detail="Server busy, please retry", headers={"Retry-After": KDF_RETRY_AFTER})
+
+@app.on_event("startup")
+async def start_background_workers():
+    # Create a new database; existing ones are migrated by migrate_db.py, not on startup
+    prepare_database()
+    # Fill the keypair pools in the background so early registrations find keys ready
+    start_keypair_pools()
+    start_blob_collector()
+
+@app.on_event("shutdown")
+def shutdown_executors():
+    stop_blob_collector()
+    stop_db_writer()
+    shutdown_crypto_executor()
+    shutdown_keypair_pools()
+    shutdown_storage()
+
 # Dependency to get current user
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), db: Session = Depends(get_db)) -> User:
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), db: AsyncSession = Depends(get_db)) -> User:
     token = credentials.credentials
     email = verify_token(token)
     if not email:
@@ -68,6 +394,13 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
             headers={"WWW-Authenticate": "Bearer"},
         )
     
+    principal_cache = get_principal_cache()
+    user_data = principal_cache.get(email)
+    if user_data:
+        return user_data
+    
+    # Taken before the lookup, so a password change or deletion during it is not cached over
+    generation = principal_cache.generation()
     user_data = await find_user_by_email(db, email)
     if not user_data:
         raise HTTPException(
@@ -76,8 +409,132 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
             headers={"WWW-Authenticate": "Bearer"},
         )
     
+    principal_cache.put(email, user_data, generation)
     return user_data
 
+# Dependency to get the current session's unlocked private keys (None once they expired)
+async def get_session_keys(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    current_user: User = Depends(get_current_user)
+) -> Optional[UnlockedKeys]:
+    session = verify_token_session(credentials.credentials)
+    if not session:
+        return None
+    return get_session_keyring().get(session[1], current_user.username)
+
+async def unlock_session_keys(db: AsyncSession, user: User, password: str, session_id: str) -> None:
+    """Unlock a user's private keys into the keyring, creating them for accounts that have none"""
+    try:
+        if user.has_keys:
+            kem_secret, sig_secret = await run_kdf(get_user_decryption_keys, user, password, stage="unlock_keys")
+            sig_public = base64.b64decode(user.sig_public_key)
+        else:
+            keys, kem_secret, sig_secret = await run_kdf(create_user_keys, password, stage="generate_keys")
+            await set_user_keys(db, user.email, keys)
+            sig_public = base64.b64decode(keys["sig_public_key"])
+            print("Generated keys for existing user")
+    except HTTPException:
+        raise
+    except Exception as e:
+        # Files already wrapped to this user stay unreadable until the keys unlock
+        print(f"Failed to unlock user keys: {str(e)}")
+        return
+    get_session_keyring().put(session_id, UnlockedKeys(user.username, kem_secret, sig_secret, sig_public))
+
+async def unlock_keys_with_password(db: AsyncSession, credentials: HTTPAuthorizationCredentials,
+                                    user: User, password: str) -> Optional[UnlockedKeys]:
+    """
+    Re-derive a session's keys from the password when this process does not hold them: the
+    keyring is in memory, so another worker or a restart since login has an empty one
+    """
+    session = verify_token_session(credentials.credentials)
+    if not session or not session[1]:
+        return None
+    if not await run_kdf(verify_password, password, user.password_hash, stage="verify_password"):
+        raise HTTPException(status_code=403, detail="Incorrect password")
+    await unlock_session_keys(db, user, password, session[1])
+    return get_session_keyring().get(session[1], user.username)
+
+async def require_session_keys(db: AsyncSession, credentials: HTTPAuthorizationCredentials, user: User,
+                               session_keys: Optional[UnlockedKeys], password: Optional[str]) -> UnlockedKeys:
+    """
+    The caller's unlocked keys. Without them the request is refused with KEYS_LOCKED_DETAIL, and
+    the client retries with the account password, rather than falling back to the server's keys
+    """
+    if not session_keys and password:
+        session_keys = await unlock_keys_with_password(db, credentials, user, password)
+    if not session_keys:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=KEYS_LOCKED_DETAIL,
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return session_keys
+
+def file_key_target(recipient: User) -> Tuple[bytes, int]:
+    """Kyber public key (and key holder) that new files for recipient are wrapped to"""
+    if recipient.has_keys:
+        return base64.b64decode(recipient.kem_public_key), KEY_HOLDER_RECIPIENT
+    # Recipients without keys yet (they get them on their next login) use the server keypair
+    return load_server_keys()["kem_public"], KEY_HOLDER_SERVER
+
+async def unwrap_blob_key(blob: Blob, session_keys: Optional[UnlockedKeys]) -> Optional[bytes]:
+    """Data key of one of the sender's blobs, from their wrapped copy; None if it cannot be used now"""
+    if not blob.sender_key or await get_storage().size(blob.blob_id) is None:
+        return None
+    if wrapped_key_holder(blob.sender_key) == KEY_HOLDER_SERVER:
+        kyber_private = load_server_keys()["kem_secret"]
+    elif session_keys:
+        kyber_private = session_keys.kem_secret
+    else:
+        # Wrapped to the sender's own key, which is locked until they log in again
+        return None
+    try:
+        return await run_crypto(unwrap_data_key, blob.sender_key, kyber_private)
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Failed to unwrap blob key: {str(e)}")
+        return None
+
+async def reuse_stored_blob(db: AsyncSession, sender: User, session_keys: Optional[UnlockedKeys], content_key: str,
+                            filename: str, file_size: int, file_ids: dict, recipients: dict) -> bool:
+    """
+    Share a blob the sender already stored with the same content: its data key is wrapped for
+    the recipients and the records point at it, with no new signature. Returns False if there
+    is no such blob or it cannot be used right now.
+    """
+    existing_blob = await find_blob_by_content(db, sender.username, content_key)
+    data_key = await unwrap_blob_key(existing_blob, session_keys) if existing_blob else None
+    reference = await find_file_by_blob(db, existing_blob.blob_id) if data_key else None
+    if not reference:
+        return False
+    
+    file_records = []
+    for username, file_id in file_ids.items():
+        wrapped_key = await run_crypto(wrap_data_key, data_key, *file_key_target(recipients[username]))
+        file_records.append(FileRecord(
+            file_id=file_id,
+            filename=filename,
+            sender_username=sender.username,
+            recipient_username=username,
+            encrypted_data=b"",  # Stored in the existing blob
+            ciphertext=wrapped_key,
+            signature=reference.signature,
+            nonce=reference.nonce,
+            sender_public_key=reference.sender_public_key,
+            file_size=file_size,
+            blob_id=existing_blob.blob_id
+        ))
+    try:
+        await create_file_records(file_records)
+    except BlobUnavailable:
+        # Released while we were looking; keep the new copy instead
+        print(f"Blob {existing_blob.blob_id} was released, storing upload as a new blob")
+        return False
+    print(f"♻️ Upload matched stored blob {existing_blob.blob_id}")
+    return True
+
 # Test endpoint
 @app.get("/api/test")
 async def test_endpoint():
@@ -85,7 +542,7 @@ async def test_endpoint():
 
 # User registration
 @app.post("/api/register")
-async def register_user(username: str = Form(...), email: str = Form(...), password: str = Form(...), db: Session = Depends(get_db)):
+async def register_user(username: str = Form(...), email: str = Form(...), password: str = Form(...), db: AsyncSession = Depends(get_db)):
     try:
         print(f"Registration attempt for username: {username}, email: {email}")
         print(f"Password length: {len(password)}")
@@ -123,20 +580,25 @@ async def register_user(username: str = Form(...), email: str = Form(...), passw
         
         # Hash password
         print("Hashing password...")
-        password_hash = get_password_hash(password)
+        password_hash = await run_kdf(get_password_hash, password, stage="hash_password")
         print("Password hashed successfully")
         
+        # Generate the user's Kyber/Dilithium keys, wrapped with their password
+        print("Generating user keys...")
+        keys = await run_kdf(generate_user_keys, password, stage="generate_keys")
+        
         # Create user
         user = User(
             username=username,
             email=email,
-            password_hash=password_hash
+            password_hash=password_hash,
+            keys=keys
         )
         print("User object created")
         
         # Save to database
         print("Saving to database...")
-        result = await create_user(db, user)
+        result = await create_user(user)
         print(f"User created with ID: {result.id}")
         
         return {"message": "User registered successfully", "username": username, "email": email}
@@ -153,7 +615,7 @@ async def register_user(username: str = Form(...), email: str = Form(...), passw
 
 # User login
 @app.post("/api/login")
-async def login(email: str = Form(...), password: str = Form(...), db: Session = Depends(get_db)):
+async def login(email: str = Form(...), password: str = Form(...), db: AsyncSession = Depends(get_db)):
     try:
         print(f"Login attempt for email: {email}")
         print(f"Password length: {len(password)}")
@@ -172,7 +634,7 @@ async def login(email: str = Form(...), password: str = Form(...), db: Session =
         # Verify password
         print("Verifying password...")
         print(f"Stored password hash: {user.password_hash}")
-        is_valid = verify_password(password, user.password_hash)
+        is_valid = await run_kdf(verify_password, password, user.password_hash, stage="verify_password")
         print(f"Password verification result: {is_valid}")
         
         if not is_valid:
@@ -181,9 +643,22 @@ async def login(email: str = Form(...), password: str = Form(...), db: Session =
         
         print("Password verified successfully")
         
+        # Upgrade legacy or outdated hashes; a busy KDF pool just postpones this to a later login
+        if password_needs_rehash(user.password_hash):
+            try:
+                new_hash = await run_kdf(get_password_hash, password, stage="rehash_password")
+                await update_user_password(db, email, new_hash)
+                print("Password hash upgraded")
+            except HTTPException:
+                print("KDF pool busy, skipping password rehash")
+        
+        # Unlock the user's private keys once; the token's jti is the keyring handle
+        session_id = secrets.token_urlsafe(16)
+        await unlock_session_keys(db, user, password, session_id)
+        
         # Create access token (use email as subject)
         print("Creating access token...")
-        access_token = create_access_token(data={"sub": email})
+        access_token = create_access_token(data={"sub": email, "jti": session_id})
         print("Access token created")
         
         return {"access_token": access_token, "token_type": "bearer", "username": user.username, "email": email}
@@ -198,9 +673,23 @@ async def login(email: str = Form(...), password: str = Form(...), db: Session =
         print(f"Traceback: {traceback.format_exc()}")
         raise HTTPException(status_code=500, detail=f"Login failed: {str(e)}")
 
+# User logout: revoke the presented token for the rest of its lifetime
+@app.post("/api/logout")
+async def logout(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    session = verify_token_session(credentials.credentials)
+    if session and session[1]:
+        get_session_keyring().discard(session[1])
+    if not revoke_token(credentials.credentials):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return {"message": "Logged out"}
+
 # Get all users (for recipient selection)
 @app.get("/api/users")
-async def get_users(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def get_users(current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
     try:
         users = await get_all_users(db, exclude_username=current_user.username)
         return {"users": [user.username for user in users]}
@@ -212,11 +701,17 @@ async def get_users(current_user: User = Depends(get_current_user), db: Session
 @app.post("/api/upload")
 async def upload_file(
     file: UploadFile = File(...),
-    recipient_username: str = Form(...),
+    recipient_username: List[str] = Form(...),
+    password: Optional[str] = Form(None),  # Unlocks the keys if this worker's keyring lacks the session
+    credentials: HTTPAuthorizationCredentials = Depends(security),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    session_keys: Optional[UnlockedKeys] = Depends(get_session_keys),
+    db: AsyncSession = Depends(get_db)
 ):
     try:
+        # Uploads are signed with the sender's own Dilithium key
+        session_keys = await require_session_keys(db, credentials, current_user, session_keys, password)
+        
         # Validate file
         if not file.filename:
             raise HTTPException(status_code=400, detail="Invalid file")
@@ -224,74 +719,321 @@ async def upload_file(
         if not is_file_allowed(file.filename):
             raise HTTPException(status_code=400, detail="File type not allowed")
         
-        # Check file size
-        file_content = await file.read()
-        if len(file_content) > MAX_FILE_SIZE:
+        # Repeat recipient_username to send one upload to several recipients
+        recipient_usernames = list(dict.fromkeys(recipient_username))
+        if len(recipient_usernames) > MAX_RECIPIENTS:
+            raise HTTPException(status_code=400, detail=f"At most {MAX_RECIPIENTS} recipients per upload")
+        
+        # Check if recipients exist
+        recipients = {user.username: user for user in await find_users_by_username(db, recipient_usernames)}
+        missing_recipients = [username for username in recipient_usernames if username not in recipients]
+        if missing_recipients:
+            raise HTTPException(status_code=400, detail=f"Recipient not found: {', '.join(missing_recipients)}")
+        
+        # Generate unique IDs; the first recipient's file_id also names the stored blob
+        blob_id = str(uuid.uuid4())
+        file_ids = [blob_id] + [str(uuid.uuid4()) for _ in recipient_usernames[1:]]
+        
+        # Stream the upload through the chunked encryptor into storage, once for everyone,
+        # hashing the plaintext on the way to recognise content this sender already stored
+        kyber_public, holder = file_key_target(recipients[recipient_usernames[0]])
+        sig_secret, sig_public = session_keys.sig_secret, session_keys.sig_public
+        # A sample of the first chunk decides whether the upload is worth compressing
+        compressor = await run_crypto(choose_compressor, file.filename, await file.read(STREAM_CHUNK_SIZE))
+        await file.seek(0)
+        encryptor = await run_crypto(StreamEncryptor, kyber_public, sig_secret, holder=holder, compressor=compressor)
+        content_hash = new_content_hash(current_user.username)
+        response = {
+            "message": "File uploaded successfully",
+            "file_id": file_ids[0],
+            "file_ids": dict(zip(recipient_usernames, file_ids))
+        }
+        writer = await get_storage().open_writer(blob_id)
+        try:
+            file_size = await write_encrypted_upload(file, encryptor, writer, content_hash)
+            if compressor:
+                response["compression"] = finish_compression(compressor, file.filename)
+            content_key = content_hash.hexdigest()
+            # A re-send references the stored blob instead, so the new copy is never published
+            if await reuse_stored_blob(db, current_user, session_keys, content_key, file.filename,
+                                       file_size, dict(zip(recipient_usernames, file_ids)), recipients):
+                await writer.abort()
+                record_dedup_hit(writer.size)
+                return response
+            stored_size = await writer.commit()
+        except Exception:
+            await writer.abort()
+            raise
+        
+        # One signature over the blob; only the data key is wrapped per recipient
+        signature = await run_crypto(encryptor.finalize)
+        wrapped_keys = [encryptor.ciphertext]
+        for username in recipient_usernames[1:]:
+            wrapped_keys.append(await run_crypto(encryptor.wrap_key, *file_key_target(recipients[username])))
+        # The sender keeps a wrapped copy of the data key so a later re-send can reuse the blob
+        sender_key = await run_crypto(encryptor.wrap_key, *file_key_target(current_user))
+        
+        # Create file records
+        file_records = []
+        for file_id, username, wrapped_key in zip(file_ids, recipient_usernames, wrapped_keys):
+            file_records.append(FileRecord(
+                file_id=file_id,
+                filename=file.filename,
+                sender_username=current_user.username,
+                recipient_username=username,
+                encrypted_data=b"",  # Stored on disk
+                ciphertext=wrapped_key,
+                signature=signature,
+                nonce=encryptor.nonce,
+                sender_public_key=sig_public,
+                file_size=file_size,
+                blob_id=blob_id
+            ))
+        
+        # Save to database, together with the blob the records reference
+        await create_file_records(file_records, new_blob=Blob(
+            blob_id=blob_id,
+            sender_username=current_user.username,
+            content_key=content_key,
+            size=stored_size,
+            sender_key=sender_key
+        ))
+        
+        return response
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Upload error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
+
+# Create a resumable upload session
+@app.post("/api/uploads")
+async def create_upload_session_endpoint(
+    filename: str = Form(...),
+    recipient_username: str = Form(...),
+    file_size: int = Form(...),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    try:
+        if not is_file_allowed(filename):
+            raise HTTPException(status_code=400, detail="File type not allowed")
+        
+        if file_size < 0:
+            raise HTTPException(status_code=400, detail="Invalid file size")
+        
+        if file_size > MAX_FILE_SIZE:
             raise HTTPException(status_code=400, detail="File too large")
         
-        # Check if recipient exists
         recipient_data = await find_user_by_username(db, recipient_username)
         if not recipient_data:
             raise HTTPException(status_code=400, detail="Recipient not found")
         
-        # Generate unique file ID
-        file_id = str(uuid.uuid4())
-        
-        # For now, use simple encryption since crypto_utils might not be fully implemented
-        # In a real implementation, you would use the recipient's public key
-        import base64
-        encrypted_data = base64.b64encode(file_content)
-        ciphertext = b"demo_ciphertext"
-        signature = b"demo_signature"
-        nonce = b"demo_nonce"
-        sender_public_key = b"demo_public_key"
-        
-        # Save encrypted file to disk
-        encrypted_file_path = os.path.join("uploads", f"{file_id}.enc")
-        os.makedirs("uploads", exist_ok=True)
-        with open(encrypted_file_path, "wb") as f:
-            f.write(encrypted_data)
-        
-        # Create file record
-        file_record = FileRecord(
-            file_id=file_id,
-            filename=file.filename,
+        # Drop abandoned sessions along with their parts
+        for expired_id in await delete_expired_upload_sessions(db, datetime.utcnow() - UPLOAD_SESSION_TTL):
+            await get_storage().delete_parts(expired_id)
+        
+        # The stream key is only kept wrapped to the server; each part request unwraps it, and
+        # completing the session rewraps it to the recipient
+        ciphertext, nonce = await run_crypto(create_stream_key, load_server_keys()["kem_public"])
+        upload_id = str(uuid.uuid4())
+        upload_session = await create_upload_session(db, UploadSession(
+            upload_id=upload_id,
+            filename=filename,
             sender_username=current_user.username,
             recipient_username=recipient_username,
-            encrypted_data=encrypted_data,
-            ciphertext=ciphertext,
-            signature=signature,
+            file_size=file_size,
+            part_size=max(1, UPLOAD_PART_SIZE // STREAM_CHUNK_SIZE) * STREAM_CHUNK_SIZE,
+            chunk_size=STREAM_CHUNK_SIZE,
+            encrypted_key=ciphertext,
+            nonce=nonce
+        ))
+        return {**upload_session.to_dict(), "received_parts": []}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Create upload session error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to create upload session: {str(e)}")
+
+async def get_owned_upload_session(db: AsyncSession, upload_id: str, current_user: User) -> UploadSession:
+    upload_session = await find_upload_session(db, upload_id)
+    if not upload_session or upload_session.sender_username != current_user.username:
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    return upload_session
+
+# Get upload session status
+@app.get("/api/uploads/{upload_id}")
+async def get_upload_session_endpoint(
+    upload_id: str,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    upload_session = await get_owned_upload_session(db, upload_id, current_user)
+    received_parts = await list_received_parts(upload_session)
+    received_bytes = sum(
+        min(upload_session.part_size, upload_session.file_size - part_number * upload_session.part_size)
+        for part_number in received_parts
+    )
+    return {**upload_session.to_dict(), "received_parts": received_parts, "received_bytes": received_bytes}
+
+# Upload one part of a session
+@app.put("/api/uploads/{upload_id}/parts/{part_number}")
+async def upload_part_endpoint(
+    upload_id: str,
+    part_number: int,
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    try:
+        upload_session = await get_owned_upload_session(db, upload_id, current_user)
+        if part_number < 0 or part_number >= upload_session.part_count:
+            raise HTTPException(status_code=400, detail="Invalid part number")
+        
+        header = build_stream_header(upload_session.chunk_size, upload_session.nonce, STREAM_FLAG_WRAPPED_KEY)
+        cipher = await run_crypto(
+            StreamCipher.from_kem, header, upload_session.encrypted_key, load_server_keys()["kem_secret"]
+        )
+        await write_encrypted_part(request, upload_session, part_number, cipher)
+        
+        return {"upload_id": upload_id, "part_number": part_number, "received_parts": await list_received_parts(upload_session)}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Upload part error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Part upload failed: {str(e)}")
+
+# Finish an upload session
+@app.post("/api/uploads/{upload_id}/complete")
+async def complete_upload_session_endpoint(
+    upload_id: str,
+    password: Optional[str] = Form(None),  # Unlocks the keys if this worker's keyring lacks the session
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    current_user: User = Depends(get_current_user),
+    session_keys: Optional[UnlockedKeys] = Depends(get_session_keys),
+    db: AsyncSession = Depends(get_db)
+):
+    try:
+        upload_session = await get_owned_upload_session(db, upload_id, current_user)
+        session_keys = await require_session_keys(db, credentials, current_user, session_keys, password)
+        missing_parts = sorted(set(range(upload_session.part_count)) - set(await list_received_parts(upload_session)))
+        if missing_parts:
+            raise HTTPException(status_code=400, detail=f"Missing parts: {missing_parts}")
+        
+        # The upload_id becomes the file_id of the assembled file
+        nonce = upload_session.nonce
+        header = build_stream_header(upload_session.chunk_size, nonce, STREAM_FLAG_WRAPPED_KEY)
+        writer = await get_storage().open_writer(upload_id)
+        try:
+            trailer = await assemble_session_upload(upload_session, header, writer)
+            stored_size = await writer.commit()
+        except Exception:
+            await writer.abort()
+            raise
+        
+        wrapped_key = upload_session.encrypted_key
+        recipient_data = await find_user_by_username(db, upload_session.recipient_username)
+        if recipient_data:
+            kyber_public, holder = file_key_target(recipient_data)
+            if holder != KEY_HOLDER_SERVER:
+                wrapped_key = await run_crypto(
+                    rewrap_data_key, wrapped_key, load_server_keys()["kem_secret"], kyber_public, holder
+                )
+        # The sender's own copy of the data key, for their downloads
+        sender_key = upload_session.encrypted_key
+        sender_kyber_public, sender_holder = file_key_target(current_user)
+        if sender_holder != KEY_HOLDER_SERVER:
+            sender_key = await run_crypto(
+                rewrap_data_key, sender_key, load_server_keys()["kem_secret"], sender_kyber_public, sender_holder
+            )
+        sig_secret, sig_public = session_keys.sig_secret, session_keys.sig_public
+        file_record = FileRecord(
+            file_id=upload_id,
+            filename=upload_session.filename,
+            sender_username=upload_session.sender_username,
+            recipient_username=upload_session.recipient_username,
+            encrypted_data=b"",  # Stored on disk
+            ciphertext=wrapped_key,
+            signature=await run_crypto(sign_stream, header, trailer, sig_secret),
             nonce=nonce,
-            sender_public_key=sender_public_key
+            sender_public_key=sig_public,
+            file_size=upload_session.file_size,
+            blob_id=upload_id
         )
+        # Parts arrive out of order, so session uploads get no content key and are never deduplicated
+        await create_file_records([file_record], new_blob=Blob(
+            blob_id=upload_id,
+            sender_username=upload_session.sender_username,
+            size=stored_size,
+            sender_key=sender_key
+        ))
         
-        # Save to database
-        await create_file_record(db, file_record)
+        await delete_upload_session(db, upload_id)
+        await get_storage().delete_parts(upload_id)
         
-        return {"message": "File uploaded successfully", "file_id": file_id}
+        return {"message": "File uploaded successfully", "file_id": upload_id}
         
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Upload error: {str(e)}")
+        print(f"Complete upload error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
+async def file_list_params(
+    limit: int = Query(FILE_PAGE_SIZE, ge=1, le=FILE_PAGE_SIZE_MAX),
+    cursor: Optional[str] = None,
+    counterpart: Optional[str] = None,
+    filename_prefix: Optional[str] = None,
+    created_after: Optional[datetime] = None,
+    created_before: Optional[datetime] = None,
+    is_read: Optional[bool] = None
+) -> dict:
+    """Pagination and filter query parameters shared by the file listings"""
+    try:
+        decoded_cursor = decode_file_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return {
+        "limit": limit,
+        "cursor": decoded_cursor,
+        "counterpart": counterpart,
+        "filename_prefix": filename_prefix,
+        "created_after": to_utc_naive(created_after),
+        "created_before": to_utc_naive(created_before),
+        "is_read": is_read
+    }
+
+def to_utc_naive(value: Optional[datetime]) -> Optional[datetime]:
+    """Timestamps are stored as naive UTC"""
+    if value is not None and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+async def list_file_page(list_files, db: AsyncSession, username: str, params: dict) -> dict:
+    """Fetch one page of a listing plus the cursor for the next page"""
+    limit = params["limit"]
+    # Ask for one extra row to learn whether another page exists
+    files = await list_files(db, username, **{**params, "limit": limit + 1})
+    next_cursor = encode_file_cursor(files[limit - 1]) if len(files) > limit else None
+    return {"files": [file.to_dict() for file in files[:limit]], "next_cursor": next_cursor}
+
 # Get received files
 @app.get("/api/files/received")
-async def get_received_files_endpoint(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def get_received_files_endpoint(params: dict = Depends(file_list_params), current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
     try:
-        files = await get_received_files(db, current_user.username)
-        return {"files": [file.to_dict() for file in files]}
+        return await list_file_page(get_received_files, db, current_user.username, params)
     except Exception as e:
         print(f"Get received files error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to get received files: {str(e)}")
 
 # Get sent files
 @app.get("/api/files/sent")
-async def get_sent_files_endpoint(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def get_sent_files_endpoint(params: dict = Depends(file_list_params), current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
     try:
-        files = await get_sent_files(db, current_user.username)
-        return {"files": [file.to_dict() for file in files]}
+        return await list_file_page(get_sent_files, db, current_user.username, params)
     except Exception as e:
         print(f"Get sent files error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to get sent files: {str(e)}")
@@ -300,8 +1042,13 @@ async def get_sent_files_endpoint(current_user: User = Depends(get_current_user)
 @app.post("/api/download")
 async def download_file(
     file_id: str = Form(...),
+    password: Optional[str] = Form(None),  # Unlocks the keys if this worker's keyring lacks the session
+    range_header: Optional[str] = Header(None, alias="Range"),
+    if_range: Optional[str] = Header(None, alias="If-Range"),
+    credentials: HTTPAuthorizationCredentials = Depends(security),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    session_keys: Optional[UnlockedKeys] = Depends(get_session_keys),
+    db: AsyncSession = Depends(get_db)
 ):
     try:
         # Find file record
@@ -309,35 +1056,81 @@ async def download_file(
         if not file_data:
             raise HTTPException(status_code=404, detail="File not found")
         
-        # Check if user is sender or recipient
-        if file_data.sender_username != current_user.username and file_data.recipient_username != current_user.username:
-            raise HTTPException(status_code=403, detail="Access denied")
-        
-        # Read encrypted file from disk
-        encrypted_file_path = os.path.join("uploads", f"{file_id}.enc")
-        if not os.path.exists(encrypted_file_path):
-            raise HTTPException(status_code=404, detail="File not found on disk")
-        
-        with open(encrypted_file_path, "rb") as f:
-            encrypted_data = f.read()
+        # The row is the recipient's copy; a sender deleting it would take it from the recipient
+        if file_data.recipient_username != current_user.username:
+            raise HTTPException(status_code=403, detail="Only the recipient can delete a file")
         
-        # For demo purposes, just decode the base64 data
-        import base64
-        decrypted_data = base64.b64decode(encrypted_data)
+        # Locate the encrypted blob in storage
+        storage = get_storage()
+        blob_size = await storage.size(file_data.blob_id)
+        if blob_size is None:
+            raise HTTPException(status_code=404, detail="File not found in storage")
         
-        # Create temporary file for download
-        temp_file_path = os.path.join(TEMP_DIR, f"{file_id}_dec")
-        with open(temp_file_path, "wb") as f:
-            f.write(decrypted_data)
+        headers = {"Content-Disposition": content_disposition(file_data.filename)}
+        status_code = 200
+        index = await read_blob_index(storage, file_data.blob_id, blob_size)
+        if index:
+            ciphertext, signature, sender_public_key = file_data.ciphertext, file_data.signature, file_data.sender_public_key
+            # Verify the sender's signature over the chunk index before any plaintext is released,
+            # unless this exact blob and signature already passed
+            digest = verification_digest(file_data.file_id, index, signature, sender_public_key)
+            if not is_verified(file_data.verified_digest, digest):
+                if not await run_crypto(verify_stream_signature, index, signature, sender_public_key):
+                    raise HTTPException(status_code=500, detail="File integrity check failed")
+                await record_file_verified(db, file_data.file_id, digest)
+            
+            etag = '"' + hashlib.sha256(signature).hexdigest()[:32] + '"'
+            headers["ETag"] = etag
+            headers["Accept-Ranges"] = "bytes"
+            
+            # A stale If-Range validator means the client's partial copy is outdated
+            byte_range = None
+            if range_header and (if_range is None or if_range == etag):
+                byte_range = parse_byte_range(range_header, index.plaintext_size)
+            
+            # Each holder has its own wrap of the data key: the recipient's is on the file row,
+            # the sender's on the blob
+            wrapped_key = ciphertext
+            if index.flags & STREAM_FLAG_WRAPPED_KEY and current_user.username != file_data.recipient_username:
+                wrapped_key = await find_blob_sender_key(db, file_data.blob_id)
+                if wrapped_key is None:
+                    if wrapped_key_holder(ciphertext) == KEY_HOLDER_RECIPIENT:
+                        raise HTTPException(status_code=403, detail="No copy of this file's key is held for its sender")
+                    wrapped_key = ciphertext  # Wrapped to the server, which can open it for either party
+            
+            # Keys wrapped to the caller need their unlocked session keys; the KDF only runs if
+            # this worker does not hold them and the client sent the password
+            kyber_private = load_server_keys()["kem_secret"]
+            if index.flags & STREAM_FLAG_WRAPPED_KEY and wrapped_key_holder(wrapped_key) == KEY_HOLDER_RECIPIENT:
+                session_keys = await require_session_keys(db, credentials, current_user, session_keys, password)
+                kyber_private = session_keys.kem_secret
+            decryptor = await run_crypto(StreamDecryptor, index, wrapped_key, kyber_private)
+            if byte_range:
+                start, end = byte_range
+                status_code = 206
+                headers["Content-Range"] = f"bytes {start}-{end}/{index.plaintext_size}"
+                headers["Content-Length"] = str(end - start + 1)
+                content = iter_decrypted_blob(storage, file_data.blob_id, decryptor, start, end)
+            else:
+                headers["Content-Length"] = str(index.plaintext_size)
+                content = iter_decrypted_blob(storage, file_data.blob_id, decryptor)
+            content = await start_decrypted_stream(content, file_id)
+        else:
+            # Files uploaded before chunked encryption are stored as base64 until migrate_db rewrites them
+            content = iter_base64_blob(storage, file_data.blob_id, blob_size)
         
-        return FileResponse(
-            temp_file_path,
-            filename=file_data.filename,
-            media_type="application/octet-stream"
+        return StreamingResponse(
+            content,
+            status_code=status_code,
+            media_type="application/octet-stream",
+            headers=headers
         )
         
     except HTTPException:
         raise
+    except ChunkIntegrityError as e:
+        print(f"❌ Download of {file_id} failed its integrity check: {str(e)}")
+        raise HTTPException(status_code=500, detail="Stored file failed its integrity check")
     except Exception as e:
         print(f"Download error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Download failed: {str(e)}")
@@ -347,7 +1140,7 @@ async def download_file(
 async def get_file_metadata(
     file_id: str,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     try:
         # Find file record
@@ -355,9 +1148,9 @@ async def get_file_metadata(
         if not file_data:
             raise HTTPException(status_code=404, detail="File not found")
         
-        # Check if user is sender or recipient
-        if file_data.sender_username != current_user.username and file_data.recipient_username != current_user.username:
-            raise HTTPException(status_code=403, detail="Access denied")
+        # The row is the recipient's copy; a sender deleting it would take it from the recipient
+        if file_data.recipient_username != current_user.username:
+            raise HTTPException(status_code=403, detail="Only the recipient can delete a file")
         
         # Return metadata
         return {
@@ -374,9 +1167,34 @@ async def get_file_metadata(
         print(f"Get metadata error: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to get metadata: {str(e)}")
 
+# Delete a shared file; its blob is reclaimed once no file references it
+@app.delete("/api/files/{file_id}")
+async def delete_file(
+    file_id: str,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+):
+    try:
+        file_data = await find_file_by_id(db, file_id)
+        if not file_data:
+            raise HTTPException(status_code=404, detail="File not found")
+        
+        # The row is the recipient's copy; a sender deleting it would take it from the recipient
+        if file_data.recipient_username != current_user.username:
+            raise HTTPException(status_code=403, detail="Only the recipient can delete a file")
+        
+        await delete_file_record(db, file_id)
+        return {"message": "File deleted", "file_id": file_id}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Delete file error: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to delete file: {str(e)}")
+
 # Health check
 @app.get("/api/health")
-async def health_check_endpoint(db: Session = Depends(get_db)):
+async def health_check_endpoint(db: AsyncSession = Depends(get_db)):
     try:
         is_healthy = await health_check(db)
         if is_healthy:
@@ -386,6 +1204,25 @@ async def health_check_endpoint(db: Session = Depends(get_db)):
     except Exception as e:
         return {"status": "unhealthy", "error": str(e)}
 
+# Runtime metrics
+# Metrics expose usage patterns (cache hit counts, stage timings), so they need a logged-in user
+@app.get("/api/metrics")
+async def metrics_endpoint(current_user: User = Depends(get_current_user)):
+    return {
+        "crypto_executor": get_crypto_executor().metrics(),
+        "kdf_executor": get_kdf_executor().metrics(),
+        "principal_cache": get_principal_cache().metrics(),
+        "token_cache": token_cache_metrics(),
+        "session_keyring": get_session_keyring().metrics(),
+        "keypair_pools": keypair_pool_metrics(),
+        "oqs_contexts": oqs_context_metrics(),
+        "blob_store": blob_store_metrics(),
+        "storage": get_storage().metrics(),
+        "compression": compression_metrics(),
+        "verification_cache": verification_cache_metrics(),
+        "db_writer": db_writer_metrics()
+    }
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
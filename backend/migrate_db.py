@@ -3,56 +3,317 @@
 Database migration script for QuantumDocs
 """
 
+import asyncio
+import base64
+import binascii
 import os
 import sqlite3
-from models import engine, Base, User, SharedMetadata
+import struct
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from models import engine, Base, User, SharedMetadata, Blob
+from migrations import Backfill, IndexBuild, Migration, MigrationRunner, Step, DATABASE_PATH, MIGRATION_BATCH_SIZE
+from storage import STORAGE_BACKEND, STORAGE_LOCAL_ROOT, BLOB_SUFFIX, shard_path, flat_path, get_storage, shutdown_storage
+from blob_store import new_content_hash
+from crypto_utils import (
+    load_server_keys, is_stream_header, StreamEncryptor, STREAM_TRAILER_FORMAT, STREAM_TRAILER_SIZE,
+    KEY_HOLDER_SERVER, KEY_HOLDER_RECIPIENT
+)
+from database import User as UserRecord
 
-def migrate_database():
-    """Migrate the database to the latest schema"""
-    print("🔄 Checking database schema...")
-    
-    # Check if database exists
-    db_path = "./quantumdocs.db"
-    if not os.path.exists(db_path):
-        print("✅ Database doesn't exist, creating new one...")
-        Base.metadata.create_all(bind=engine)
+# Columns added after the first release, by table
+REQUIRED_COLUMNS = {
+    "users": {"kem_salt": "TEXT", "kem_nonce": "TEXT", "sig_salt": "TEXT", "sig_nonce": "TEXT"},
+    "shared_metadata": {"file_size": "INTEGER", "blob_id": "VARCHAR", "verified_digest": "BLOB"},
+}
+
+# Crypto columns that held base64 text before they became binary, by table
+BINARY_COLUMNS = {
+    "shared_metadata": ("encrypted_key", "nonce", "signature", "sender_public_key"),
+    "blobs": ("sender_key",),
+    "upload_sessions": ("encrypted_key", "nonce"),
+}
+
+LEGACY_READ_SIZE = 1024 * 1024  # Base64 bytes read at a time; a multiple of 4
+
+def shard_local_blobs():
+    """Move blobs from the flat upload directory into the hashed fan-out layout"""
+    if not os.path.isdir(STORAGE_LOCAL_ROOT):
         return
-    
-    # Connect to existing database
-    conn = sqlite3.connect(db_path)
+    moved = 0
+    for entry in os.scandir(STORAGE_LOCAL_ROOT):
+        if entry.is_file() and entry.name.endswith(BLOB_SUFFIX):
+            blob_id = entry.name[:-len(BLOB_SUFFIX)]
+            path = shard_path(STORAGE_LOCAL_ROOT, blob_id)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(flat_path(STORAGE_LOCAL_ROOT, blob_id), path)
+            moved += 1
+    if moved:
+        print(f"✅ Moved {moved} blobs into sharded directories")
+
+def backfill_blobs(conn):
+    """
+    Register the payloads of rows written before the blob table existed, with their reference
+    counts. Each blob is inserted with its full count, so committing every MIGRATION_BATCH_SIZE
+    blobs keeps lock holds short and a rerun picks up the rest.
+    """
     cursor = conn.cursor()
+    cursor.execute(
+        "SELECT blob_id, MIN(sender_id), COUNT(*), MIN(created_at), MAX(created_at) FROM shared_metadata "
+        "WHERE blob_id NOT IN (SELECT id FROM blobs) GROUP BY blob_id"
+    )
+    rows = cursor.fetchall()
+    if not rows:
+        return
     
-    # Check if new columns exist
-    cursor.execute("PRAGMA table_info(users)")
-    columns = [column[1] for column in cursor.fetchall()]
-    
-    missing_columns = []
-    required_columns = ['kem_salt', 'kem_nonce', 'sig_salt', 'sig_nonce']
-    
-    for col in required_columns:
-        if col not in columns:
-            missing_columns.append(col)
+    print(f"🔄 Registering {len(rows)} stored blobs...")
+    for number, (blob_id, sender_id, ref_count, created_at, updated_at) in enumerate(rows, 1):
+        path = shard_path(STORAGE_LOCAL_ROOT, blob_id)
+        size = os.path.getsize(path) if STORAGE_BACKEND == "local" and os.path.exists(path) else None
+        cursor.execute(
+            "INSERT INTO blobs (id, sender_id, size, ref_count, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (blob_id, sender_id, size, ref_count, created_at, updated_at)
+        )
+        if number % MIGRATION_BATCH_SIZE == 0:
+            conn.commit()
+    conn.commit()
+    print("✅ Blobs registered")
+
+def _decode_text(value: str) -> bytes:
+    try:
+        return base64.b64decode(value, validate=True)
+    except binascii.Error:
+        # Not base64 (e.g. placeholder values of legacy rows); keep the text as bytes
+        return value.encode()
+
+def _key_target(user: UserRecord):
+    """Kyber public key (and key holder) to wrap a user's data keys to; mirrors main.file_key_target"""
+    if user.has_keys:
+        return base64.b64decode(user.kem_public_key), KEY_HOLDER_RECIPIENT
+    return load_server_keys()["kem_public"], KEY_HOLDER_SERVER
+
+def _load_users(conn) -> dict:
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT id, username, email, hashed_password, {', '.join(UserRecord.KEY_FIELDS)} FROM users")
+    return {
+        row[0]: UserRecord(row[1], row[2], row[3], id=row[0], keys=dict(zip(UserRecord.KEY_FIELDS, row[4:])))
+        for row in cursor.fetchall()
+    }
+
+def rewrite_legacy_blobs(conn):
+    """
+    Encrypt payloads stored as base64 plaintext (uploads from before chunked encryption) into
+    stream containers. Each one is written under a new blob id and its rows are repointed in one
+    transaction; the old blob is released to the blob collector. Only rows without a file_size
+    can be legacy, so finished files are not read again on later runs.
+    """
+    cursor = conn.cursor()
+    cursor.execute("SELECT id, blob_id, sender_id, recipient_id FROM shared_metadata WHERE file_size IS NULL")
+    rows_by_blob = defaultdict(list)
+    for row in cursor.fetchall():
+        rows_by_blob[row[1]].append(row)
+    if not rows_by_blob:
+        return
     
-    if missing_columns:
-        print(f"⚠️  Missing columns: {missing_columns}")
-        print("🔄 Adding missing columns...")
+    print(f"🔄 Checking {len(rows_by_blob)} blobs stored before chunked encryption...")
+    try:
+        rewritten = asyncio.run(_rewrite_legacy_blobs(conn, rows_by_blob))
+    finally:
+        shutdown_storage()
+    print(f"✅ Encrypted {rewritten} legacy blobs")
+
+async def _rewrite_legacy_blobs(conn, rows_by_blob: dict) -> int:
+    storage = get_storage()
+    users = _load_users(conn)
+    server_keys = load_server_keys()
+    cursor = conn.cursor()
+    rewritten = 0
+    for blob_id, rows in rows_by_blob.items():
+        blob_size = await storage.size(blob_id)
+        if blob_size is None:
+            print(f"⚠️  Blob {blob_id} is missing from storage, skipping")
+            continue
+        
+        if is_stream_header(await storage.read(blob_id, 0, 4)):
+            # Already a stream container; record the plaintext size so it is not checked again
+            trailer = await storage.read(blob_id, max(blob_size - STREAM_TRAILER_SIZE, 0), STREAM_TRAILER_SIZE)
+            plaintext_size = struct.unpack(STREAM_TRAILER_FORMAT, trailer)[0]
+            cursor.executemany(
+                "UPDATE shared_metadata SET file_size = ? WHERE id = ?", [(plaintext_size, row[0]) for row in rows]
+            )
+            conn.commit()
+            continue
+        
+        sender = users.get(rows[0][2])
+        if not sender or any(row[3] not in users for row in rows):
+            print(f"⚠️  Blob {blob_id} belongs to a deleted user, skipping")
+            continue
         
-        for col in missing_columns:
-            try:
-                cursor.execute(f"ALTER TABLE users ADD COLUMN {col} TEXT")
-                print(f"✅ Added column: {col}")
-            except sqlite3.OperationalError as e:
-                if "duplicate column name" in str(e):
-                    print(f"✅ Column {col} already exists")
-                else:
-                    print(f"❌ Error adding column {col}: {e}")
+        # The original sender's key is locked behind their password, so the server key signs
+        kyber_public, holder = _key_target(users[rows[0][3]])
+        encryptor = StreamEncryptor(kyber_public, server_keys["sig_secret"], holder=holder)
+        content_hash = new_content_hash(sender.username)
+        new_blob_id = str(uuid.uuid4())
+        writer = await storage.open_writer(new_blob_id)
+        try:
+            await writer.write(encryptor.header)
+            buffer = bytearray()
+            for offset in range(0, blob_size, LEGACY_READ_SIZE):
+                buffer += base64.b64decode(await storage.read(blob_id, offset, LEGACY_READ_SIZE))
+                # Hold back the last chunk until the input ends, so it can be flagged final
+                while len(buffer) > encryptor.chunk_size:
+                    chunk = bytes(buffer[:encryptor.chunk_size])
+                    del buffer[:encryptor.chunk_size]
+                    content_hash.update(chunk)
+                    await writer.write(encryptor.encrypt_chunk(chunk))
+            content_hash.update(bytes(buffer))
+            await writer.write(encryptor.encrypt_chunk(bytes(buffer), final=True))
+            await writer.write(encryptor.trailer())
+            stored_size = await writer.commit()
+        except Exception:
+            await writer.abort()
+            raise
         
+        signature = encryptor.finalize()
+        now = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S.%f")
+        for number, (row_id, _, _, recipient_id) in enumerate(rows):
+            wrapped_key = encryptor.ciphertext if number == 0 else encryptor.wrap_key(*_key_target(users[recipient_id]))
+            cursor.execute(
+                "UPDATE shared_metadata SET blob_id = ?, encrypted_key = ?, nonce = ?, signature = ?, "
+                "sender_public_key = ?, file_size = ? WHERE id = ?",
+                (new_blob_id, wrapped_key, encryptor.nonce, signature, server_keys["sig_public"],
+                 encryptor.plaintext_size, row_id)
+            )
+        cursor.execute(
+            "INSERT INTO blobs (id, sender_id, content_key, size, sender_key, ref_count, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (new_blob_id, sender.id, content_hash.hexdigest(), stored_size,
+             encryptor.wrap_key(*_key_target(sender)), len(rows), now, now)
+        )
+        cursor.execute(
+            "UPDATE blobs SET ref_count = ref_count - ?, updated_at = ? WHERE id = ?", (len(rows), now, blob_id)
+        )
         conn.commit()
-        print("✅ Database migration completed")
-    else:
-        print("✅ Database schema is up to date")
+        rewritten += 1
+    return rewritten
+
+def add_user_email(conn):
+    """Add the email column to users created before emails were required"""
+    columns = [column[1] for column in conn.execute("PRAGMA table_info(users)").fetchall()]
+    if "email" not in columns:
+        conn.execute("ALTER TABLE users ADD COLUMN email TEXT")
+        conn.commit()
+        print("✅ Added column: users.email")
+
+def set_temporary_emails(cursor, rows):
+    # Users update these to real addresses; the unique index is built once every row has one
+    cursor.execute(
+        f"UPDATE users SET email = username || '@temp.local' WHERE rowid IN ({', '.join('?' * len(rows))})",
+        [row[0] for row in rows]
+    )
+
+def add_required_columns(conn):
+    """Add columns introduced after the first release (ADD COLUMN does not rewrite the table)"""
+    cursor = conn.cursor()
+    for table, required_columns in REQUIRED_COLUMNS.items():
+        cursor.execute(f"PRAGMA table_info({table})")
+        columns = [column[1] for column in cursor.fetchall()]
+        for col, col_type in required_columns.items():
+            if col not in columns:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN {col} {col_type}")
+                print(f"✅ Added column: {table}.{col}")
+    conn.commit()
+
+def create_new_tables(conn):
+    """Create tables added after the first release, with their indexes"""
+    Base.metadata.create_all(bind=engine)
+
+def shard_local_blobs_step(conn):
+    if STORAGE_BACKEND == "local":
+        shard_local_blobs()
+
+def set_blob_ids(cursor, rows):
+    cursor.executemany("UPDATE shared_metadata SET blob_id = file_id WHERE rowid = ?", [(row[0],) for row in rows])
+
+def _binary_backfill(table: str, column: str) -> Backfill:
+    def decode(cursor, rows):
+        cursor.executemany(
+            f"UPDATE {table} SET {column} = ? WHERE rowid = ?", [(_decode_text(value), rowid) for rowid, value in rows]
+        )
+    return Backfill(f"{table}.{column}", table, [column], f"typeof({column}) = 'text'", decode)
+
+# Applied in order and recorded in schema_migrations. Steps are safe to run again, so databases
+# migrated before versions were recorded go through all of them once.
+MIGRATIONS = [
+    Migration(1, "add_user_email", [
+        Step("add_column", add_user_email),
+        Backfill("users.email", "users", ["username"], "email IS NULL", set_temporary_emails),
+        IndexBuild(next(index for index in User.__table__.indexes if index.name == "ix_users_email"))
+    ]),
+    Migration(2, "add_key_blob_and_verification_columns", [Step("add_columns", add_required_columns)]),
+    Migration(3, "create_blob_and_upload_session_tables", [Step("create_tables", create_new_tables)]),
+    Migration(4, "shard_local_blobs", [Step("move_blobs", shard_local_blobs_step)]),
+    Migration(5, "register_blobs", [
+        Backfill("shared_metadata.blob_id", "shared_metadata", ["file_id"], "blob_id IS NULL", set_blob_ids),
+        Step("register_blobs", backfill_blobs)
+    ]),
+    Migration(6, "binary_crypto_columns", [
+        _binary_backfill(table, column) for table, columns in BINARY_COLUMNS.items() for column in columns
+    ]),
+    Migration(7, "encrypt_legacy_blobs", [Step("encrypt_blobs", rewrite_legacy_blobs)]),
+    # create_all skips indexes of tables that already exist, so add any missing ones
+    Migration(8, "file_and_blob_indexes", [
+        IndexBuild(index) for index in list(SharedMetadata.__table__.indexes) + list(Blob.__table__.indexes)
+    ]),
+]
+
+def _database_exists(db_path: str) -> bool:
+    if not os.path.exists(db_path):
+        return False
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'users'").fetchone() is not None
+    finally:
+        conn.close()
+
+def migrate_database(target=None):
+    """Migrate the database to the latest schema (or to version target)"""
+    print("🔄 Checking database schema...")
+    
+    # Check if database exists
+    if not _database_exists(DATABASE_PATH):
+        print("✅ Database doesn't exist, creating new one...")
+        Base.metadata.create_all(bind=engine)
+        runner = MigrationRunner(MIGRATIONS)
+        runner.stamp()
+        runner.close()
+        return
     
-    conn.close()
+    runner = MigrationRunner(MIGRATIONS)
+    try:
+        runner.run(target)
+    except KeyboardInterrupt:
+        print("⏸️  Migration interrupted; run it again to resume from the last checkpoint")
+    finally:
+        runner.close()
+
+def prepare_database():
+    """Create the schema of a new database; only report pending migrations of an existing one"""
+    if not _database_exists(DATABASE_PATH):
+        migrate_database()
+        return
+    runner = MigrationRunner(MIGRATIONS)
+    pending = runner.pending()
+    runner.close()
+    if pending:
+        print(f"⚠️  {len(pending)} database migrations pending "
+              f"({', '.join(str(migration.version) for migration in pending)}); run python migrate_db.py")
+
+def migration_status():
+    runner = MigrationRunner(MIGRATIONS)
+    runner.status()
+    runner.close()
 
 def reset_database():
     """Reset the database (WARNING: This will delete all data)"""
@@ -61,11 +322,13 @@ def reset_database():
     
     if response.lower() == 'yes':
         print("🗑️  Deleting existing database...")
-        if os.path.exists("./quantumdocs.db"):
-            os.remove("./quantumdocs.db")
+        # Including the WAL files, which would otherwise be replayed into the new database
+        for path in (DATABASE_PATH, DATABASE_PATH + "-wal", DATABASE_PATH + "-shm"):
+            if os.path.exists(path):
+                os.remove(path)
         
         print("🔄 Creating new database...")
-        Base.metadata.create_all(bind=engine)
+        migrate_database()
         print("✅ Database reset completed")
     else:
         print("❌ Database reset cancelled")
@@ -75,5 +338,8 @@ if __name__ == "__main__":
     
     if len(sys.argv) > 1 and sys.argv[1] == "reset":
         reset_database()
+    elif len(sys.argv) > 1 and sys.argv[1] == "status":
+        migration_status()
     else:
-        migrate_database() 
\ No newline at end of file
+        # Optional target version, e.g. python migrate_db.py 3
+        migrate_database(int(sys.argv[1]) if len(sys.argv) > 1 else None) 
\ No newline at end of file
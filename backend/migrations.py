@@ -0,0 +1,225 @@
+import os
+import sqlite3
+import time
+from datetime import datetime
+from typing import Callable, List, Optional
+
+from sqlalchemy import Index
+from sqlalchemy.schema import CreateIndex
+
+from models import DATABASE_PATH, apply_sqlite_pragmas, engine
+
+# === Migration Configuration ===
+# Backfills update MIGRATION_BATCH_SIZE rows per transaction and record how far they got in that
+# same transaction, so the service keeps writing between batches (the database is in WAL mode,
+# reads never wait) and an interrupted run resumes at its last committed batch.
+MIGRATION_BATCH_SIZE = int(os.getenv("MIGRATION_BATCH_SIZE", "1000"))
+MIGRATION_BATCH_PAUSE_MS = float(os.getenv("MIGRATION_BATCH_PAUSE_MS", "0"))  # Pause between batches, leaving the lock to the service
+MIGRATION_PROGRESS_SECONDS = 2.0  # How often a long step reports its progress
+
+def _now() -> str:
+    return datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S.%f")
+
+class _Progress:
+    """Prints rows done and rows/sec of one step at most every MIGRATION_PROGRESS_SECONDS"""
+
+    def __init__(self, label: str, done: int, total: int):
+        self.label = label
+        self.first = done
+        self.total = total
+        self.started = self.reported = time.perf_counter()
+
+    def update(self, done: int, final: bool = False) -> None:
+        now = time.perf_counter()
+        if not final and now - self.reported < MIGRATION_PROGRESS_SECONDS:
+            return
+        self.reported = now
+        elapsed = now - self.started
+        rate = (done - self.first) / elapsed if elapsed > 0 else 0.0
+        percent = f" ({done * 100 // self.total}%)" if self.total else ""
+        print(f"   {self.label}: {done}/{self.total} rows{percent}, {rate:.0f} rows/s")
+
+class Step:
+    """A step run in one go; it must be safe to run again (e.g. DDL guarded by a check, file moves)"""
+
+    def __init__(self, name: str, run: Callable[[sqlite3.Connection], None]):
+        self.name = name
+        self.run = run
+
+    def apply(self, runner: "MigrationRunner", version: int) -> None:
+        self.run(runner.conn)
+
+class Backfill:
+    """
+    Applies update(cursor, rows) to the rows of table matching where, in rowid order and one
+    batch per transaction. rows are (rowid, *columns) tuples. The checkpoint (last rowid and
+    rows done) is saved in the batch's transaction, so each row is updated exactly once.
+    """
+
+    def __init__(self, name: str, table: str, columns: List[str], where: str,
+                 update: Callable[[sqlite3.Cursor, list], None]):
+        self.name = name
+        self.table = table
+        self.columns = columns
+        self.where = where
+        self.update = update
+
+    def apply(self, runner: "MigrationRunner", version: int) -> None:
+        conn = runner.conn
+        cursor = conn.cursor()
+        position, done = runner.checkpoint(version, self.name)
+        remaining = cursor.execute(
+            f"SELECT COUNT(*) FROM {self.table} WHERE rowid > ? AND ({self.where})", (position,)
+        ).fetchone()[0]
+        if position:
+            print(f"   {self.name}: resuming after rowid {position} ({done} rows done)")
+        progress = _Progress(self.name, done, done + remaining)
+
+        while True:
+            # Take the write lock up front; the batch is read and updated in the same transaction
+            cursor.execute("BEGIN IMMEDIATE")
+            rows = cursor.execute(
+                f"SELECT rowid, {', '.join(self.columns)} FROM {self.table} "
+                f"WHERE rowid > ? AND ({self.where}) ORDER BY rowid LIMIT ?",
+                (position, runner.batch_size)
+            ).fetchall()
+            if not rows:
+                conn.rollback()
+                break
+            self.update(cursor, rows)
+            position = rows[-1][0]
+            done += len(rows)
+            runner.save_checkpoint(version, self.name, position, done)
+            conn.commit()
+            progress.update(done)
+            if runner.pause:
+                time.sleep(runner.pause)
+        progress.update(done, final=True)
+
+class IndexBuild:
+    """
+    Builds one index in its own transaction. SQLite holds the write lock while it builds an index
+    (reads go on in WAL mode), so indexes are built one at a time after the backfills instead of
+    in one long transaction with them.
+    """
+
+    def __init__(self, index: Index):
+        self.name = f"index {index.name}"
+        self.index = index
+
+    def apply(self, runner: "MigrationRunner", version: int) -> None:
+        started = time.perf_counter()
+        runner.conn.execute(str(CreateIndex(self.index, if_not_exists=True).compile(dialect=engine.dialect)))
+        runner.conn.commit()
+        print(f"   {self.name}: built in {time.perf_counter() - started:.2f}s")
+
+class Migration:
+    def __init__(self, version: int, name: str, steps: list):
+        self.version = version
+        self.name = name
+        self.steps = steps
+
+class MigrationRunner:
+    """Applies migrations in version order, recording applied versions and step checkpoints"""
+
+    def __init__(self, migrations: List[Migration], db_path: str = DATABASE_PATH,
+                 batch_size: int = MIGRATION_BATCH_SIZE, pause_ms: float = MIGRATION_BATCH_PAUSE_MS):
+        self.migrations = sorted(migrations, key=lambda migration: migration.version)
+        self.batch_size = max(1, batch_size)
+        self.pause = pause_ms / 1000
+        self.conn = sqlite3.connect(db_path)
+        apply_sqlite_pragmas(self.conn)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS schema_migrations "
+            "(version INTEGER PRIMARY KEY, name TEXT NOT NULL, applied_at TIMESTAMP NOT NULL, seconds REAL)"
+        )
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS migration_checkpoints "
+            "(version INTEGER NOT NULL, step TEXT NOT NULL, position INTEGER NOT NULL DEFAULT 0, "
+            "rows INTEGER NOT NULL DEFAULT 0, done INTEGER NOT NULL DEFAULT 0, updated_at TIMESTAMP, "
+            "PRIMARY KEY (version, step))"
+        )
+        self.conn.commit()
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def applied_versions(self) -> dict:
+        return dict(self.conn.execute("SELECT version, applied_at FROM schema_migrations").fetchall())
+
+    def pending(self, target: Optional[int] = None) -> List[Migration]:
+        applied = self.applied_versions()
+        return [
+            migration for migration in self.migrations
+            if migration.version not in applied and (target is None or migration.version <= target)
+        ]
+
+    def checkpoint(self, version: int, step: str) -> tuple:
+        """(position, rows done) saved for a step, (0, 0) if it has not started"""
+        row = self.conn.execute(
+            "SELECT position, rows FROM migration_checkpoints WHERE version = ? AND step = ?", (version, step)
+        ).fetchone()
+        return row or (0, 0)
+
+    def save_checkpoint(self, version: int, step: str, position: int, rows: int, done: bool = False) -> None:
+        """Record a step's progress; the caller commits, together with the work it covers"""
+        self.conn.execute(
+            "INSERT INTO migration_checkpoints (version, step, position, rows, done, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (version, step) DO UPDATE SET "
+            "position = excluded.position, rows = excluded.rows, done = excluded.done, updated_at = excluded.updated_at",
+            (version, step, position, rows, int(done), _now())
+        )
+
+    def _step_done(self, version: int, step: str) -> bool:
+        row = self.conn.execute(
+            "SELECT done FROM migration_checkpoints WHERE version = ? AND step = ?", (version, step)
+        ).fetchone()
+        return bool(row and row[0])
+
+    def _record_applied(self, migration: Migration, seconds: Optional[float]) -> None:
+        self.conn.execute(
+            "INSERT INTO schema_migrations (version, name, applied_at, seconds) VALUES (?, ?, ?, ?)",
+            (migration.version, migration.name, _now(), seconds)
+        )
+        self.conn.execute("DELETE FROM migration_checkpoints WHERE version = ?", (migration.version,))
+        self.conn.commit()
+
+    def run(self, target: Optional[int] = None) -> int:
+        """Apply pending migrations up to target (all by default); returns how many were applied"""
+        pending = self.pending(target)
+        if not pending:
+            print("✅ Database schema is up to date")
+            return 0
+
+        for migration in pending:
+            print(f"🔄 Migration {migration.version}: {migration.name}")
+            started = time.perf_counter()
+            for step in migration.steps:
+                if self._step_done(migration.version, step.name):
+                    print(f"   {step.name}: already done")
+                    continue
+                step.apply(self, migration.version)
+                position, rows = self.checkpoint(migration.version, step.name)
+                self.save_checkpoint(migration.version, step.name, position, rows, done=True)
+                self.conn.commit()
+            elapsed = time.perf_counter() - started
+            self._record_applied(migration, elapsed)
+            print(f"✅ Migration {migration.version} applied in {elapsed:.2f}s")
+        return len(pending)
+
+    def stamp(self) -> None:
+        """Record every migration as applied (for a database just created at the latest schema)"""
+        for migration in self.pending():
+            self._record_applied(migration, None)
+
+    def status(self) -> None:
+        applied = self.applied_versions()
+        for migration in self.migrations:
+            if migration.version in applied:
+                print(f"✅ {migration.version:>3} {migration.name} (applied {applied[migration.version]})")
+                continue
+            print(f"⏳ {migration.version:>3} {migration.name} (pending)")
+            for step, position, rows, done in self.conn.execute(
+                "SELECT step, position, rows, done FROM migration_checkpoints WHERE version = ?", (migration.version,)
+            ).fetchall():
+                print(f"      {step}: {'done' if done else f'{rows} rows, at rowid {position}'}")
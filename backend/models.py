@@ -1,13 +1,51 @@
-from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime, ForeignKey, Boolean
+from sqlalchemy import create_engine, event, Column, Integer, String, Text, DateTime, ForeignKey, Boolean, Index, LargeBinary
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import sessionmaker, relationship, deferred
 from datetime import datetime
 import os
 
+# === SQLite Configuration ===
+# Applied to every connection. WAL lets reads run alongside the writer and makes a commit an
+# append to the log; with synchronous=NORMAL only checkpoints wait for fsync (a power loss can
+# drop the last commits, never corrupt the database).
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))  # Wait for a lock instead of failing
+SQLITE_CACHE_SIZE_MB = int(os.getenv("SQLITE_CACHE_SIZE_MB", "64"))  # Page cache per connection
+SQLITE_MMAP_SIZE_MB = int(os.getenv("SQLITE_MMAP_SIZE_MB", "256"))  # 0 = no memory-mapped reads
+
+def apply_sqlite_pragmas(dbapi_connection, connection_record=None):
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+    cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_MB * 1024}")
+    cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE_MB * 1024 * 1024}")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.close()
+
 # Create database
-DATABASE_URL = "sqlite:///./quantumdocs.db"
+DATABASE_PATH = os.getenv("DATABASE_PATH", "./quantumdocs.db")
+DATABASE_URL = f"sqlite:///{DATABASE_PATH}"
 engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+event.listen(engine, "connect", apply_sqlite_pragmas)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Async engine used by the API; the sync engine above is kept for schema creation and scripts
+ASYNC_DATABASE_URL = DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))  # Seconds to wait for a free connection
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_pre_ping=True
+)
+event.listen(async_engine.sync_engine, "connect", apply_sqlite_pragmas)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 Base = declarative_base()
 
 class User(Base):
@@ -36,22 +74,66 @@ class SharedMetadata(Base):
     
     id = Column(Integer, primary_key=True, index=True)
     file_id = Column(String, index=True)
-    encrypted_key = Column(Text)  # Base64 encoded
-    nonce = Column(Text)  # Base64 encoded
-    signature = Column(Text)  # Base64 encoded
-    sender_public_key = Column(Text)  # Base64 encoded
+    blob_id = Column(String, index=True)  # Stored payload; one blob can back several recipients' rows
+    # Crypto material is only needed for downloads, so listings never load it
+    encrypted_key = deferred(Column(LargeBinary), group="crypto")  # Wrapped data key
+    nonce = deferred(Column(LargeBinary), group="crypto")  # Stream nonce prefix
+    signature = deferred(Column(LargeBinary), group="crypto")  # Dilithium signature of the stream
+    sender_public_key = deferred(Column(LargeBinary), group="crypto")  # Signer's Dilithium public key
+    verified_digest = deferred(Column(LargeBinary), group="crypto")  # Blob and signature last verified (see verification_cache)
     sender_id = Column(Integer, ForeignKey("users.id"))
     recipient_id = Column(Integer, ForeignKey("users.id"))
     encrypted_metadata = Column(Text)  # Metadata encrypted with recipient's public key
+    file_size = Column(Integer)  # Plaintext size in bytes
     created_at = Column(DateTime, default=datetime.utcnow)
     is_read = Column(Boolean, default=False)
     
     # Relationships
     sender = relationship("User", foreign_keys=[sender_id], back_populates="sent_shares")
     recipient = relationship("User", foreign_keys=[recipient_id], back_populates="received_shares")
+    
+    __table_args__ = (
+        # Keyset pagination of the inbox and sent listings (newest first)
+        Index("ix_shared_metadata_recipient_created", "recipient_id", "created_at", "id"),
+        Index("ix_shared_metadata_sender_created", "sender_id", "created_at", "id"),
+    )
+
+class Blob(Base):
+    __tablename__ = "blobs"
+
+    id = Column(String, primary_key=True, index=True)  # Names the stored payload, uploads/{id}.enc
+    sender_id = Column(Integer, ForeignKey("users.id"))
+    content_key = Column(String)  # Keyed hash of sender + plaintext; None = never deduplicated against
+    size = Column(Integer)  # Stored (encrypted) bytes
+    sender_key = Column(LargeBinary)  # Data key wrapped to the sender, so a re-send can reuse the blob
+    ref_count = Column(Integer, default=0)  # SharedMetadata rows pointing at this blob
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)  # Last reference change; GC grace runs from here
+
+    __table_args__ = (
+        # Re-send lookup
+        Index("ix_blobs_sender_content", "sender_id", "content_key"),
+    )
+
+class UploadSession(Base):
+    __tablename__ = "upload_sessions"
+    
+    id = Column(String, primary_key=True, index=True)  # upload_id handed to the client
+    sender_id = Column(Integer, ForeignKey("users.id"))
+    recipient_id = Column(Integer, ForeignKey("users.id"))
+    filename = Column(String)
+    file_size = Column(Integer)
+    part_size = Column(Integer)  # Plaintext bytes per uploaded part, a multiple of chunk_size
+    chunk_size = Column(Integer)  # Plaintext bytes per encrypted chunk
+    encrypted_key = Column(LargeBinary)  # Stream data key wrapped to the server
+    nonce = Column(LargeBinary)  # Stream nonce prefix
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    sender = relationship("User", foreign_keys=[sender_id])
+    recipient = relationship("User", foreign_keys=[recipient_id])
 
-# Create tables
-Base.metadata.create_all(bind=engine)
+# Tables are created and migrated by migrate_db.py (main creates a new database on startup)
 
 def get_db():
     db = SessionLocal()
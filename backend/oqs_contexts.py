@@ -0,0 +1,82 @@
+import oqs
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+
+# === liboqs Context Layer ===
+# Building an oqs.KeyEncapsulation / oqs.Signature allocates a native context and looks up
+# the algorithm, which costs about as much as a fast operation itself. Keyless contexts
+# (encapsulators, verifiers) are kept one per thread and reused for every operation; keyed
+# contexts (decapsulators, signers) are only reused when the caller says the secret is
+# long-lived, so user secrets never linger in per-thread caches.
+KEYED_CONTEXTS_PER_THREAD = 4
+
+_local = threading.local()
+_stats_lock = threading.Lock()
+_stats = {"created": 0, "reused": 0}
+
+def _count(reused: bool) -> None:
+    with _stats_lock:
+        _stats["reused" if reused else "created"] += 1
+
+def _thread_contexts() -> dict:
+    contexts = getattr(_local, "contexts", None)
+    if contexts is None:
+        contexts = _local.contexts = {"keyless": {}, "keyed": OrderedDict()}
+    return contexts
+
+@lru_cache(maxsize=None)
+def kem_details(algorithm: str) -> dict:
+    """Static parameters of a KEM (key, ciphertext and shared secret lengths)"""
+    kem = oqs.KeyEncapsulation(algorithm)
+    return dict(kem.details)
+
+@lru_cache(maxsize=None)
+def sig_details(algorithm: str) -> dict:
+    """Static parameters of a signature scheme (key and signature lengths)"""
+    sig = oqs.Signature(algorithm)
+    return dict(sig.details)
+
+def _keyless(kind: str, factory, algorithm: str):
+    contexts = _thread_contexts()["keyless"]
+    context = contexts.get((kind, algorithm))
+    _count(context is not None)
+    if context is None:
+        context = contexts[(kind, algorithm)] = factory(algorithm)
+    return context
+
+def _keyed(kind: str, factory, algorithm: str, secret_key: bytes, reuse: bool):
+    if not reuse:
+        _count(False)
+        return factory(algorithm, secret_key=secret_key)
+    contexts = _thread_contexts()["keyed"]
+    key = (kind, algorithm, secret_key)
+    context = contexts.get(key)
+    _count(context is not None)
+    if context is None:
+        context = contexts[key] = factory(algorithm, secret_key=secret_key)
+        while len(contexts) > KEYED_CONTEXTS_PER_THREAD:
+            contexts.popitem(last=False)
+    else:
+        contexts.move_to_end(key)
+    return context
+
+def encapsulator(algorithm: str) -> oqs.KeyEncapsulation:
+    """This thread's reusable context for encap_secret"""
+    return _keyless("encap", oqs.KeyEncapsulation, algorithm)
+
+def verifier(algorithm: str) -> oqs.Signature:
+    """This thread's reusable context for verify"""
+    return _keyless("verify", oqs.Signature, algorithm)
+
+def decapsulator(algorithm: str, secret_key: bytes, reuse: bool = False) -> oqs.KeyEncapsulation:
+    """Context for decap_secret; reuse=True caches it per thread (long-lived keys only)"""
+    return _keyed("decap", oqs.KeyEncapsulation, algorithm, secret_key, reuse)
+
+def signer(algorithm: str, secret_key: bytes, reuse: bool = False) -> oqs.Signature:
+    """Context for sign; reuse=True caches it per thread (long-lived keys only)"""
+    return _keyed("sign", oqs.Signature, algorithm, secret_key, reuse)
+
+def oqs_context_metrics() -> dict:
+    with _stats_lock:
+        return dict(_stats)
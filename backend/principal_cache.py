@@ -0,0 +1,109 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+# === Principal Cache Configuration ===
+# Authenticated users are cached by token subject (email) so that most requests skip the
+# user lookup. Entries expire after the TTL, which also bounds how stale a principal can
+# be in other worker processes that did not see an invalidation.
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "60"))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "1024"))  # 0 = disabled
+
+class PrincipalCache:
+    """
+    LRU cache of authenticated principals with a per-entry TTL.
+
+    Callers must treat cached values as read-only, since they are shared between requests.
+    """
+
+    def __init__(self, ttl_seconds: float = PRINCIPAL_CACHE_TTL_SECONDS, max_entries: int = PRINCIPAL_CACHE_SIZE):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0  # Bumped by every invalidation
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "expired": 0,
+            "evictions": 0,
+            "invalidations": 0,
+            "stale_puts": 0
+        }
+
+    def get(self, subject: str) -> Optional[Any]:
+        """Return the cached principal for subject, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(subject)
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            expires_at, principal = entry
+            if expires_at <= time.monotonic():
+                del self._entries[subject]
+                self._stats["expired"] += 1
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(subject)
+            self._stats["hits"] += 1
+            return principal
+
+    def generation(self) -> int:
+        """Take before looking a principal up, and pass to put()"""
+        with self._lock:
+            return self._generation
+
+    def put(self, subject: str, principal: Any, generation: Optional[int] = None) -> None:
+        """
+        Cache a principal looked up at generation. If an invalidation happened since, the lookup
+        may have read the row before the change, so it is not cached.
+        """
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                self._stats["stale_puts"] += 1
+                return
+            self._entries[subject] = (time.monotonic() + self.ttl_seconds, principal)
+            self._entries.move_to_end(subject)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def invalidate(self, subject: str) -> None:
+        """Drop subject, e.g. after its password changed or the user was deleted"""
+        with self._lock:
+            self._generation += 1
+            if self._entries.pop(subject, None) is not None:
+                self._stats["invalidations"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._stats["invalidations"] += len(self._entries)
+            self._entries.clear()
+
+    def metrics(self) -> dict:
+        with self._lock:
+            lookups = self._stats["hits"] + self._stats["misses"]
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hit_ratio": self._stats["hits"] / lookups if lookups else 0.0,
+                **self._stats
+            }
+
+_principal_cache: Optional[PrincipalCache] = None
+
+def get_principal_cache() -> PrincipalCache:
+    """Get the process-wide principal cache, creating it on first use"""
+    global _principal_cache
+    if _principal_cache is None:
+        _principal_cache = PrincipalCache()
+    return _principal_cache
+
+def invalidate_principal(subject: str) -> None:
+    get_principal_cache().invalidate(subject)
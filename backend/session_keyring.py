@@ -0,0 +1,134 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+# === Session Keyring Configuration ===
+# Unlocking a user's private keys costs a password KDF, so it happens once at login and
+# the unlocked keys are kept here under the session handle (the access token's jti).
+KEYRING_IDLE_SECONDS = float(os.getenv("KEYRING_IDLE_SECONDS", "900"))  # Dropped after 15 minutes unused
+KEYRING_MAX_AGE_SECONDS = float(os.getenv(
+    "KEYRING_MAX_AGE_SECONDS", str(int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30")) * 60)
+))  # Never outlives the access token by default
+KEYRING_SIZE = int(os.getenv("KEYRING_SIZE", "1024"))  # Unlocked sessions kept per worker
+
+class UnlockedKeys:
+    """A user's unlocked private keys; secrets live in bytearrays so they can be wiped"""
+
+    def __init__(self, username: str, kem_secret: bytes, sig_secret: bytes, sig_public: bytes):
+        self.username = username
+        self._kem_secret = bytearray(kem_secret)
+        self._sig_secret = bytearray(sig_secret)
+        self.sig_public = sig_public
+        self.created = time.monotonic()
+        self.last_used = self.created
+
+    @property
+    def kem_secret(self) -> bytes:
+        return bytes(self._kem_secret)
+
+    @property
+    def sig_secret(self) -> bytes:
+        return bytes(self._sig_secret)
+
+    def wipe(self) -> None:
+        """
+        Best-effort zeroization: overwrites the keyring's copies. Copies already handed to
+        liboqs or still referenced by a request are outside our control.
+        """
+        for secret in (self._kem_secret, self._sig_secret):
+            secret[:] = bytes(len(secret))
+
+class SessionKeyring:
+    """LRU map of session handle -> UnlockedKeys with idle and absolute expiry"""
+
+    def __init__(self, idle_seconds: float = KEYRING_IDLE_SECONDS,
+                 max_age_seconds: float = KEYRING_MAX_AGE_SECONDS, max_entries: int = KEYRING_SIZE):
+        self.idle_seconds = idle_seconds
+        self.max_age_seconds = max_age_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, UnlockedKeys]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {
+            "unlocked": 0,
+            "hits": 0,
+            "misses": 0,
+            "idle_expired": 0,
+            "absolute_expired": 0,
+            "evictions": 0,
+            "discarded": 0
+        }
+
+    def _remove(self, handle: str, reason: str) -> None:
+        self._entries.pop(handle).wipe()
+        self._stats[reason] += 1
+
+    def _purge_idle(self, now: float) -> None:
+        # Least recently used entries are at the front, so stop at the first active one
+        while self._entries:
+            handle, keys = next(iter(self._entries.items()))
+            if now - keys.last_used < self.idle_seconds:
+                break
+            self._remove(handle, "idle_expired")
+
+    def put(self, handle: str, keys: UnlockedKeys) -> None:
+        if self.max_entries <= 0:
+            keys.wipe()
+            return
+        with self._lock:
+            if handle in self._entries:
+                self._remove(handle, "discarded")
+            self._entries[handle] = keys
+            self._stats["unlocked"] += 1
+            self._purge_idle(time.monotonic())
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)), "evictions")
+
+    def get(self, handle: Optional[str], username: str) -> Optional[UnlockedKeys]:
+        """Unlocked keys for handle, if they exist, belong to username and have not expired"""
+        now = time.monotonic()
+        with self._lock:
+            self._purge_idle(now)
+            keys = self._entries.get(handle) if handle else None
+            if keys is None or keys.username != username:
+                self._stats["misses"] += 1
+                return None
+            if now - keys.created >= self.max_age_seconds:
+                self._remove(handle, "absolute_expired")
+                self._stats["misses"] += 1
+                return None
+            keys.last_used = now
+            self._entries.move_to_end(handle)
+            self._stats["hits"] += 1
+            return keys
+
+    def discard(self, handle: str) -> None:
+        """Lock a session's keys again, e.g. on logout"""
+        with self._lock:
+            if handle in self._entries:
+                self._remove(handle, "discarded")
+
+    def clear(self) -> None:
+        with self._lock:
+            for handle in list(self._entries):
+                self._remove(handle, "discarded")
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "idle_seconds": self.idle_seconds,
+                "max_age_seconds": self.max_age_seconds,
+                **self._stats
+            }
+
+_session_keyring: Optional[SessionKeyring] = None
+
+def get_session_keyring() -> SessionKeyring:
+    """Get the process-wide session keyring, creating it on first use"""
+    global _session_keyring
+    if _session_keyring is None:
+        _session_keyring = SessionKeyring()
+    return _session_keyring
@@ -0,0 +1,488 @@
+import asyncio
+import functools
+import hashlib
+import os
+import shutil
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional
+
+# === Storage Configuration ===
+# Encrypted blobs are written and read through a storage driver so API nodes and storage can
+# scale separately. "local" keeps them on this node's disk, "s3" in an S3-compatible bucket
+# (AWS, MinIO, ...). Blocking file and network calls run on a small I/O thread pool.
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")
+STORAGE_LOCAL_ROOT = os.getenv("STORAGE_LOCAL_ROOT", "uploads")
+STORAGE_IO_WORKERS = int(os.getenv("STORAGE_IO_WORKERS", "8"))
+STORAGE_WRITE_BUFFER = int(os.getenv("STORAGE_WRITE_BUFFER", str(1024 * 1024)))  # Bytes buffered per local write
+STORAGE_READ_SIZE = int(os.getenv("STORAGE_READ_SIZE", str(1024 * 1024)))  # Largest single read on download
+STORAGE_S3_BUCKET = os.getenv("STORAGE_S3_BUCKET", "")
+STORAGE_S3_PREFIX = os.getenv("STORAGE_S3_PREFIX", "blobs/")
+STORAGE_S3_ENDPOINT_URL = os.getenv("STORAGE_S3_ENDPOINT_URL", "")  # e.g. a local MinIO
+STORAGE_S3_REGION = os.getenv("STORAGE_S3_REGION", "")
+STORAGE_S3_PART_SIZE = int(os.getenv("STORAGE_S3_PART_SIZE", "8")) * 1024 * 1024  # S3 requires at least 5MB
+
+BLOB_SUFFIX = ".enc"
+PART_SUFFIX = ".part"
+SESSIONS_DIR = "sessions"  # Staged parts of resumable uploads, per upload id, beside the blobs
+
+_io_executor: Optional[ThreadPoolExecutor] = None
+
+async def run_io(fn: Callable, *args: Any) -> Any:
+    """Run a blocking file or network call on the storage I/O pool"""
+    global _io_executor
+    if _io_executor is None:
+        _io_executor = ThreadPoolExecutor(max_workers=STORAGE_IO_WORKERS, thread_name_prefix="storage")
+    return await asyncio.get_running_loop().run_in_executor(_io_executor, fn, *args)
+
+class BlobWriter(ABC):
+    """Streams one blob into storage; nothing is visible to readers until commit()"""
+
+    size = 0  # Bytes written so far
+
+    @abstractmethod
+    async def write(self, data: bytes) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def commit(self) -> int:
+        """Publish the blob and return its stored size"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def abort(self) -> None:
+        """Discard everything written so far"""
+        raise NotImplementedError
+
+class Storage(ABC):
+    """Blob storage driver interface; blobs are immutable once committed"""
+
+    name = "storage"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {
+            "reads": 0,
+            "bytes_read": 0,
+            "writes_committed": 0,
+            "writes_aborted": 0,
+            "bytes_written": 0,
+            "deletes": 0
+        }
+
+    def _count(self, **counts: int) -> None:
+        with self._lock:
+            for name, value in counts.items():
+                self._stats[name] += value
+
+    @abstractmethod
+    async def open_writer(self, blob_id: str) -> BlobWriter:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def read(self, blob_id: str, offset: int, length: int) -> bytes:
+        """Read length bytes of a blob starting at offset"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def size(self, blob_id: str) -> Optional[int]:
+        """Stored size of a blob, or None if it does not exist"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete(self, blob_id: str) -> int:
+        """Delete a blob and return the bytes freed (0 if it did not exist)"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def list_blobs(self, modified_before: float) -> List[str]:
+        """Ids of stored blobs last modified before a Unix timestamp"""
+        raise NotImplementedError
+
+    # Resumable uploads stage each part until the session completes; re-sending a part replaces it
+    @abstractmethod
+    async def open_part_writer(self, upload_id: str, part_number: int) -> BlobWriter:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def read_part(self, upload_id: str, part_number: int) -> bytes:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def list_parts(self, upload_id: str) -> List[int]:
+        """Numbers of the staged parts of an upload, in order"""
+        raise NotImplementedError
+
+    @abstractmethod
+    async def delete_parts(self, upload_id: str) -> None:
+        raise NotImplementedError
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {"backend": self.name, **self._stats}
+
+# --- Local disk ---
+
+def shard_path(root: str, blob_id: str) -> str:
+    """Fan-out location of a blob: two levels of hashed subdirectories keep directories small"""
+    digest = hashlib.sha256(blob_id.encode()).hexdigest()
+    return os.path.join(root, digest[:2], digest[2:4], f"{blob_id}{BLOB_SUFFIX}")
+
+def flat_path(root: str, blob_id: str) -> str:
+    """Location of blobs written before sharding"""
+    return os.path.join(root, f"{blob_id}{BLOB_SUFFIX}")
+
+def _is_shard_dir(name: str) -> bool:
+    return len(name) == 2 and all(c in "0123456789abcdef" for c in name)
+
+class LocalBlobWriter(BlobWriter):
+    def __init__(self, storage: "LocalStorage", path: str):
+        self._storage = storage
+        self._path = path
+        self._temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        self._file = None
+        self._buffer = bytearray()
+        self.size = 0
+
+    def _flush(self, data: bytes) -> None:
+        if self._file is None:
+            os.makedirs(os.path.dirname(self._path), exist_ok=True)
+            self._file = open(self._temp_path, "wb")
+        self._file.write(data)
+
+    async def write(self, data: bytes) -> None:
+        self._buffer += data
+        self.size += len(data)
+        if len(self._buffer) >= STORAGE_WRITE_BUFFER:
+            data, self._buffer = bytes(self._buffer), bytearray()
+            await run_io(self._flush, data)
+
+    def _commit(self, data: bytes) -> None:
+        self._flush(data)
+        self._file.close()
+        os.replace(self._temp_path, self._path)
+
+    async def commit(self) -> int:
+        await run_io(self._commit, bytes(self._buffer))
+        self._buffer = bytearray()
+        self._storage._count(writes_committed=1, bytes_written=self.size)
+        return self.size
+
+    def _abort(self) -> None:
+        if self._file is not None:
+            self._file.close()
+        if os.path.exists(self._temp_path):
+            os.remove(self._temp_path)
+
+    async def abort(self) -> None:
+        self._buffer = bytearray()
+        await run_io(self._abort)
+        self._storage._count(writes_aborted=1)
+
+class LocalStorage(Storage):
+    """Blobs on local disk under root/xx/yy/{blob_id}.enc"""
+
+    name = "local"
+
+    def __init__(self, root: str = STORAGE_LOCAL_ROOT):
+        super().__init__()
+        self.root = root
+
+    def path(self, blob_id: str) -> str:
+        return shard_path(self.root, blob_id)
+
+    def _existing_path(self, blob_id: str) -> Optional[str]:
+        for path in (self.path(blob_id), flat_path(self.root, blob_id)):
+            if os.path.exists(path):
+                return path
+        return None
+
+    async def open_writer(self, blob_id: str) -> BlobWriter:
+        return LocalBlobWriter(self, self.path(blob_id))
+
+    def _read(self, blob_id: str, offset: int, length: int) -> bytes:
+        path = self._existing_path(blob_id)
+        if path is None:
+            raise FileNotFoundError(blob_id)
+        with open(path, "rb") as f:
+            f.seek(offset)
+            return f.read(length)
+
+    async def read(self, blob_id: str, offset: int, length: int) -> bytes:
+        data = await run_io(self._read, blob_id, offset, length)
+        self._count(reads=1, bytes_read=len(data))
+        return data
+
+    def _size(self, blob_id: str) -> Optional[int]:
+        path = self._existing_path(blob_id)
+        return os.path.getsize(path) if path else None
+
+    async def size(self, blob_id: str) -> Optional[int]:
+        return await run_io(self._size, blob_id)
+
+    def _delete(self, blob_id: str) -> int:
+        path = self._existing_path(blob_id)
+        if path is None:
+            return 0
+        size = os.path.getsize(path)
+        os.remove(path)
+        return size
+
+    async def delete(self, blob_id: str) -> int:
+        freed = await run_io(self._delete, blob_id)
+        self._count(deletes=1)
+        return freed
+
+    def _list_blobs(self, modified_before: float) -> List[str]:
+        if not os.path.isdir(self.root):
+            return []
+        directories = [self.root]
+        for first in os.scandir(self.root):
+            if first.is_dir() and _is_shard_dir(first.name):
+                directories.extend(
+                    second.path for second in os.scandir(first.path) if second.is_dir() and _is_shard_dir(second.name)
+                )
+        blob_ids = []
+        for directory in directories:
+            for entry in os.scandir(directory):
+                if entry.is_file() and entry.name.endswith(BLOB_SUFFIX) and entry.stat().st_mtime < modified_before:
+                    blob_ids.append(entry.name[:-len(BLOB_SUFFIX)])
+        return blob_ids
+
+    async def list_blobs(self, modified_before: float) -> List[str]:
+        return await run_io(self._list_blobs, modified_before)
+
+    def _parts_dir(self, upload_id: str) -> str:
+        return os.path.join(self.root, SESSIONS_DIR, upload_id)
+
+    def _part_path(self, upload_id: str, part_number: int) -> str:
+        return os.path.join(self._parts_dir(upload_id), f"{part_number}{PART_SUFFIX}")
+
+    async def open_part_writer(self, upload_id: str, part_number: int) -> BlobWriter:
+        return LocalBlobWriter(self, self._part_path(upload_id, part_number))
+
+    def _read_part(self, upload_id: str, part_number: int) -> bytes:
+        with open(self._part_path(upload_id, part_number), "rb") as f:
+            return f.read()
+
+    async def read_part(self, upload_id: str, part_number: int) -> bytes:
+        data = await run_io(self._read_part, upload_id, part_number)
+        self._count(reads=1, bytes_read=len(data))
+        return data
+
+    def _list_parts(self, upload_id: str) -> List[int]:
+        directory = self._parts_dir(upload_id)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(int(name[:-len(PART_SUFFIX)]) for name in os.listdir(directory) if name.endswith(PART_SUFFIX))
+
+    async def list_parts(self, upload_id: str) -> List[int]:
+        return await run_io(self._list_parts, upload_id)
+
+    async def delete_parts(self, upload_id: str) -> None:
+        await run_io(functools.partial(shutil.rmtree, self._parts_dir(upload_id), ignore_errors=True))
+
+# --- S3-compatible object storage ---
+
+class S3BlobWriter(BlobWriter):
+    """Buffers up to one part; larger blobs become a multipart upload"""
+
+    def __init__(self, storage: "S3Storage", key: str):
+        self._storage = storage
+        self._key = key
+        self._buffer = bytearray()
+        self._upload_id: Optional[str] = None
+        self._parts = []
+        self.size = 0
+
+    def _upload_part(self, data: bytes) -> None:
+        client, bucket = self._storage.client, self._storage.bucket
+        if self._upload_id is None:
+            self._upload_id = client.create_multipart_upload(Bucket=bucket, Key=self._key)["UploadId"]
+        part_number = len(self._parts) + 1
+        response = client.upload_part(
+            Bucket=bucket, Key=self._key, UploadId=self._upload_id, PartNumber=part_number, Body=data
+        )
+        self._parts.append({"PartNumber": part_number, "ETag": response["ETag"]})
+
+    async def write(self, data: bytes) -> None:
+        self._buffer += data
+        self.size += len(data)
+        while len(self._buffer) >= self._storage.part_size:
+            part = bytes(self._buffer[:self._storage.part_size])
+            del self._buffer[:self._storage.part_size]
+            await run_io(self._upload_part, part)
+
+    def _commit(self, data: bytes) -> None:
+        client, bucket = self._storage.client, self._storage.bucket
+        if self._upload_id is None:
+            client.put_object(Bucket=bucket, Key=self._key, Body=data)
+            return
+        if data or not self._parts:
+            self._upload_part(data)
+        client.complete_multipart_upload(
+            Bucket=bucket, Key=self._key, UploadId=self._upload_id, MultipartUpload={"Parts": self._parts}
+        )
+
+    async def commit(self) -> int:
+        await run_io(self._commit, bytes(self._buffer))
+        self._buffer = bytearray()
+        self._storage._count(writes_committed=1, bytes_written=self.size)
+        return self.size
+
+    def _abort(self) -> None:
+        if self._upload_id is not None:
+            upload_id, self._upload_id = self._upload_id, None
+            self._storage.client.abort_multipart_upload(Bucket=self._storage.bucket, Key=self._key, UploadId=upload_id)
+
+    async def abort(self) -> None:
+        self._buffer = bytearray()
+        await run_io(self._abort)
+        self._storage._count(writes_aborted=1)
+
+class S3Storage(Storage):
+    """Blobs as objects {prefix}{blob_id}.enc in an S3-compatible bucket (requires boto3)"""
+
+    name = "s3"
+
+    def __init__(self, bucket: str = STORAGE_S3_BUCKET, prefix: str = STORAGE_S3_PREFIX,
+                 endpoint_url: str = STORAGE_S3_ENDPOINT_URL, region: str = STORAGE_S3_REGION,
+                 part_size: int = STORAGE_S3_PART_SIZE):
+        super().__init__()
+        try:
+            import boto3
+            from botocore.exceptions import ClientError
+        except ImportError:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires boto3 (pip install boto3)")
+        if not bucket:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires STORAGE_S3_BUCKET")
+        self.bucket = bucket
+        self.prefix = prefix
+        self.part_size = max(part_size, 5 * 1024 * 1024)
+        # Credentials come from the usual AWS environment variables / config files
+        self.client = boto3.client("s3", endpoint_url=endpoint_url or None, region_name=region or None)
+        self._client_error = ClientError
+
+    def key(self, blob_id: str) -> str:
+        return f"{self.prefix}{blob_id}{BLOB_SUFFIX}"
+
+    def _is_missing(self, error: Exception) -> bool:
+        return error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound")
+
+    async def open_writer(self, blob_id: str) -> BlobWriter:
+        return S3BlobWriter(self, self.key(blob_id))
+
+    def _read(self, blob_id: str, offset: int, length: int) -> bytes:
+        if length <= 0:
+            return b""
+        response = self.client.get_object(
+            Bucket=self.bucket, Key=self.key(blob_id), Range=f"bytes={offset}-{offset + length - 1}"
+        )
+        return response["Body"].read()
+
+    async def read(self, blob_id: str, offset: int, length: int) -> bytes:
+        data = await run_io(self._read, blob_id, offset, length)
+        self._count(reads=1, bytes_read=len(data))
+        return data
+
+    def _size(self, blob_id: str) -> Optional[int]:
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self.key(blob_id))["ContentLength"]
+        except self._client_error as e:
+            if self._is_missing(e):
+                return None
+            raise
+
+    async def size(self, blob_id: str) -> Optional[int]:
+        return await run_io(self._size, blob_id)
+
+    def _delete(self, blob_id: str) -> int:
+        size = self._size(blob_id)
+        if size is None:
+            return 0
+        self.client.delete_object(Bucket=self.bucket, Key=self.key(blob_id))
+        return size
+
+    async def delete(self, blob_id: str) -> int:
+        freed = await run_io(self._delete, blob_id)
+        self._count(deletes=1)
+        return freed
+
+    def _list_blobs(self, modified_before: float) -> List[str]:
+        blob_ids = []
+        for page in self.client.get_paginator("list_objects_v2").paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for item in page.get("Contents", []):
+                name = item["Key"][len(self.prefix):]
+                if name.endswith(BLOB_SUFFIX) and "/" not in name and item["LastModified"].timestamp() < modified_before:
+                    blob_ids.append(name[:-len(BLOB_SUFFIX)])
+        return blob_ids
+
+    async def list_blobs(self, modified_before: float) -> List[str]:
+        return await run_io(self._list_blobs, modified_before)
+
+    def _parts_prefix(self, upload_id: str) -> str:
+        return f"{self.prefix}{SESSIONS_DIR}/{upload_id}/"
+
+    def _part_key(self, upload_id: str, part_number: int) -> str:
+        return f"{self._parts_prefix(upload_id)}{part_number}{PART_SUFFIX}"
+
+    async def open_part_writer(self, upload_id: str, part_number: int) -> BlobWriter:
+        return S3BlobWriter(self, self._part_key(upload_id, part_number))
+
+    def _read_part(self, upload_id: str, part_number: int) -> bytes:
+        return self.client.get_object(Bucket=self.bucket, Key=self._part_key(upload_id, part_number))["Body"].read()
+
+    async def read_part(self, upload_id: str, part_number: int) -> bytes:
+        data = await run_io(self._read_part, upload_id, part_number)
+        self._count(reads=1, bytes_read=len(data))
+        return data
+
+    def _part_keys(self, upload_id: str) -> List[str]:
+        keys = []
+        for page in self.client.get_paginator("list_objects_v2").paginate(
+            Bucket=self.bucket, Prefix=self._parts_prefix(upload_id)
+        ):
+            keys.extend(item["Key"] for item in page.get("Contents", []))
+        return keys
+
+    def _list_parts(self, upload_id: str) -> List[int]:
+        prefix = self._parts_prefix(upload_id)
+        return sorted(
+            int(key[len(prefix):-len(PART_SUFFIX)]) for key in self._part_keys(upload_id) if key.endswith(PART_SUFFIX)
+        )
+
+    async def list_parts(self, upload_id: str) -> List[int]:
+        return await run_io(self._list_parts, upload_id)
+
+    def _delete_parts(self, upload_id: str) -> None:
+        keys = self._part_keys(upload_id)
+        # DeleteObjects takes at most 1000 keys
+        for start in range(0, len(keys), 1000):
+            self.client.delete_objects(
+                Bucket=self.bucket, Delete={"Objects": [{"Key": key} for key in keys[start:start + 1000]], "Quiet": True}
+            )
+
+    async def delete_parts(self, upload_id: str) -> None:
+        await run_io(self._delete_parts, upload_id)
+
+_storage: Optional[Storage] = None
+
+def get_storage() -> Storage:
+    """Get the process-wide storage driver selected by STORAGE_BACKEND, creating it on first use"""
+    global _storage
+    if _storage is None:
+        if STORAGE_BACKEND == "local":
+            _storage = LocalStorage()
+        elif STORAGE_BACKEND == "s3":
+            _storage = S3Storage()
+        else:
+            raise RuntimeError(f"Unknown STORAGE_BACKEND: {STORAGE_BACKEND}")
+    return _storage
+
+def shutdown_storage() -> None:
+    global _io_executor
+    if _io_executor is not None:
+        _io_executor.shutdown(wait=True)
+        _io_executor = None
@@ -0,0 +1,49 @@
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+# Point the app at a scratch database before any test imports models
+_DIRECTORY = tempfile.mkdtemp(prefix="quantumdocs-tests-")
+os.environ["DATABASE_PATH"] = os.path.join(_DIRECTORY, "quantumdocs.db")
+os.environ["STORAGE_LOCAL_ROOT"] = os.path.join(_DIRECTORY, "uploads")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def database():
+    """An empty schema for each test"""
+    from models import Base, engine
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    yield
+    Base.metadata.drop_all(engine)
+
+@pytest.fixture
+def client(database):
+    """The API on an empty schema and storage, with the per-process caches emptied; needs liboqs"""
+    pytest.importorskip("oqs")
+    from fastapi.testclient import TestClient
+
+    import main
+    from auth import clear_token_cache
+    from principal_cache import get_principal_cache
+    from session_keyring import get_session_keyring
+    clear_token_cache()
+    get_principal_cache().clear()
+    get_session_keyring().clear()
+    shutil.rmtree(os.environ["STORAGE_LOCAL_ROOT"], ignore_errors=True)
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+@pytest.fixture
+def auth_headers(client):
+    """Authorization headers of two freshly registered and logged-in users, alice and bob"""
+    headers = {}
+    for username in ("alice", "bob"):
+        email = f"{username}@example.com"
+        client.post("/api/register", data={"username": username, "email": email, "password": "secret1"})
+        token = client.post("/api/login", data={"email": email, "password": "secret1"}).json()["access_token"]
+        headers[username] = {"Authorization": f"Bearer {token}"}
+    return headers
@@ -0,0 +1,91 @@
+"""Password hashing, and verified tokens cached until they expire, with revoked ones refused"""
+
+import asyncio
+import hashlib
+import time
+
+import auth
+from auth import (
+    create_access_token, get_password_hash, password_needs_rehash, revoke_token, token_cache_metrics,
+    verify_password, verify_token_session
+)
+from database import User, create_user, find_user_by_email
+from db_writer import stop_db_writer
+from models import AsyncSessionLocal
+
+def legacy_hash(password: str, salt: str = "0123456789abcdef") -> str:
+    """A "salt$sha256" hash as stored before scrypt"""
+    return f"{salt}${hashlib.sha256((password + salt).encode()).hexdigest()}"
+
+def test_scrypt_hashes_verify():
+    hashed = get_password_hash("secret1")
+    assert hashed.startswith("scrypt$")
+    assert verify_password("secret1", hashed)
+    assert not verify_password("secret2", hashed)
+    assert not verify_password("secret1", "scrypt$garbage")
+    # Salted: the same password never hashes the same twice
+    assert get_password_hash("secret1") != hashed
+    assert not password_needs_rehash(hashed)
+
+def test_legacy_and_outdated_hashes_need_a_rehash(monkeypatch):
+    assert verify_password("secret1", legacy_hash("secret1"))
+    assert not verify_password("secret2", legacy_hash("secret1"))
+    assert password_needs_rehash(legacy_hash("secret1"))
+    hashed = get_password_hash("secret1")
+    monkeypatch.setattr(auth, "PASSWORD_SCRYPT_N", 2 * auth.PASSWORD_SCRYPT_N)
+    assert password_needs_rehash(hashed)
+    # Hashes keep their own parameters, so they still verify after the defaults change
+    assert verify_password("secret1", hashed)
+
+def test_login_upgrades_a_legacy_hash(client):
+    asyncio.run(create_user(User(username="alice", email="alice@example.com", password_hash=legacy_hash("secret1"))))
+    stop_db_writer()
+    response = client.post("/api/login", data={"email": "alice@example.com", "password": "secret1"})
+    assert response.status_code == 200
+
+    async def stored_hash() -> str:
+        async with AsyncSessionLocal() as db:
+            return (await find_user_by_email(db, "alice@example.com")).password_hash
+
+    upgraded = asyncio.run(stored_hash())
+    assert upgraded.startswith("scrypt$") and verify_password("secret1", upgraded)
+    assert client.post("/api/login", data={"email": "alice@example.com", "password": "secret1"}).status_code == 200
+
+def stats() -> dict:
+    return token_cache_metrics()
+
+def test_verified_token_is_cached_until_it_expires(monkeypatch):
+    token = create_access_token({"sub": "alice@example.com"})
+    before = stats()
+    subject, jti = verify_token_session(token)
+    assert subject == "alice@example.com" and jti
+    assert verify_token_session(token) == (subject, jti)
+    after = stats()
+    assert (after["misses"] - before["misses"], after["hits"] - before["hits"]) == (1, 1)
+
+    # Past the token's exp the cached entry is not served
+    now = time.time()
+    monkeypatch.setattr(auth.time, "time", lambda: now + 3600)
+    verify_token_session(token)
+    assert stats()["misses"] - after["misses"] == 1
+
+def test_revoked_token_is_refused_even_when_cached():
+    token = create_access_token({"sub": "alice@example.com"})
+    assert verify_token_session(token)
+    assert revoke_token(token)
+    before = stats()["revoked_rejections"]
+    assert verify_token_session(token) is None
+    assert stats()["revoked_rejections"] == before + 1
+    # Other sessions of the same user are unaffected
+    assert verify_token_session(create_access_token({"sub": "alice@example.com"}))
+    assert not revoke_token("not-a-token")
+
+def test_deny_list_forgets_expired_tokens(monkeypatch):
+    first = create_access_token({"sub": "alice@example.com"})
+    revoke_token(first)
+    assert stats()["revoked"] >= 1
+    # Once the revoked tokens would have expired anyway, the next revocation prunes them
+    now = time.time()
+    monkeypatch.setattr(auth.time, "time", lambda: now + 3600)
+    revoke_token(create_access_token({"sub": "bob@example.com"}))
+    assert stats()["revoked"] == 1
@@ -0,0 +1,67 @@
+"""Deleting a file drops one reference on its blob; the collector only reclaims unreferenced blobs past the grace period"""
+
+import asyncio
+import os
+
+from blob_store import collect_garbage
+from database import Blob, FileRecord, create_file_records, create_user, delete_file_record, User
+from db_writer import stop_db_writer
+from models import AsyncSessionLocal, Blob as BlobModel
+from storage import get_storage
+
+def record(file_id: str, recipient: str, blob_id: str) -> FileRecord:
+    return FileRecord(
+        file_id=file_id, filename="report.pdf", sender_username="alice", recipient_username=recipient,
+        encrypted_data=b"", ciphertext=os.urandom(32), signature=os.urandom(32), nonce=os.urandom(12),
+        sender_public_key=os.urandom(32), file_size=5, blob_id=blob_id
+    )
+
+async def store_blob(blob_id: str) -> None:
+    writer = await get_storage().open_writer(blob_id)
+    await writer.write(b"blob!")
+    await writer.commit()
+
+async def ref_count(blob_id: str):
+    async with AsyncSessionLocal() as db:
+        blob = await db.get(BlobModel, blob_id)
+        return blob.ref_count if blob else None
+
+async def delete(file_id: str) -> None:
+    async with AsyncSessionLocal() as db:
+        await delete_file_record(db, file_id)
+
+async def run_scenario() -> list:
+    for username in ("alice", "bob", "carol", "dave"):
+        await create_user(User(username=username, email=f"{username}@example.com", password_hash="x"))
+    # One upload to bob and carol, then a re-send of the same content to dave
+    await store_blob("blob")
+    await create_file_records([record("blob", "bob", "blob"), record("to-carol", "carol", "blob")],
+                              new_blob=Blob("blob", "alice", size=5))
+    await create_file_records([record("to-dave", "dave", "blob")])
+    steps = [await ref_count("blob")]
+
+    await delete("blob")
+    await delete("to-carol")
+    steps.append(await ref_count("blob"))
+    # The re-send still references the blob, so nothing is collected however old it is
+    steps.append(await collect_garbage(grace_seconds=0))
+    steps.append(await get_storage().size("blob"))
+
+    await delete("to-dave")
+    steps.append(await ref_count("blob"))
+    # Within the grace period the unreferenced blob is kept
+    steps.append(await collect_garbage(grace_seconds=3600))
+    steps.append(await ref_count("blob"))
+    steps.append(await collect_garbage(grace_seconds=0))
+    steps.append((await ref_count("blob"), await get_storage().size("blob")))
+    stop_db_writer()
+    return steps
+
+def test_blob_outlives_its_references_and_the_grace_period(database):
+    no_garbage = {"collected": 0, "orphans": 0, "bytes_reclaimed": 0}
+    assert asyncio.run(run_scenario()) == [
+        3,
+        1, no_garbage, 5,
+        0, no_garbage, 0,
+        {"collected": 1, "orphans": 0, "bytes_reclaimed": 5}, (None, None)
+    ]
@@ -0,0 +1,55 @@
+"""Uploads are compressed chunk by chunk, and only when a sample of the first chunk compresses"""
+
+import os
+
+import pytest
+
+zstandard = pytest.importorskip("zstandard")
+
+import chunk_compression
+from chunk_compression import choose_compressor
+
+def test_sample_is_compressed_once(monkeypatch):
+    sample = b"quarterly numbers " * 4096
+    compressor = choose_compressor("report.txt", sample)
+    calls = []
+    compress = chunk_compression._zstd_compressor
+    monkeypatch.setattr(chunk_compression, "_zstd_compressor", lambda level: calls.append(level) or compress(level))
+
+    first = compressor.compress(sample)
+    assert calls == []
+    assert zstandard.ZstdDecompressor().decompress(first) == sample
+    compressor.compress(sample)
+    assert len(calls) == 1
+    assert compressor.bytes_in == 2 * len(sample)
+
+def test_incompressible_uploads_are_stored_as_is():
+    before = chunk_compression.compression_metrics()
+    assert choose_compressor("random.txt", os.urandom(64 * 1024)) is None
+    assert choose_compressor("photo.png", b"a" * 64 * 1024) is None
+    assert choose_compressor("empty.txt", b"") is None
+    after = chunk_compression.compression_metrics()
+    assert after["skipped_by_sample"] - before["skipped_by_sample"] == 1
+    assert after["skipped_by_type"] - before["skipped_by_type"] == 1
+
+def test_compressed_stream_round_trip():
+    pytest.importorskip("oqs")
+    from crypto_utils import (
+        STREAM_FLAG_ZSTD, STREAM_TRAILER_SIZE, StreamDecryptor, StreamEncryptor, StreamIndex, load_server_keys
+    )
+
+    keys = load_server_keys()
+    chunk_size = 4096
+    data = b"quarterly numbers " * 1000
+    pieces = [data[offset:offset + chunk_size] for offset in range(0, len(data), chunk_size)]
+    compressor = choose_compressor("report.txt", pieces[0])
+    encryptor = StreamEncryptor(keys["kem_public"], keys["sig_secret"], chunk_size=chunk_size, compressor=compressor)
+    sealed = [encryptor.encrypt_chunk(piece, final=number == len(pieces) - 1) for number, piece in enumerate(pieces)]
+    assert sum(map(len, sealed)) < len(data) // 10
+
+    trailer = encryptor.trailer()
+    index = StreamIndex(encryptor.header, trailer[:-STREAM_TRAILER_SIZE], trailer[-STREAM_TRAILER_SIZE:])
+    assert index.flags & STREAM_FLAG_ZSTD
+    decryptor = StreamDecryptor(index, encryptor.ciphertext, keys["kem_secret"])
+    assert b"".join(decryptor.decrypt_chunks(0, sealed)) == data
+    assert compressor.report()["bytes_in"] == len(data)
@@ -0,0 +1,55 @@
+"""CryptoPool admission: slots are held for as long as a worker runs the call"""
+
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from crypto_executor import CryptoExecutorBusy, CryptoPool
+
+def test_cancelled_caller_keeps_the_slot_until_the_worker_finishes():
+    release = threading.Event()
+
+    async def run():
+        pool = CryptoPool("test", ThreadPoolExecutor(max_workers=1), max_workers=1, max_queue=0)
+        task = asyncio.create_task(pool.run(release.wait))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        # The worker is still busy, so the pool is still full
+        assert pool.metrics()["in_flight"] == 1
+        with pytest.raises(CryptoExecutorBusy):
+            await pool.run(lambda: None)
+        release.set()
+        for _ in range(100):
+            if pool.metrics()["in_flight"] == 0:
+                break
+            await asyncio.sleep(0.01)
+        assert pool.metrics()["in_flight"] == 0
+        assert await pool.run(lambda: 42) == 42
+        pool.shutdown()
+
+    asyncio.run(run())
+
+def test_cancelled_queued_call_frees_its_slot():
+    release = threading.Event()
+
+    async def run():
+        pool = CryptoPool("test", ThreadPoolExecutor(max_workers=1), max_workers=1, max_queue=1)
+        running = asyncio.create_task(pool.run(release.wait))
+        queued = asyncio.create_task(pool.run(lambda: None))
+        await asyncio.sleep(0.05)
+        assert pool.metrics()["queue_depth"] == 1
+        queued.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await queued
+        # Never started, so it is dropped from the queue at once
+        assert pool.metrics()["in_flight"] == 1
+        release.set()
+        await running
+        assert pool.metrics()["in_flight"] == 0
+        pool.shutdown()
+
+    asyncio.run(run())
@@ -0,0 +1,62 @@
+"""The listings and the file lookup must not issue a query per file (N+1)"""
+
+import asyncio
+import os
+
+import pytest
+from sqlalchemy import event
+
+from database import (
+    Blob, FileRecord, User, create_file_records, create_user, find_file_by_id,
+    get_received_files, get_sent_files
+)
+from db_writer import stop_db_writer
+from models import AsyncSessionLocal, async_engine
+
+class StatementCounter:
+    """Counts the statements sent to the database while active"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __enter__(self):
+        event.listen(async_engine.sync_engine, "before_cursor_execute", self._count)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(async_engine.sync_engine, "before_cursor_execute", self._count)
+
+    def _count(self, *args):
+        self.count += 1
+
+async def seed(file_count: int) -> None:
+    for username in ("alice", "bob"):
+        await create_user(User(username=username, email=f"{username}@example.com", password_hash="x"))
+    records = [
+        FileRecord(
+            file_id=f"file-{number}", filename=f"report-{number}.pdf", sender_username="alice",
+            recipient_username="bob", encrypted_data=b"", ciphertext=os.urandom(32), signature=os.urandom(32),
+            nonce=os.urandom(12), sender_public_key=os.urandom(32), file_size=100, blob_id="blob"
+        ) for number in range(file_count)
+    ]
+    await create_file_records(records, new_blob=Blob("blob", "alice", size=100))
+
+async def count_statements(file_count: int) -> dict:
+    await seed(file_count)
+    counts = {}
+    async with AsyncSessionLocal() as db:
+        for name, query in (
+            ("received", lambda: get_received_files(db, "bob")),
+            ("sent", lambda: get_sent_files(db, "alice")),
+            ("find", lambda: find_file_by_id(db, "file-0"))
+        ):
+            with StatementCounter() as counter:
+                result = await query()
+            assert result
+            counts[name] = counter.count
+    stop_db_writer()
+    return counts
+
+@pytest.mark.parametrize("file_count", [1, 25])
+def test_listing_and_lookup_use_one_statement(database, file_count):
+    assert asyncio.run(count_statements(file_count)) == {"received": 1, "sent": 1, "find": 1}
@@ -0,0 +1,30 @@
+"""Writes queued together commit as one transaction, and a failing write is rolled back alone"""
+
+import asyncio
+
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+
+from database import User, create_user
+from db_writer import get_db_writer, stop_db_writer
+from models import AsyncSessionLocal, User as UserModel
+
+async def create_users(usernames: list) -> tuple:
+    results = await asyncio.gather(
+        *[create_user(User(username=name, email=f"{name}@example.com", password_hash="x")) for name in usernames],
+        return_exceptions=True
+    )
+    metrics = get_db_writer().metrics()
+    stop_db_writer()
+    async with AsyncSessionLocal() as db:
+        stored = (await db.execute(select(func.count()).select_from(UserModel))).scalar()
+    return results, metrics, stored
+
+def test_failing_write_leaves_its_batch_committed(database):
+    # The duplicate username fails its insert in the middle of the batch
+    usernames = [f"user{number}" for number in range(10)]
+    results, metrics, stored = asyncio.run(create_users(usernames[:5] + ["user2"] + usernames[5:]))
+    assert [type(result) for result in results].count(IntegrityError) == 1
+    assert isinstance(results[5], IntegrityError)
+    assert stored == 10
+    assert (metrics["commits"], metrics["failed"], metrics["max_batch_seen"]) == (1, 1, 11)
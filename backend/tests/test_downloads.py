@@ -0,0 +1,104 @@
+"""Downloads decrypt stored chunks as they stream, serve byte ranges, refuse to pass on corrupt chunks,
+and verify a signature once until it changes"""
+
+import os
+import sqlite3
+
+import pytest
+
+import main
+from crypto_utils import STREAM_HEADER_SIZE, ChunkIntegrityError
+from models import DATABASE_PATH
+from storage import get_storage
+
+def upload(client, auth_headers, data: bytes) -> str:
+    response = client.post("/api/upload", headers=auth_headers["alice"], files={"file": ("report.pdf", data)},
+                           data={"recipient_username": "bob"})
+    assert response.status_code == 200
+    return response.json()["file_id"]
+
+def download(client, auth_headers, file_id: str, **headers):
+    return client.post("/api/download", headers={**auth_headers["bob"], **headers}, data={"file_id": file_id})
+
+def flip_stored_byte(blob_id: str, offset: int) -> None:
+    path = get_storage().path(blob_id)
+    with open(path, "r+b") as f:
+        f.seek(offset)
+        byte = f.read(1)
+        f.seek(offset)
+        f.write(bytes([byte[0] ^ 1]))
+
+def test_corrupt_first_chunk_fails_before_the_response_starts(client, auth_headers):
+    file_id = upload(client, auth_headers, os.urandom(2 * main.STREAM_CHUNK_SIZE))
+    flip_stored_byte(file_id, STREAM_HEADER_SIZE + 10)
+    response = download(client, auth_headers, file_id)
+    assert (response.status_code, response.json()["detail"]) == (500, "Stored file failed its integrity check")
+
+def test_corrupt_later_chunk_aborts_the_response(client, auth_headers, monkeypatch):
+    # One chunk per read, so the corrupt chunk is past the piece decrypted before the status is sent
+    monkeypatch.setattr(main, "STORAGE_READ_SIZE", 1)
+    monkeypatch.setattr(main, "STREAM_PARALLEL_BATCHES", 1)
+    file_id = upload(client, auth_headers, os.urandom(4 * main.STREAM_CHUNK_SIZE))
+    flip_stored_byte(file_id, STREAM_HEADER_SIZE + 3 * main.STREAM_CHUNK_SIZE)
+    with pytest.raises(ChunkIntegrityError):
+        download(client, auth_headers, file_id)
+
+def test_ranges(client, auth_headers):
+    data = os.urandom(3 * main.STREAM_CHUNK_SIZE + 100)
+    file_id = upload(client, auth_headers, data)
+    size = len(data)
+    middle = main.STREAM_CHUNK_SIZE - 10  # Spans a chunk boundary
+
+    response = download(client, auth_headers, file_id, Range=f"bytes={middle}-{middle + 19}")
+    assert (response.status_code, response.content) == (206, data[middle:middle + 20])
+    assert response.headers["content-range"] == f"bytes {middle}-{middle + 19}/{size}"
+    # Suffix range: the last N bytes
+    response = download(client, auth_headers, file_id, Range="bytes=-5")
+    assert (response.status_code, response.content) == (206, data[-5:])
+    assert response.headers["content-range"] == f"bytes {size - 5}-{size - 1}/{size}"
+    # An end past the file is cut to its last byte
+    response = download(client, auth_headers, file_id, Range=f"bytes={size - 3}-{size + 100}")
+    assert (response.status_code, response.content) == (206, data[-3:])
+
+def test_unsatisfiable_range(client, auth_headers):
+    data = os.urandom(1000)
+    file_id = upload(client, auth_headers, data)
+    response = download(client, auth_headers, file_id, Range="bytes=1000-")
+    assert (response.status_code, response.headers["content-range"]) == (416, "bytes */1000")
+    # Multiple ranges are not supported, so the whole file is served
+    response = download(client, auth_headers, file_id, Range="bytes=0-1,5-6")
+    assert (response.status_code, response.content) == (200, data)
+
+def test_if_range(client, auth_headers):
+    data = os.urandom(1000)
+    file_id = upload(client, auth_headers, data)
+    etag = download(client, auth_headers, file_id).headers["etag"]
+    response = download(client, auth_headers, file_id, Range="bytes=10-19", **{"If-Range": etag})
+    assert (response.status_code, response.content) == (206, data[10:20])
+    # A mismatched validator means the client's partial copy is stale: send the whole file
+    response = download(client, auth_headers, file_id, Range="bytes=10-19", **{"If-Range": '"stale"'})
+    assert (response.status_code, response.content) == (200, data)
+
+def test_empty_file(client, auth_headers):
+    file_id = upload(client, auth_headers, b"")
+    response = download(client, auth_headers, file_id)
+    assert (response.status_code, response.content) == (200, b"")
+    response = download(client, auth_headers, file_id, Range="bytes=0-")
+    assert (response.status_code, response.headers["content-range"]) == (416, "bytes */0")
+
+def test_signature_is_verified_again_after_it_changes(client, auth_headers, monkeypatch):
+    verified = []
+    verify = main.verify_stream_signature
+    monkeypatch.setattr(main, "verify_stream_signature", lambda *args: verified.append(1) or verify(*args))
+    data = os.urandom(1000)
+    file_id = upload(client, auth_headers, data)
+    assert download(client, auth_headers, file_id).content == data
+    assert download(client, auth_headers, file_id).content == data
+    assert len(verified) == 1
+
+    # The remembered digest covers the signature, so a replaced one is checked, and fails
+    with sqlite3.connect(DATABASE_PATH) as conn:
+        conn.execute("UPDATE shared_metadata SET signature = ? WHERE file_id = ?", (os.urandom(64), file_id))
+    response = download(client, auth_headers, file_id)
+    assert (response.status_code, response.json()["detail"]) == (500, "File integrity check failed")
+    assert len(verified) == 2
@@ -0,0 +1,84 @@
+"""Keyset-paginated file listings: cursors walk every file once, filters narrow the listing"""
+
+import asyncio
+import os
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import update
+
+from database import (
+    Blob, FileRecord, User, create_file_records, create_user, decode_file_cursor, encode_file_cursor,
+    get_received_files, get_sent_files
+)
+from db_writer import stop_db_writer
+from models import AsyncSessionLocal, SharedMetadata
+
+def record(file_id: str, filename: str, sender: str) -> FileRecord:
+    return FileRecord(
+        file_id=file_id, filename=filename, sender_username=sender, recipient_username="bob",
+        encrypted_data=b"", ciphertext=os.urandom(32), signature=os.urandom(32), nonce=os.urandom(12),
+        sender_public_key=os.urandom(32), file_size=100, blob_id="blob"
+    )
+
+async def seed() -> None:
+    for username in ("alice", "bob", "carol"):
+        await create_user(User(username=username, email=f"{username}@example.com", password_hash="x"))
+    # Rows written together may share created_at; the id breaks the tie
+    await create_file_records([record(f"report-{number}", f"report-{number}.pdf", "alice") for number in range(7)],
+                              new_blob=Blob("blob", "alice", size=100))
+    await create_file_records([record("odd", "a_b.txt", "carol"), record("plain", "axb.txt", "carol")])
+    async with AsyncSessionLocal() as db:
+        await db.execute(update(SharedMetadata).filter(SharedMetadata.file_id == "report-0")
+                         .values(is_read=True, created_at=datetime(2020, 1, 1)))
+        await db.commit()
+
+async def list_pages(**filters) -> list:
+    pages = []
+    cursor = None
+    async with AsyncSessionLocal() as db:
+        while True:
+            page = await get_received_files(db, "bob", limit=3, cursor=cursor, **filters)
+            if not page:
+                return pages
+            pages.append([summary.file_id for summary in page])
+            cursor = decode_file_cursor(encode_file_cursor(page[-1]))
+
+async def list_ids(**filters) -> list:
+    async with AsyncSessionLocal() as db:
+        return [summary.file_id for summary in await get_received_files(db, "bob", **filters)]
+
+async def run_listings() -> dict:
+    await seed()
+    results = {
+        "all": await list_ids(),
+        "pages": await list_pages(),
+        "carol": await list_ids(counterpart="carol"),
+        "prefix": await list_ids(filename_prefix="report-1"),
+        "underscore": await list_ids(filename_prefix="a_"),
+        "read": await list_ids(is_read=True),
+        "before": await list_ids(created_before=datetime(2021, 1, 1)),
+        "after": await list_ids(created_after=datetime.utcnow() - timedelta(hours=1), counterpart="alice")
+    }
+    async with AsyncSessionLocal() as db:
+        results["sent"] = [summary.file_id for summary in await get_sent_files(db, "carol")]
+    stop_db_writer()
+    return results
+
+def test_cursor_pages_and_filters(database):
+    results = asyncio.run(run_listings())
+    # Newest first; the back-dated file comes last
+    assert len(results["all"]) == 9 and results["all"][-1] == "report-0"
+    assert [len(page) for page in results["pages"]] == [3, 3, 3]
+    assert sum(results["pages"], []) == results["all"]
+    assert sorted(results["carol"]) == ["odd", "plain"]
+    assert results["prefix"] == ["report-1"]
+    # Prefixes match literally, not as LIKE patterns
+    assert results["underscore"] == ["odd"]
+    assert results["read"] == results["before"] == ["report-0"]
+    assert sorted(results["after"]) == [f"report-{number}" for number in range(1, 7)]
+    assert sorted(results["sent"]) == ["odd", "plain"]
+
+def test_malformed_cursor_is_rejected():
+    with pytest.raises(ValueError):
+        decode_file_cursor("not-a-cursor")
@@ -0,0 +1,86 @@
+"""Schema migrations: base64 crypto columns become binary, and interrupted backfills resume where they stopped"""
+
+import base64
+import sqlite3
+
+import pytest
+
+from database import _binary
+from migrations import Backfill, Migration, MigrationRunner
+from models import DATABASE_PATH
+
+@pytest.fixture
+def connection(database):
+    """A connection to the empty schema; the runner's bookkeeping tables are dropped afterwards"""
+    conn = sqlite3.connect(DATABASE_PATH)
+    yield conn
+    conn.execute("DROP TABLE IF EXISTS schema_migrations")
+    conn.execute("DROP TABLE IF EXISTS migration_checkpoints")
+    conn.commit()
+    conn.close()
+
+def test_binary_reads_rows_not_yet_migrated():
+    assert _binary(b"\x00raw") == b"\x00raw"
+    assert _binary(base64.b64encode(b"\x00raw").decode()) == b"\x00raw"
+    # Placeholders of legacy rows were never base64
+    assert _binary("not base64!") == b"not base64!"
+    assert _binary(None) is None
+
+def test_base64_columns_are_rewritten_as_binary(connection):
+    pytest.importorskip("oqs")
+    from migrate_db import MIGRATIONS
+
+    key, nonce = b"\x01wrapped key", b"\x02nonce"
+    connection.executemany(
+        "INSERT INTO shared_metadata (file_id, encrypted_key, nonce, signature, sender_public_key) VALUES (?, ?, ?, ?, ?)",
+        [
+            ("legacy", base64.b64encode(key).decode(), base64.b64encode(nonce).decode(), "not base64!", None),
+            ("current", key, nonce, b"signature", b"public key"),
+        ]
+    )
+    connection.execute("INSERT INTO blobs (id, sender_key) VALUES ('legacy', ?)", (base64.b64encode(key).decode(),))
+    connection.commit()
+
+    runner = MigrationRunner([migration for migration in MIGRATIONS if migration.name == "binary_crypto_columns"])
+    runner.run()
+    runner.close()
+
+    rows = connection.execute(
+        "SELECT file_id, encrypted_key, nonce, signature, sender_public_key, typeof(encrypted_key) "
+        "FROM shared_metadata ORDER BY id"
+    ).fetchall()
+    assert rows == [
+        ("legacy", key, nonce, b"not base64!", None, "blob"),
+        ("current", key, nonce, b"signature", b"public key", "blob"),
+    ]
+    assert connection.execute("SELECT sender_key FROM blobs").fetchone() == (key,)
+
+def test_interrupted_backfill_resumes_from_its_checkpoint(connection):
+    connection.execute("CREATE TABLE counters (value INTEGER NOT NULL)")
+    connection.executemany("INSERT INTO counters (value) VALUES (?)", [(0,)] * 10)
+    connection.commit()
+    batches = []
+    interrupt = [True]
+
+    def increment(cursor, rows):
+        batches.append([rowid for rowid, _ in rows])
+        cursor.executemany("UPDATE counters SET value = value + 1 WHERE rowid = ?", [(rowid,) for rowid, _ in rows])
+        if len(batches) == 2 and interrupt[0]:
+            raise KeyboardInterrupt
+
+    migration = Migration(900, "count_once", [Backfill("increment", "counters", ["value"], "1", increment)])
+    runner = MigrationRunner([migration], batch_size=3)
+    with pytest.raises(KeyboardInterrupt):
+        runner.run()
+    runner.close()
+
+    interrupt[0] = False
+    runner = MigrationRunner([migration], batch_size=3)
+    assert runner.checkpoint(900, "increment") == (3, 3)
+    assert runner.run() == 1
+    assert 900 in runner.applied_versions() and not runner.pending()
+    runner.close()
+    assert batches == [[1, 2, 3], [4, 5, 6], [4, 5, 6], [7, 8, 9], [10]]
+    # The interrupted batch was rolled back, so every row was counted exactly once
+    assert connection.execute("SELECT DISTINCT value FROM counters").fetchall() == [(1,)]
+    connection.execute("DROP TABLE counters")
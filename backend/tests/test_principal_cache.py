@@ -0,0 +1,65 @@
+"""Cached principals are dropped when the user changes, including during a lookup"""
+
+import asyncio
+
+import pytest
+
+from auth import create_access_token
+from database import User, create_user, delete_user, update_user_password
+from db_writer import stop_db_writer
+from models import AsyncSessionLocal
+from principal_cache import PrincipalCache, get_principal_cache
+
+EMAIL = "alice@example.com"
+
+def test_put_after_an_invalidation_is_skipped():
+    cache = PrincipalCache(ttl_seconds=60, max_entries=8)
+    generation = cache.generation()
+    cache.invalidate("someone else")
+    cache.put(EMAIL, "stale", generation)
+    assert cache.get(EMAIL) is None
+    cache.put(EMAIL, "fresh", cache.generation())
+    assert cache.get(EMAIL) == "fresh"
+    assert cache.metrics()["stale_puts"] == 1
+
+async def cached_after(change) -> bool:
+    await create_user(User(username="alice", email=EMAIL, password_hash="x"))
+    get_principal_cache().put(EMAIL, "alice")
+    async with AsyncSessionLocal() as db:
+        await change(db)
+    stop_db_writer()
+    return get_principal_cache().get(EMAIL) is not None
+
+def test_password_change_invalidates(database):
+    assert not asyncio.run(cached_after(lambda db: update_user_password(db, EMAIL, "y")))
+
+def test_deletion_invalidates(database):
+    assert not asyncio.run(cached_after(lambda db: delete_user(db, EMAIL)))
+
+def test_lookup_racing_a_password_change_is_not_cached(database, monkeypatch):
+    pytest.importorskip("oqs")
+    from fastapi.security import HTTPAuthorizationCredentials
+
+    import main
+
+    async def run():
+        await create_user(User(username="alice", email=EMAIL, password_hash="old"))
+        get_principal_cache().clear()
+        find_user_by_email = main.find_user_by_email
+
+        async def find_then_change(db, email):
+            # The password changes after the row was read, before the lookup returns
+            user = await find_user_by_email(db, email)
+            async with AsyncSessionLocal() as other:
+                await update_user_password(other, email, "new")
+            return user
+
+        monkeypatch.setattr(main, "find_user_by_email", find_then_change)
+        credentials = HTTPAuthorizationCredentials(scheme="Bearer", credentials=create_access_token({"sub": EMAIL}))
+        async with AsyncSessionLocal() as db:
+            user = await main.get_current_user(credentials, db)
+        stop_db_writer()
+        return user.password_hash
+
+    assert asyncio.run(run()) == "old"
+    assert get_principal_cache().get(EMAIL) is None
@@ -0,0 +1,98 @@
+"""The session keyring expires and evicts unlocked keys, and a locked session unlocks again with the password"""
+
+import pytest
+
+import session_keyring
+from session_keyring import SessionKeyring, UnlockedKeys
+
+class Clock:
+    """Stands in for time.monotonic"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(session_keyring.time, "monotonic", clock)
+    return clock
+
+def keys(username: str = "alice") -> UnlockedKeys:
+    return UnlockedKeys(username, b"kem-secret", b"sig-secret", b"sig-public")
+
+def test_idle_expiry(clock):
+    keyring = SessionKeyring(idle_seconds=60, max_age_seconds=3600, max_entries=8)
+    unlocked = keys()
+    keyring.put("session", unlocked)
+    clock.now += 59
+    assert keyring.get("session", "alice") is unlocked
+    # Each hit restarts the idle timer
+    clock.now += 59
+    assert keyring.get("session", "alice") is unlocked
+    clock.now += 60
+    assert keyring.get("session", "alice") is None
+    assert keyring.metrics()["idle_expired"] == 1
+    assert unlocked.kem_secret == bytes(len(b"kem-secret"))
+
+def test_absolute_expiry_despite_use(clock):
+    keyring = SessionKeyring(idle_seconds=60, max_age_seconds=100, max_entries=8)
+    keyring.put("session", keys())
+    for _ in range(3):
+        clock.now += 30
+        assert keyring.get("session", "alice") is not None
+    clock.now += 10
+    assert keyring.get("session", "alice") is None
+    assert keyring.metrics()["absolute_expired"] == 1
+
+def test_lru_eviction(clock):
+    keyring = SessionKeyring(idle_seconds=60, max_age_seconds=3600, max_entries=2)
+    keyring.put("first", keys())
+    keyring.put("second", keys())
+    # Using first makes second the least recently used
+    assert keyring.get("first", "alice") is not None
+    keyring.put("third", keys())
+    assert keyring.get("second", "alice") is None
+    assert keyring.get("first", "alice") is not None
+    assert keyring.get("third", "alice") is not None
+    assert keyring.metrics()["evictions"] == 1
+
+def test_other_user_misses(clock):
+    keyring = SessionKeyring(idle_seconds=60, max_age_seconds=3600, max_entries=8)
+    keyring.put("session", keys("alice"))
+    assert keyring.get("session", "bob") is None
+
+def test_locked_session_unlocks_with_password(client):
+    from main import KEYS_LOCKED_DETAIL
+    from session_keyring import get_session_keyring
+    for username in ("alice", "bob"):
+        client.post("/api/register", data={"username": username, "email": f"{username}@example.com", "password": "secret1"})
+    tokens = {
+        username: client.post("/api/login", data={"email": f"{username}@example.com", "password": "secret1"}).json()["access_token"]
+        for username in ("alice", "bob")
+    }
+    alice = {"Authorization": f"Bearer {tokens['alice']}"}
+    bob = {"Authorization": f"Bearer {tokens['bob']}"}
+    upload = {"files": {"file": ("report.txt", b"quarterly numbers")}, "data": {"recipient_username": "bob"}}
+
+    response = client.post("/api/upload", headers=alice, **upload)
+    assert response.status_code == 200
+    file_id = response.json()["file_id"]
+
+    # As after the idle expiry, a restart or a request served by another worker
+    get_session_keyring().clear()
+    response = client.post("/api/download", headers=bob, data={"file_id": file_id})
+    assert (response.status_code, response.json()["detail"]) == (401, KEYS_LOCKED_DETAIL)
+    # Uploads are refused rather than signed with the server's key
+    response = client.post("/api/upload", headers=alice, **upload)
+    assert (response.status_code, response.json()["detail"]) == (401, KEYS_LOCKED_DETAIL)
+
+    response = client.post("/api/download", headers=bob, data={"file_id": file_id, "password": "wrong"})
+    assert response.status_code == 403
+    response = client.post("/api/download", headers=bob, data={"file_id": file_id, "password": "secret1"})
+    assert (response.status_code, response.content) == (200, b"quarterly numbers")
+    # The keys stay unlocked for the rest of the session
+    response = client.post("/api/download", headers=bob, data={"file_id": file_id})
+    assert response.status_code == 200
@@ -0,0 +1,85 @@
+"""Local disk storage driver: sharded layout, atomic commits and ranged reads"""
+
+import asyncio
+import hashlib
+import os
+import time
+
+import pytest
+
+from storage import BlobWriter, LocalStorage, Storage, flat_path, shard_path
+
+@pytest.fixture
+def local(tmp_path):
+    return LocalStorage(root=str(tmp_path))
+
+async def write_blob(storage: LocalStorage, blob_id: str, data: bytes) -> int:
+    writer = await storage.open_writer(blob_id)
+    await writer.write(data)
+    return await writer.commit()
+
+def test_drivers_must_implement_the_interface():
+    with pytest.raises(TypeError):
+        Storage()
+    with pytest.raises(TypeError):
+        BlobWriter()
+
+def test_blobs_are_sharded_by_hashed_id(local, tmp_path):
+    digest = hashlib.sha256(b"blob").hexdigest()
+    assert shard_path(str(tmp_path), "blob") == os.path.join(str(tmp_path), digest[:2], digest[2:4], "blob.enc")
+
+    async def run():
+        assert await write_blob(local, "blob", b"payload") == 7
+        assert os.path.isfile(local.path("blob"))
+        # Blobs written before sharding are still found in the root
+        with open(flat_path(str(tmp_path), "legacy"), "wb") as f:
+            f.write(b"old")
+        assert await local.read("legacy", 0, 3) == b"old"
+        assert sorted(await local.list_blobs(time.time() + 1)) == ["blob", "legacy"]
+        assert await local.list_blobs(time.time() - 3600) == []
+        assert await local.delete("legacy") == 3
+        assert await local.delete("legacy") == 0
+    asyncio.run(run())
+
+def test_writes_are_published_on_commit_only(local, tmp_path):
+    async def run():
+        writer = await local.open_writer("blob")
+        await writer.write(b"first ")
+        await writer.write(b"second")
+        assert await local.size("blob") is None
+        assert await writer.commit() == 12
+        assert await local.size("blob") == 12
+
+        writer = await local.open_writer("aborted")
+        await writer.write(b"x" * 10)
+        await writer.abort()
+        assert await local.size("aborted") is None
+        # No temporary file is left behind
+        assert [name for _, _, names in os.walk(tmp_path) for name in names] == ["blob.enc"]
+    asyncio.run(run())
+
+def test_ranged_reads(local):
+    data = os.urandom(4096)
+
+    async def run():
+        await write_blob(local, "blob", data)
+        assert await local.read("blob", 0, len(data)) == data
+        assert await local.read("blob", 100, 50) == data[100:150]
+        # Reads past the end are cut short
+        assert await local.read("blob", 4090, 100) == data[4090:]
+        with pytest.raises(FileNotFoundError):
+            await local.read("missing", 0, 1)
+    asyncio.run(run())
+
+def test_upload_parts_are_staged_per_session(local):
+    async def run():
+        for number, data in ((1, b"second"), (0, b"first"), (1, b"SECOND")):
+            writer = await local.open_part_writer("upload", number)
+            await writer.write(data)
+            await writer.commit()
+        assert await local.list_parts("upload") == [0, 1]
+        # Re-sending a part replaces it
+        assert await local.read_part("upload", 1) == b"SECOND"
+        await local.delete_parts("upload")
+        assert await local.list_parts("upload") == []
+    asyncio.run(run())
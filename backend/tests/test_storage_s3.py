@@ -0,0 +1,96 @@
+"""S3 storage driver against moto's in-memory S3"""
+
+import asyncio
+import os
+import time
+
+import pytest
+
+pytest.importorskip("boto3")
+moto = pytest.importorskip("moto")
+
+from storage import S3Storage
+
+BUCKET = "quantumdocs-test"
+MB = 1024 * 1024
+
+@pytest.fixture
+def s3(monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with moto.mock_aws():
+        storage = S3Storage(bucket=BUCKET, prefix="blobs/", endpoint_url="", region="us-east-1", part_size=5 * MB)
+        storage.client.create_bucket(Bucket=BUCKET)
+        yield storage
+
+async def write_blob(storage: S3Storage, blob_id: str, data: bytes, piece: int = MB) -> int:
+    writer = await storage.open_writer(blob_id)
+    for offset in range(0, len(data), piece):
+        await writer.write(data[offset:offset + piece])
+    return await writer.commit()
+
+def test_multipart_write_and_ranged_read(s3):
+    data = os.urandom(11 * MB + 123)  # Two full 5MB parts and a remainder
+
+    async def run():
+        writer = await s3.open_writer("big")
+        for offset in range(0, len(data), MB):
+            await writer.write(data[offset:offset + MB])
+        assert writer._upload_id is not None and len(writer._parts) == 2
+        assert await writer.commit() == len(data)
+        assert await s3.size("big") == len(data)
+        assert await s3.read("big", 0, len(data)) == data
+        # Ranged reads within and across part boundaries
+        assert await s3.read("big", 5 * MB - 10, 20) == data[5 * MB - 10:5 * MB + 10]
+        assert await s3.read("big", len(data) - 5, 5) == data[-5:]
+        assert await s3.read("big", 3, 0) == b""
+    asyncio.run(run())
+
+def test_small_blob_is_a_single_put(s3):
+    async def run():
+        writer = await s3.open_writer("small")
+        await writer.write(b"hello")
+        assert await writer.commit() == 5
+        assert writer._upload_id is None
+        assert await s3.read("small", 1, 3) == b"ell"
+    asyncio.run(run())
+
+def test_abort_discards_the_multipart_upload(s3):
+    async def run():
+        writer = await s3.open_writer("aborted")
+        await writer.write(os.urandom(6 * MB))
+        assert writer._upload_id is not None
+        await writer.abort()
+        assert await s3.size("aborted") is None
+        assert not s3.client.list_multipart_uploads(Bucket=BUCKET).get("Uploads")
+    asyncio.run(run())
+
+def test_list_and_delete(s3):
+    async def run():
+        for blob_id in ("a", "b"):
+            await write_blob(s3, blob_id, b"x" * 10)
+        part = await s3.open_part_writer("upload", 0)
+        await part.write(b"part")
+        await part.commit()
+        # Only blobs are listed, not staged parts
+        assert sorted(await s3.list_blobs(time.time() + 60)) == ["a", "b"]
+        assert await s3.list_blobs(0) == []
+        assert await s3.delete("a") == 10
+        assert await s3.size("a") is None
+        assert await s3.delete("a") == 0
+        assert await s3.list_blobs(time.time() + 60) == ["b"]
+    asyncio.run(run())
+
+def test_staged_parts(s3):
+    async def run():
+        for part_number in (2, 0, 1):
+            writer = await s3.open_part_writer("upload", part_number)
+            await writer.write(bytes([part_number]) * 3)
+            await writer.commit()
+        assert await s3.list_parts("upload") == [0, 1, 2]
+        assert await s3.list_parts("other") == []
+        assert await s3.read_part("upload", 1) == b"\x01\x01\x01"
+        await s3.delete_parts("upload")
+        assert await s3.list_parts("upload") == []
+    asyncio.run(run())
@@ -0,0 +1,85 @@
+"""Chunked stream container: StreamEncryptor output decrypts chunk by chunk through StreamIndex"""
+
+import os
+
+import pytest
+
+pytest.importorskip("oqs")
+
+from crypto_utils import (
+    STREAM_TAG_SIZE, STREAM_TRAILER_SIZE, ChunkIntegrityError, StreamDecryptor, StreamEncryptor, StreamIndex, load_server_keys,
+    build_stream_trailer, locate_stream_index, verify_stream_signature
+)
+
+CHUNK_SIZE = 1024
+
+@pytest.fixture(scope="module")
+def keys():
+    return load_server_keys()
+
+def encrypt(data: bytes, keys: dict):
+    """(encryptor, header, sealed chunks, trailer) for data"""
+    encryptor = StreamEncryptor(keys["kem_public"], keys["sig_secret"], chunk_size=CHUNK_SIZE)
+    pieces = [data[offset:offset + CHUNK_SIZE] for offset in range(0, len(data), CHUNK_SIZE)] or [b""]
+    sealed = [encryptor.encrypt_chunk(piece, final=number == len(pieces) - 1) for number, piece in enumerate(pieces)]
+    return encryptor, encryptor.header, sealed, encryptor.trailer()
+
+def parse(header: bytes, sealed: list, trailer: bytes) -> StreamIndex:
+    """Parse a stream file the way downloads do: from its trailer back to the index"""
+    blob = header + b"".join(sealed) + trailer
+    index_offset, index_length = locate_stream_index(blob[-STREAM_TRAILER_SIZE:], len(blob))
+    return StreamIndex(blob[:len(header)], blob[index_offset:index_offset + index_length], blob[-STREAM_TRAILER_SIZE:])
+
+@pytest.mark.parametrize("size", [0, 1, CHUNK_SIZE, 3 * CHUNK_SIZE + 17])
+def test_round_trip(keys, size):
+    data = os.urandom(size)
+    encryptor, header, sealed, trailer = encrypt(data, keys)
+    index = parse(header, sealed, trailer)
+    assert (index.plaintext_size, index.chunk_count) == (size, max(1, -(-size // CHUNK_SIZE)))
+    assert verify_stream_signature(index, encryptor.finalize(), keys["sig_public"])
+
+    decryptor = StreamDecryptor(index, encryptor.ciphertext, keys["kem_secret"])
+    assert b"".join(decryptor.decrypt_chunks(0, sealed)) == data
+    # Chunks decrypt independently, so ranged reads only touch the chunks they need
+    assert decryptor.decrypt_chunk(len(sealed) - 1, sealed[-1]) == data[(len(sealed) - 1) * CHUNK_SIZE:]
+
+def test_only_the_final_chunk_may_be_short(keys):
+    encryptor = StreamEncryptor(keys["kem_public"], keys["sig_secret"], chunk_size=CHUNK_SIZE)
+    with pytest.raises(ValueError):
+        encryptor.encrypt_chunk(b"short")
+    with pytest.raises(ValueError):
+        encryptor.encrypt_chunk(b"x" * (CHUNK_SIZE + 1), final=True)
+
+def test_flipped_chunk_is_rejected(keys):
+    encryptor, header, sealed, trailer = encrypt(os.urandom(3 * CHUNK_SIZE), keys)
+    decryptor = StreamDecryptor(parse(header, sealed, trailer), encryptor.ciphertext, keys["kem_secret"])
+    for position in (0, len(sealed[1]) - 1):  # Ciphertext and tag
+        tampered = bytearray(sealed[1])
+        tampered[position] ^= 1
+        with pytest.raises(ChunkIntegrityError):
+            decryptor.decrypt_chunk(1, bytes(tampered))
+
+def test_reordered_chunks_fail(keys):
+    encryptor, header, sealed, trailer = encrypt(os.urandom(3 * CHUNK_SIZE), keys)
+    swapped = [sealed[1], sealed[0], sealed[2]]
+    decryptor = StreamDecryptor(parse(header, sealed, trailer), encryptor.ciphertext, keys["kem_secret"])
+    with pytest.raises(ChunkIntegrityError):
+        decryptor.decrypt_chunks(0, swapped)
+    # Even with an index rewritten to match, nonces are bound to chunk positions
+    index = parse(header, swapped, build_stream_trailer([(len(chunk), chunk[-STREAM_TAG_SIZE:]) for chunk in swapped], 3 * CHUNK_SIZE))
+    assert not verify_stream_signature(index, encryptor.finalize(), keys["sig_public"])
+    decryptor = StreamDecryptor(index, encryptor.ciphertext, keys["kem_secret"])
+    with pytest.raises(ChunkIntegrityError):
+        decryptor.decrypt_chunk(0, swapped[0])
+
+def test_truncated_stream_fails(keys):
+    encryptor, header, sealed, trailer = encrypt(os.urandom(3 * CHUNK_SIZE), keys)
+    with pytest.raises(ValueError):
+        parse(header, sealed[:2], trailer)
+    # Dropping the final chunk and rewriting the index leaves a last chunk not sealed as final
+    truncated = sealed[:2]
+    index = parse(header, truncated, build_stream_trailer([(len(chunk), chunk[-STREAM_TAG_SIZE:]) for chunk in truncated], 2 * CHUNK_SIZE))
+    assert not verify_stream_signature(index, encryptor.finalize(), keys["sig_public"])
+    decryptor = StreamDecryptor(index, encryptor.ciphertext, keys["kem_secret"])
+    with pytest.raises(ChunkIntegrityError):
+        decryptor.decrypt_chunk(1, truncated[1])
@@ -0,0 +1,87 @@
+"""Uploads stream through the chunked encryptor into storage, whole or in resumable sessions"""
+
+import os
+from datetime import timedelta
+
+import main
+from storage import SESSIONS_DIR, get_storage
+
+def upload(client, headers, data: bytes, filename: str = "report.txt"):
+    return client.post("/api/upload", headers=headers, files={"file": (filename, data)},
+                       data={"recipient_username": "bob"})
+
+def test_multi_chunk_upload_round_trip(client, auth_headers):
+    data = os.urandom(3 * main.STREAM_CHUNK_SIZE + 5)
+    response = upload(client, auth_headers["alice"], data)
+    assert response.status_code == 200
+    response = client.post("/api/download", headers=auth_headers["bob"], data={"file_id": response.json()["file_id"]})
+    assert (response.status_code, response.content) == (200, data)
+
+def test_upload_over_the_size_limit_is_rejected(client, auth_headers, monkeypatch):
+    monkeypatch.setattr(main, "MAX_FILE_SIZE", 2 * main.STREAM_CHUNK_SIZE)
+    response = upload(client, auth_headers["alice"], os.urandom(2 * main.STREAM_CHUNK_SIZE + 1))
+    assert (response.status_code, response.json()["detail"]) == (400, "File too large")
+    # Nothing was published for the aborted upload
+    response = client.get("/api/files/sent", headers=auth_headers["alice"])
+    assert response.json()["files"] == []
+
+def create_session(client, headers, size: int) -> dict:
+    response = client.post("/api/uploads", headers=headers,
+                           data={"filename": "report.txt", "recipient_username": "bob", "file_size": str(size)})
+    assert response.status_code == 200
+    return response.json()
+
+def test_session_parts_out_of_order_and_resent(client, auth_headers, monkeypatch):
+    monkeypatch.setattr(main, "UPLOAD_PART_SIZE", main.STREAM_CHUNK_SIZE)
+    alice = auth_headers["alice"]
+    data = os.urandom(3 * main.STREAM_CHUNK_SIZE + 10)
+    session = create_session(client, alice, len(data))
+    upload_id, part_size = session["upload_id"], session["part_size"]
+    assert session["part_count"] == 4
+
+    def put(number: int, body: bytes):
+        return client.put(f"/api/uploads/{upload_id}/parts/{number}", headers=alice, content=body)
+
+    assert put(4, b"x").status_code == 400
+    for number in (3, 1, 0):
+        assert put(number, data[number * part_size:(number + 1) * part_size]).status_code == 200
+    response = client.post(f"/api/uploads/{upload_id}/complete", headers=alice)
+    assert (response.status_code, response.json()["detail"]) == (400, "Missing parts: [2]")
+
+    # A part sent twice keeps its last copy
+    assert put(2, os.urandom(part_size)).status_code == 200
+    response = put(2, data[2 * part_size:3 * part_size])
+    assert response.json()["received_parts"] == [0, 1, 2, 3]
+    assert client.post(f"/api/uploads/{upload_id}/complete", headers=alice).status_code == 200
+
+    response = client.post("/api/download", headers=auth_headers["bob"], data={"file_id": upload_id})
+    assert (response.status_code, response.content) == (200, data)
+    assert client.get(f"/api/uploads/{upload_id}", headers=alice).status_code == 404
+
+def test_expired_sessions_are_dropped(client, auth_headers, monkeypatch):
+    alice = auth_headers["alice"]
+    abandoned = create_session(client, alice, 10)["upload_id"]
+    assert client.put(f"/api/uploads/{abandoned}/parts/0", headers=alice, content=b"0123456789").status_code == 200
+    # Creating a session purges the ones older than the TTL, along with their parts
+    monkeypatch.setattr(main, "UPLOAD_SESSION_TTL", timedelta(seconds=-1))
+    create_session(client, alice, 10)
+    assert client.get(f"/api/uploads/{abandoned}", headers=alice).status_code == 404
+    assert os.listdir(os.path.join(get_storage().root, SESSIONS_DIR)) == []
+
+def test_every_recipient_decrypts_the_one_stored_blob(client, auth_headers):
+    client.post("/api/register", data={"username": "carol", "email": "carol@example.com", "password": "secret1"})
+    token = client.post("/api/login", data={"email": "carol@example.com", "password": "secret1"}).json()["access_token"]
+    headers = {"bob": auth_headers["bob"], "carol": {"Authorization": f"Bearer {token}"}}
+    data = os.urandom(2 * main.STREAM_CHUNK_SIZE + 1)
+    response = client.post("/api/upload", headers=auth_headers["alice"], files={"file": ("report.pdf", data)},
+                           data={"recipient_username": ["bob", "carol"]})
+    file_ids = response.json()["file_ids"]
+    assert sorted(file_ids) == ["bob", "carol"] and file_ids["bob"] != file_ids["carol"]
+    # Encrypted once: a single blob, with the data key wrapped per recipient
+    assert len([name for _, _, names in os.walk(get_storage().root) for name in names]) == 1
+    for username, file_id in file_ids.items():
+        response = client.post("/api/download", headers=headers[username], data={"file_id": file_id})
+        assert (response.status_code, response.content) == (200, data)
+    # One recipient's copy does not open with the other's row
+    response = client.post("/api/download", headers=headers["carol"], data={"file_id": file_ids["bob"]})
+    assert response.status_code == 403
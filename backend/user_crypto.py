@@ -1,9 +1,10 @@
-import oqs
 import base64
 import os
 from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 from cryptography.hazmat.primitives import hashes
+from keypair_pool import get_keypair_pools
+from oqs_contexts import decapsulator, encapsulator, kem_details
 from models import User
 from sqlalchemy.orm import Session
 
@@ -43,49 +44,58 @@ def decrypt_user_keys(encrypted_keys_b64: str, salt_b64: str, nonce_b64: str, pa
     aesgcm = AESGCM(key)
     return aesgcm.decrypt(nonce, encrypted_keys, None)
 
-def generate_user_keys(password: str) -> dict:
-    """Generate KEM and signature keys for a new user"""
-    # Generate KEM keys
-    kem = oqs.KeyEncapsulation(KEM_ALGO)
-    kem_pub = kem.generate_keypair()
-    kem_sec = kem.export_secret_key()
-    
-    # Generate signature keys
-    sig = oqs.Signature(SIG_ALGO)
-    sig_pub = sig.generate_keypair()
-    sig_sec = sig.export_secret_key()
-    
-    # Encrypt private keys with user's password
-    kem_encrypted, kem_salt, kem_nonce = encrypt_user_keys(kem_sec, password)
-    sig_encrypted, sig_salt, sig_nonce = encrypt_user_keys(sig_sec, password)
+def generate_keypairs() -> tuple:
+    """Take fresh KEM and signature keypairs from the pools: (kem_pub, kem_sec, sig_pub, sig_sec)"""
+    pools = get_keypair_pools()
+    kem_pub, kem_sec = pools[KEM_ALGO].take()
+    sig_pub, sig_sec = pools[SIG_ALGO].take()
+    return kem_pub, kem_sec, sig_pub, sig_sec
+
+def wrap_user_keys(kem_pub: bytes, kem_sec: bytes, sig_pub: bytes, sig_sec: bytes, password: str) -> dict:
+    """Encrypt both private keys under a single key derived from the user's password"""
+    key, salt = derive_key_from_password(password)
+    aesgcm = AESGCM(key)
+    kem_nonce = os.urandom(12)
+    sig_nonce = os.urandom(12)
+    salt_b64 = base64.b64encode(salt).decode()
     
     return {
         "kem_public_key": base64.b64encode(kem_pub).decode(),
-        "kem_secret_key": kem_encrypted,
-        "kem_salt": kem_salt,
-        "kem_nonce": kem_nonce,
+        "kem_secret_key": base64.b64encode(aesgcm.encrypt(kem_nonce, kem_sec, None)).decode(),
+        "kem_salt": salt_b64,
+        "kem_nonce": base64.b64encode(kem_nonce).decode(),
         "sig_public_key": base64.b64encode(sig_pub).decode(),
-        "sig_secret_key": sig_encrypted,
-        "sig_salt": sig_salt,
-        "sig_nonce": sig_nonce
+        "sig_secret_key": base64.b64encode(aesgcm.encrypt(sig_nonce, sig_sec, None)).decode(),
+        "sig_salt": salt_b64,
+        "sig_nonce": base64.b64encode(sig_nonce).decode()
     }
 
+def create_user_keys(password: str) -> tuple:
+    """Generate and wrap keys for a user; returns (stored key fields, kem_sec, sig_sec)"""
+    kem_pub, kem_sec, sig_pub, sig_sec = generate_keypairs()
+    return wrap_user_keys(kem_pub, kem_sec, sig_pub, sig_sec, password), kem_sec, sig_sec
+
+def generate_user_keys(password: str) -> dict:
+    """Generate KEM and signature keys for a new user"""
+    return create_user_keys(password)[0]
+
 def get_user_decryption_keys(user: User, password: str) -> tuple:
     """Get user's decryption keys for file operations"""
+    # Both keys share one salt (and so one derivation) unless they were wrapped separately
+    kem_key, _ = derive_key_from_password(password, base64.b64decode(user.kem_salt))
+    if user.sig_salt == user.kem_salt:
+        sig_key = kem_key
+    else:
+        sig_key, _ = derive_key_from_password(password, base64.b64decode(user.sig_salt))
+    
     # Decrypt KEM secret key
-    kem_secret = decrypt_user_keys(
-        user.kem_secret_key, 
-        user.kem_salt, 
-        user.kem_nonce, 
-        password
+    kem_secret = AESGCM(kem_key).decrypt(
+        base64.b64decode(user.kem_nonce), base64.b64decode(user.kem_secret_key), None
     )
     
     # Decrypt signature secret key
-    sig_secret = decrypt_user_keys(
-        user.sig_secret_key, 
-        user.sig_salt, 
-        user.sig_nonce, 
-        password
+    sig_secret = AESGCM(sig_key).decrypt(
+        base64.b64decode(user.sig_nonce), base64.b64decode(user.sig_secret_key), None
     )
     
     return kem_secret, sig_secret
@@ -105,9 +115,8 @@ def encrypt_metadata_for_user(metadata: dict, recipient_public_key: str) -> str:
     encrypted_metadata = aesgcm.encrypt(nonce, metadata_bytes, None)
     
     # Encrypt AES key with recipient's public key using KEM
-    kem = oqs.KeyEncapsulation(KEM_ALGO)
     recipient_pub = base64.b64decode(recipient_public_key)
-    encrypted_aes_key, _ = kem.encap_secret(recipient_pub)
+    encrypted_aes_key, _ = encapsulator(KEM_ALGO).encap_secret(recipient_pub)
     
     # Combine encrypted AES key and encrypted metadata
     combined = encrypted_aes_key + nonce + encrypted_metadata
@@ -122,9 +131,7 @@ def decrypt_metadata_for_user(encrypted_metadata: str, user_kem_secret: bytes) -
         print(f"🔍 Debug: Decoded combined length: {len(combined)}")
         
         # Get KEM details to determine ciphertext length
-        kem = oqs.KeyEncapsulation(KEM_ALGO)
-        kem_details = kem.details  # Access as property, not function
-        encrypted_aes_key_size = kem_details["length_ciphertext"]
+        encrypted_aes_key_size = kem_details(KEM_ALGO)["length_ciphertext"]
         print(f"🔍 Debug: KEM ciphertext length: {encrypted_aes_key_size}")
         
         # Extract components
@@ -135,8 +142,7 @@ def decrypt_metadata_for_user(encrypted_metadata: str, user_kem_secret: bytes) -
         print(f"🔍 Debug: Extracted - AES key: {len(encrypted_aes_key)}, nonce: {len(nonce)}, metadata+tag: {len(encrypted_metadata_with_tag)}")
         
         # Decapsulate AES key
-        kem_with_secret = oqs.KeyEncapsulation(KEM_ALGO, secret_key=user_kem_secret)
-        aes_key = kem_with_secret.decap_secret(encrypted_aes_key)
+        aes_key = decapsulator(KEM_ALGO, user_kem_secret).decap_secret(encrypted_aes_key)
         print(f"🔍 Debug: Decapsulated AES key length: {len(aes_key)}")
         
         # Decrypt metadata (encrypted_metadata_with_tag includes the 16-byte authentication tag)
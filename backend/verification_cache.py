@@ -0,0 +1,42 @@
+import hashlib
+import hmac
+import os
+import threading
+from typing import Optional
+
+from crypto_utils import StreamIndex
+
+# === Verification Cache ===
+# A download's one public-key operation besides unwrapping the data key is the Dilithium check
+# of the stream signature. Once it passes, the file's row remembers a digest binding the file
+# to the blob's signed index (header, every chunk tag and trailer), the signature and the
+# sender key, and later downloads that produce the same digest skip the check. A replaced or
+# modified blob has a different index, so it is verified again; chunks are still checked
+# against the index as they are decrypted.
+VERIFICATION_CACHE = os.getenv("VERIFICATION_CACHE", "1") == "1"  # 0 = verify on every download
+
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0}
+
+def verification_digest(file_id: str, index: StreamIndex, signature: bytes, sender_public_key: bytes) -> bytes:
+    return hashlib.sha256(
+        b"quantumdocs-verified:" + file_id.encode() + b"\0" + index.signed_digest +
+        hashlib.sha256(signature).digest() + hashlib.sha256(sender_public_key).digest()
+    ).digest()
+
+def is_verified(verified_digest: Optional[bytes], digest: bytes) -> bool:
+    """Whether the stored digest shows this exact blob and signature already verified"""
+    hit = VERIFICATION_CACHE and verified_digest is not None and hmac.compare_digest(verified_digest, digest)
+    with _stats_lock:
+        _stats["hits" if hit else "misses"] += 1
+    return hit
+
+def verification_cache_metrics() -> dict:
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats["hits"] + stats["misses"]
+    return {
+        "enabled": VERIFICATION_CACHE,
+        "hit_ratio": stats["hits"] / lookups if lookups else 0.0,
+        **stats
+    }
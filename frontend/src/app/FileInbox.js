@@ -1,63 +1,71 @@
 'use client';
 
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { useAuth } from './AuthContext';
 import axios from 'axios';
 import toast from 'react-hot-toast';
+import { withUnlockedKeys, errorDetail } from './sessionKeys';
 
 export default function FileInbox() {
   const [receivedFiles, setReceivedFiles] = useState([]);
-  const [filteredFiles, setFilteredFiles] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [isLoading, setIsLoading] = useState(true);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
   const [downloadingFile, setDownloadingFile] = useState(null);
   const [searchTerm, setSearchTerm] = useState('');
+  const [counterpartTerm, setCounterpartTerm] = useState('');
+  const latestRequest = useRef(0);
   const { user } = useAuth();
 
   useEffect(() => {
-    loadReceivedFiles();
-  }, []);
+    // Search runs on the server; wait for typing to pause before asking again
+    const timer = setTimeout(() => loadReceivedFiles(), searchTerm || counterpartTerm ? 300 : 0);
+    return () => clearTimeout(timer);
+  }, [searchTerm, counterpartTerm]);
 
-  useEffect(() => {
-    // Filter files based on search term
-    if (searchTerm.trim() === '') {
-      setFilteredFiles(receivedFiles);
-    } else {
-      const filtered = receivedFiles.filter(file => 
-        file.filename.toLowerCase().includes(searchTerm.toLowerCase()) ||
-        file.sender_username.toLowerCase().includes(searchTerm.toLowerCase()) ||
-        file.file_id.toLowerCase().includes(searchTerm.toLowerCase())
-      );
-      setFilteredFiles(filtered);
+  // Loads the first page, or the page after cursor; the listing returns 50 files at a time
+  const loadReceivedFiles = async (cursor = null) => {
+    const requestId = ++latestRequest.current;
+    const params = {};
+    if (searchTerm.trim()) params.filename_prefix = searchTerm.trim();
+    if (counterpartTerm.trim()) params.counterpart = counterpartTerm.trim();
+    if (cursor) {
+      params.cursor = cursor;
+      setIsLoadingMore(true);
     }
-  }, [searchTerm, receivedFiles]);
-
-  const loadReceivedFiles = async () => {
     try {
-      const response = await axios.get('http://localhost:8000/api/files/received');
-      setReceivedFiles(response.data.files);
-      setFilteredFiles(response.data.files);
+      const response = await axios.get('http://localhost:8000/api/files/received', { params });
+      // Ignore answers to searches that were already replaced
+      if (requestId !== latestRequest.current) return;
+      setReceivedFiles(previous => cursor ? [...previous, ...response.data.files] : response.data.files);
+      setNextCursor(response.data.next_cursor);
     } catch (error) {
-      toast.error('Failed to load received files');
+      if (requestId === latestRequest.current) toast.error('Failed to load received files');
     } finally {
       setIsLoading(false);
+      setIsLoadingMore(false);
     }
   };
 
   const handleDownload = async (fileId, filename) => {
     setDownloadingFile(fileId);
     try {
-      const formData = new FormData();
-      formData.append('file_id', fileId);
+      // The password only goes along once the server asked for it to unlock the keys again
+      const response = await withUnlockedKeys((password) => {
+        const formData = new FormData();
+        formData.append('file_id', fileId);
+        if (password) formData.append('password', password);
 
-      const response = await axios.post('http://localhost:8000/api/download', 
-        formData,
-        { 
-          responseType: 'blob',
-          headers: {
-            'Content-Type': 'multipart/form-data',
+        return axios.post('http://localhost:8000/api/download', 
+          formData,
+          { 
+            responseType: 'blob',
+            headers: {
+              'Content-Type': 'multipart/form-data',
+            }
           }
-        }
-      );
+        );
+      });
 
       // Create download link
       const url = window.URL.createObjectURL(new Blob([response.data]));
@@ -71,7 +79,7 @@ export default function FileInbox() {
 
       toast.success('File downloaded and decrypted successfully!');
     } catch (error) {
-      toast.error('Failed to download file');
+      toast.error((await errorDetail(error)) || 'Failed to download file');
     } finally {
       setDownloadingFile(null);
     }
@@ -91,11 +99,11 @@ export default function FileInbox() {
       <h2 className="text-2xl font-semibold mb-6 text-white">Received Files</h2>
       
       {/* Search Bar */}
-      <div className="mb-6">
+      <div className="mb-6 grid grid-cols-2 gap-4">
         <div className="relative">
           <input
             type="text"
-            placeholder="Search files, senders, or file IDs..."
+            placeholder="Search by file name..."
             value={searchTerm}
             onChange={(e) => setSearchTerm(e.target.value)}
             className="w-full px-4 py-3 border border-[#eadaff] rounded-lg shadow-sm focus:outline-none focus:ring-[#eadaff] focus:border-[#eadaff] bg-[#3b275f]/20 backdrop-blur-sm text-white placeholder-[#eadaff] text-sm"
@@ -106,15 +114,22 @@ export default function FileInbox() {
             </svg>
           </div>
         </div>
+        <input
+          type="text"
+          placeholder="Sender username..."
+          value={counterpartTerm}
+          onChange={(e) => setCounterpartTerm(e.target.value)}
+          className="w-full px-4 py-3 border border-[#eadaff] rounded-lg shadow-sm focus:outline-none focus:ring-[#eadaff] focus:border-[#eadaff] bg-[#3b275f]/20 backdrop-blur-sm text-white placeholder-[#eadaff] text-sm"
+        />
       </div>
       
-      {filteredFiles.length === 0 ? (
+      {receivedFiles.length === 0 ? (
         <div className="text-center py-8 text-[#eadaff] text-base">
-          <p>{searchTerm ? 'No files found matching your search.' : 'No files received yet.'}</p>
+          <p>{searchTerm || counterpartTerm ? 'No files found matching your search.' : 'No files received yet.'}</p>
         </div>
       ) : (
         <div className="grid grid-cols-2 gap-4">
-          {filteredFiles.map((file) => (
+          {receivedFiles.map((file) => (
             <div
               key={file.file_id}
               className="bg-[#3b275f]/20 backdrop-blur-sm rounded-lg p-4 border border-[#eadaff]/30 hover:bg-[#3b275f]/30 transition-all duration-200"
@@ -122,7 +137,7 @@ export default function FileInbox() {
               <h3 className="font-semibold text-white text-base mb-2 break-words">{file.filename}</h3>
               <div className="space-y-1 mb-3">
                 <p className="text-sm text-[#eadaff] break-words">
-                  <span className="font-medium">From:</span> {file.sender_username}
+                  <span className="font-medium">From:</span> {file.counterpart_username}
                 </p>
                 <p className="text-sm text-[#eadaff] break-words">
                   <span className="font-medium">ID:</span> {file.file_id}
@@ -140,13 +155,22 @@ export default function FileInbox() {
         </div>
       )}
       
-      <div className="mt-6">
+      <div className="mt-6 flex gap-4">
         <button
-          onClick={loadReceivedFiles}
+          onClick={() => loadReceivedFiles()}
           className="px-4 py-2 bg-[#3b275f] text-white rounded-lg hover:bg-[#eadaff] hover:text-black focus:outline-none focus:ring-2 focus:ring-[#eadaff] transition-all duration-200 shadow-lg text-sm font-medium"
         >
           Refresh
         </button>
+        {nextCursor && (
+          <button
+            onClick={() => loadReceivedFiles(nextCursor)}
+            disabled={isLoadingMore}
+            className="px-4 py-2 bg-[#3b275f] text-white rounded-lg hover:bg-[#eadaff] hover:text-black focus:outline-none focus:ring-2 focus:ring-[#eadaff] transition-all duration-200 shadow-lg text-sm font-medium disabled:opacity-50"
+          >
+            {isLoadingMore ? 'Loading...' : 'Load more'}
+          </button>
+        )}
       </div>
     </div>
   );
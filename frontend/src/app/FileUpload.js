@@ -4,6 +4,7 @@ import { useState, useEffect } from 'react';
 import { useAuth } from './AuthContext';
 import axios from 'axios';
 import toast from 'react-hot-toast';
+import { withUnlockedKeys } from './sessionKeys';
 
 export default function FileUpload() {
   const [selectedFile, setSelectedFile] = useState(null);
@@ -49,14 +50,18 @@ export default function FileUpload() {
     setIsLoading(true);
 
     try {
-      const formData = new FormData();
-      formData.append('file', selectedFile);
-      formData.append('recipient_username', recipient);
-
-      const response = await axios.post('http://localhost:8000/api/upload', formData, {
-        headers: {
-          'Content-Type': 'multipart/form-data',
-        },
+      // Uploads are signed with the sender's own key, which may need the password to unlock again
+      const response = await withUnlockedKeys((password) => {
+        const formData = new FormData();
+        formData.append('file', selectedFile);
+        formData.append('recipient_username', recipient);
+        if (password) formData.append('password', password);
+
+        return axios.post('http://localhost:8000/api/upload', formData, {
+          headers: {
+            'Content-Type': 'multipart/form-data',
+          },
+        });
       });
 
       toast.success('File uploaded and encrypted successfully!');
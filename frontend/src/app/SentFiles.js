@@ -1,44 +1,47 @@
 'use client';
 
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { useAuth } from './AuthContext';
 import axios from 'axios';
 import toast from 'react-hot-toast';
 
 export default function SentFiles() {
   const [sentFiles, setSentFiles] = useState([]);
-  const [filteredFiles, setFilteredFiles] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
   const [isLoading, setIsLoading] = useState(true);
+  const [isLoadingMore, setIsLoadingMore] = useState(false);
   const [searchTerm, setSearchTerm] = useState('');
+  const [counterpartTerm, setCounterpartTerm] = useState('');
+  const latestRequest = useRef(0);
   const { user } = useAuth();
 
   useEffect(() => {
-    loadSentFiles();
-  }, []);
+    // Search runs on the server; wait for typing to pause before asking again
+    const timer = setTimeout(() => loadSentFiles(), searchTerm || counterpartTerm ? 300 : 0);
+    return () => clearTimeout(timer);
+  }, [searchTerm, counterpartTerm]);
 
-  useEffect(() => {
-    // Filter files based on search term
-    if (searchTerm.trim() === '') {
-      setFilteredFiles(sentFiles);
-    } else {
-      const filtered = sentFiles.filter(file => 
-        file.filename.toLowerCase().includes(searchTerm.toLowerCase()) ||
-        file.recipient_username.toLowerCase().includes(searchTerm.toLowerCase()) ||
-        file.file_id.toLowerCase().includes(searchTerm.toLowerCase())
-      );
-      setFilteredFiles(filtered);
+  // Loads the first page, or the page after cursor; the listing returns 50 files at a time
+  const loadSentFiles = async (cursor = null) => {
+    const requestId = ++latestRequest.current;
+    const params = {};
+    if (searchTerm.trim()) params.filename_prefix = searchTerm.trim();
+    if (counterpartTerm.trim()) params.counterpart = counterpartTerm.trim();
+    if (cursor) {
+      params.cursor = cursor;
+      setIsLoadingMore(true);
     }
-  }, [searchTerm, sentFiles]);
-
-  const loadSentFiles = async () => {
     try {
-      const response = await axios.get('http://localhost:8000/api/files/sent');
-      setSentFiles(response.data.files);
-      setFilteredFiles(response.data.files);
+      const response = await axios.get('http://localhost:8000/api/files/sent', { params });
+      // Ignore answers to searches that were already replaced
+      if (requestId !== latestRequest.current) return;
+      setSentFiles(previous => cursor ? [...previous, ...response.data.files] : response.data.files);
+      setNextCursor(response.data.next_cursor);
     } catch (error) {
-      toast.error('Failed to load sent files');
+      if (requestId === latestRequest.current) toast.error('Failed to load sent files');
     } finally {
       setIsLoading(false);
+      setIsLoadingMore(false);
     }
   };
 
@@ -56,11 +59,11 @@ export default function SentFiles() {
       <h2 className="text-2xl font-semibold mb-6 text-white">Sent Files</h2>
       
       {/* Search Bar */}
-      <div className="mb-6">
+      <div className="mb-6 grid grid-cols-2 gap-4">
         <div className="relative">
           <input
             type="text"
-            placeholder="Search files, recipients, or file IDs..."
+            placeholder="Search by file name..."
             value={searchTerm}
             onChange={(e) => setSearchTerm(e.target.value)}
             className="w-full px-4 py-3 border border-[#eadaff] rounded-lg shadow-sm focus:outline-none focus:ring-[#eadaff] focus:border-[#eadaff] bg-[#3b275f]/20 backdrop-blur-sm text-white placeholder-[#eadaff] text-sm"
@@ -71,15 +74,22 @@ export default function SentFiles() {
             </svg>
           </div>
         </div>
+        <input
+          type="text"
+          placeholder="Recipient username..."
+          value={counterpartTerm}
+          onChange={(e) => setCounterpartTerm(e.target.value)}
+          className="w-full px-4 py-3 border border-[#eadaff] rounded-lg shadow-sm focus:outline-none focus:ring-[#eadaff] focus:border-[#eadaff] bg-[#3b275f]/20 backdrop-blur-sm text-white placeholder-[#eadaff] text-sm"
+        />
       </div>
       
-      {filteredFiles.length === 0 ? (
+      {sentFiles.length === 0 ? (
         <div className="text-center py-8 text-[#eadaff] text-base">
-          <p>{searchTerm ? 'No files found matching your search.' : 'No files sent yet.'}</p>
+          <p>{searchTerm || counterpartTerm ? 'No files found matching your search.' : 'No files sent yet.'}</p>
         </div>
       ) : (
         <div className="grid grid-cols-2 gap-4">
-          {filteredFiles.map((file) => (
+          {sentFiles.map((file) => (
             <div
               key={file.file_id}
               className="bg-[#3b275f]/20 backdrop-blur-sm rounded-lg p-4 border border-[#eadaff]/30 hover:bg-[#3b275f]/30 transition-all duration-200"
@@ -87,7 +97,7 @@ export default function SentFiles() {
               <h3 className="font-semibold text-white text-base mb-2 break-words">{file.filename}</h3>
               <div className="space-y-1">
                 <p className="text-sm text-[#eadaff] break-words">
-                  <span className="font-medium">To:</span> {file.recipient_username}
+                  <span className="font-medium">To:</span> {file.counterpart_username}
                 </p>
                 <p className="text-sm text-[#eadaff] break-words">
                   <span className="font-medium">ID:</span> {file.file_id}
@@ -98,13 +108,22 @@ export default function SentFiles() {
         </div>
       )}
       
-      <div className="mt-6">
+      <div className="mt-6 flex gap-4">
         <button
-          onClick={loadSentFiles}
+          onClick={() => loadSentFiles()}
           className="px-4 py-2 bg-[#3b275f] text-white rounded-lg hover:bg-[#eadaff] hover:text-black focus:outline-none focus:ring-2 focus:ring-[#eadaff] transition-all duration-200 shadow-lg text-sm font-medium"
         >
           Refresh
         </button>
+        {nextCursor && (
+          <button
+            onClick={() => loadSentFiles(nextCursor)}
+            disabled={isLoadingMore}
+            className="px-4 py-2 bg-[#3b275f] text-white rounded-lg hover:bg-[#eadaff] hover:text-black focus:outline-none focus:ring-2 focus:ring-[#eadaff] transition-all duration-200 shadow-lg text-sm font-medium disabled:opacity-50"
+          >
+            {isLoadingMore ? 'Loading...' : 'Load more'}
+          </button>
+        )}
       </div>
     </div>
   );
@@ -0,0 +1,36 @@
+import toast from 'react-hot-toast';
+
+// Detail the backend answers with when this worker no longer holds the session's unlocked keys
+export const KEYS_LOCKED_DETAIL = 'Session keys locked, password required';
+
+// Error detail of an axios error; blob responses (downloads) carry their JSON body as a Blob
+export async function errorDetail(error) {
+  const data = error.response?.data;
+  if (data instanceof Blob) {
+    try {
+      return JSON.parse(await data.text()).detail;
+    } catch {
+      return undefined;
+    }
+  }
+  return data?.detail;
+}
+
+// Sends the request built by send(password), asking for the password and retrying while the
+// keys are locked; a wrong password is answered with 403 and asked for again
+export async function withUnlockedKeys(send) {
+  let password = null;
+  for (;;) {
+    try {
+      return await send(password);
+    } catch (error) {
+      const status = error.response?.status;
+      const detail = await errorDetail(error);
+      const locked = status === 401 && detail === KEYS_LOCKED_DETAIL;
+      if (!locked && !(status === 403 && password)) throw error;
+      if (!locked) toast.error(detail || 'Incorrect password');
+      password = prompt("Your session's keys have expired. Enter your password to unlock them:");
+      if (!password) throw error;
+    }
+  }
+}
@@ -21,6 +21,10 @@ echo "📦 Installing backend dependencies..."
 cd backend
 pip install -r requirements.txt
 
+# Apply database migrations
+echo "🗄️ Running database migration..."
+python migrate_db.py
+
 # Install frontend dependencies
 echo "📦 Installing frontend dependencies..."
 cd ../frontend